@@ -0,0 +1,44 @@
+"""add order daily rollups
+
+Revision ID: 379f9e5ce5c4
+Revises: 3d416bb917d8
+Create Date: 2026-10-17 10:12:41.218304
+
+"""
+from typing import Sequence, Union
+
+import sqlalchemy as sa
+
+from alembic import op
+
+# revision identifiers, used by Alembic.
+revision: str = '379f9e5ce5c4'
+down_revision: Union[str, None] = '3d416bb917d8'
+branch_labels: Union[str, Sequence[str], None] = None
+depends_on: Union[str, Sequence[str], None] = None
+
+
+def upgrade() -> None:
+    op.create_table('order_daily_rollups',
+    sa.Column('day', sa.Date(), nullable=False),
+    sa.Column('customer_id', sa.Integer(), nullable=False),
+    sa.Column('item', sa.String(), nullable=False),
+    sa.Column('order_count', sa.Integer(), nullable=False),
+    sa.Column('total_amount', sa.Float(), nullable=False),
+    sa.Column('min_amount', sa.Float(), nullable=False),
+    sa.Column('max_amount', sa.Float(), nullable=False),
+    sa.PrimaryKeyConstraint('day', 'customer_id', 'item')
+    )
+    # Backfill from existing orders
+    op.execute(
+        "INSERT INTO order_daily_rollups "
+        "(day, customer_id, item, order_count, total_amount, min_amount, max_amount) "
+        "SELECT date(time), customer_id, item, count(id), sum(amount), min(amount), max(amount) "
+        "FROM orders "
+        "WHERE customer_id IS NOT NULL AND item IS NOT NULL AND time IS NOT NULL AND amount IS NOT NULL "
+        "GROUP BY date(time), customer_id, item"
+    )
+
+
+def downgrade() -> None:
+    op.drop_table('order_daily_rollups')
@@ -0,0 +1,40 @@
+"""soft delete customers
+
+Adds customers.deleted_at. Customer codes become unique among live customers
+only, and a partial index holds the customers waiting for the purger.
+
+Revision ID: 4c1b3056f892
+Revises: 709a9f995f3e
+Create Date: 2026-10-17 15:02:11.406518
+
+"""
+from typing import Sequence, Union
+
+import sqlalchemy as sa
+
+from alembic import op
+
+# revision identifiers, used by Alembic.
+revision: str = '4c1b3056f892'
+down_revision: Union[str, None] = '709a9f995f3e'
+branch_labels: Union[str, Sequence[str], None] = None
+depends_on: Union[str, Sequence[str], None] = None
+
+LIVE = sa.text('deleted_at IS NULL')
+DELETED = sa.text('deleted_at IS NOT NULL')
+
+
+def upgrade() -> None:
+    op.add_column('customers', sa.Column('deleted_at', sa.DateTime(), nullable=True))
+    op.drop_index('ix_customers_code', table_name='customers')
+    op.create_index('ix_customers_code', 'customers', ['code'], unique=True,
+                    postgresql_where=LIVE, sqlite_where=LIVE)
+    op.create_index('ix_customers_deleted', 'customers', ['deleted_at', 'id'], unique=False,
+                    postgresql_where=DELETED, sqlite_where=DELETED)
+
+
+def downgrade() -> None:
+    op.drop_index('ix_customers_deleted', table_name='customers')
+    op.drop_index('ix_customers_code', table_name='customers')
+    op.create_index('ix_customers_code', 'customers', ['code'], unique=True)
+    op.drop_column('customers', 'deleted_at')
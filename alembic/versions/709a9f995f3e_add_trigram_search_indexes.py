@@ -0,0 +1,42 @@
+"""add trigram search indexes
+
+GIN trigram indexes for the customer and order search endpoints. They serve
+prefix and substring ILIKE as well as the % similarity operator. PostgreSQL
+only; creating the pg_trgm extension needs a role allowed to do so. Other
+databases use the in-process index in app/utils/search.py.
+
+Revision ID: 709a9f995f3e
+Revises: d95c5bbb48e0
+Create Date: 2026-10-17 13:48:30.118254
+
+"""
+from typing import Sequence, Union
+
+from alembic import op
+
+# revision identifiers, used by Alembic.
+revision: str = '709a9f995f3e'
+down_revision: Union[str, None] = 'd95c5bbb48e0'
+branch_labels: Union[str, Sequence[str], None] = None
+depends_on: Union[str, Sequence[str], None] = None
+
+TRIGRAM_INDEXES = (
+    ('ix_customers_name_trgm', 'customers', 'name'),
+    ('ix_customers_code_trgm', 'customers', 'code'),
+    ('ix_orders_item_trgm', 'orders', 'item'),
+)
+
+
+def upgrade() -> None:
+    if op.get_context().dialect.name != 'postgresql':
+        return
+    op.execute('CREATE EXTENSION IF NOT EXISTS pg_trgm')
+    for name, table, column in TRIGRAM_INDEXES:
+        op.create_index(name, table, [column], postgresql_using='gin', postgresql_ops={column: 'gin_trgm_ops'})
+
+
+def downgrade() -> None:
+    if op.get_context().dialect.name != 'postgresql':
+        return
+    for name, table, _ in TRIGRAM_INDEXES:
+        op.drop_index(name, table_name=table)
@@ -0,0 +1,52 @@
+"""consolidate order indexes
+
+Drops single-column indexes on orders that no query path uses or that are a
+prefix of a composite index: ix_orders_customer_id is covered by
+ix_orders_customer_id_time, ix_orders_time by ix_orders_time_amount and
+ix_orders_id by the primary key.
+
+On PostgreSQL a BRIN index on orders.time can be added for append-mostly
+tables with `alembic -x orders_time_brin=true upgrade head`.
+
+Revision ID: cf600e6145c2
+Revises: 379f9e5ce5c4
+Create Date: 2026-10-17 11:02:17.530871
+
+"""
+from typing import Sequence, Union
+
+from alembic import context, op
+
+# revision identifiers, used by Alembic.
+revision: str = 'cf600e6145c2'
+down_revision: Union[str, None] = '379f9e5ce5c4'
+branch_labels: Union[str, Sequence[str], None] = None
+depends_on: Union[str, Sequence[str], None] = None
+
+REDUNDANT_INDEXES = (
+    ('ix_orders_id', ['id']),
+    ('ix_orders_customer_id', ['customer_id']),
+    ('ix_orders_time', ['time']),
+    ('ix_orders_item', ['item']),
+    ('ix_orders_amount', ['amount']),
+    ('ix_orders_date_created', ['date_created']),
+    ('ix_orders_date_updated', ['date_updated']),
+)
+
+
+def _brin_requested() -> bool:
+    requested = context.get_x_argument(as_dictionary=True).get('orders_time_brin', 'false')
+    return requested.lower() in ('1', 'true', 'yes') and op.get_context().dialect.name == 'postgresql'
+
+
+def upgrade() -> None:
+    for name, _ in REDUNDANT_INDEXES:
+        op.drop_index(name, table_name='orders')
+    if _brin_requested():
+        op.create_index('ix_orders_time_brin', 'orders', ['time'], postgresql_using='brin')
+
+
+def downgrade() -> None:
+    op.execute('DROP INDEX IF EXISTS ix_orders_time_brin')
+    for name, columns in reversed(REDUNDANT_INDEXES):
+        op.create_index(name, 'orders', columns, unique=False)
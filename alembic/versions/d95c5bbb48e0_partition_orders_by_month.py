@@ -0,0 +1,117 @@
+"""partition orders by month
+
+Opt-in, PostgreSQL only: converts orders into a table range-partitioned on
+time with one partition per month and a default partition, when run with
+`alembic -x orders_partitioned=true upgrade head`. Without the flag this
+revision is a no-op and orders stays a plain table.
+
+The primary key becomes (id, time), as PostgreSQL requires the partition key
+in every unique constraint, so time is made NOT NULL (missing values are
+backfilled from date_created). The BRIN index ix_orders_time_brin from
+cf600e6145c2 is recreated on the new table when it existed before (offline,
+when `-x orders_time_brin=true` is passed). Keep future partitions in place with
+`python -m app.manage partitions ensure`.
+
+Revision ID: d95c5bbb48e0
+Revises: b3fd59332911
+Create Date: 2026-10-17 13:05:12.662410
+
+"""
+from typing import Sequence, Union
+
+from alembic import context, op
+
+# revision identifiers, used by Alembic.
+revision: str = 'd95c5bbb48e0'
+down_revision: Union[str, None] = 'b3fd59332911'
+branch_labels: Union[str, Sequence[str], None] = None
+depends_on: Union[str, Sequence[str], None] = None
+
+COLUMNS = "id, customer_id, item, amount, time, date_created, date_updated"
+MONTHS_AHEAD = 3
+
+
+def _partitioning_requested() -> bool:
+    requested = context.get_x_argument(as_dictionary=True).get('orders_partitioned', 'false')
+    return requested.lower() in ('1', 'true', 'yes') and op.get_context().dialect.name == 'postgresql'
+
+
+def _create_orders(partitioned: bool):
+    op.execute(
+        "CREATE TABLE orders ("
+        "id INTEGER NOT NULL DEFAULT nextval('orders_id_seq'), "
+        "customer_id INTEGER REFERENCES customers (id), "
+        "item VARCHAR, "
+        "amount FLOAT, "
+        f"time TIMESTAMP WITHOUT TIME ZONE{' NOT NULL' if partitioned else ''}, "
+        "date_created TIMESTAMP WITHOUT TIME ZONE DEFAULT now(), "
+        "date_updated TIMESTAMP WITHOUT TIME ZONE DEFAULT now(), "
+        f"PRIMARY KEY ({'id, time' if partitioned else 'id'})"
+        f"){' PARTITION BY RANGE (time)' if partitioned else ''}"
+    )
+    op.execute("ALTER SEQUENCE orders_id_seq OWNED BY orders.id")
+
+
+def _had_time_brin() -> bool:
+    if context.is_offline_mode():
+        requested = context.get_x_argument(as_dictionary=True).get('orders_time_brin', 'false')
+        return requested.lower() in ('1', 'true', 'yes')
+    return op.get_bind().exec_driver_sql(
+        "SELECT EXISTS (SELECT 1 FROM pg_indexes WHERE tablename = 'orders' AND indexname = 'ix_orders_time_brin')"
+    ).scalar()
+
+
+def _swap_orders(partitioned: bool):
+    """Rebuilds orders in the requested layout and copies the rows across"""
+    time_brin = _had_time_brin()
+    op.execute("ALTER TABLE orders RENAME TO orders_previous")
+    op.execute("ALTER TABLE orders_previous RENAME CONSTRAINT orders_pkey TO orders_previous_pkey")
+    for index in ('ix_orders_customer_id_time', 'ix_orders_time_amount', 'ix_orders_time_brin'):
+        op.execute(f"DROP INDEX IF EXISTS {index}")
+    _create_orders(partitioned)
+    if partitioned:
+        op.execute("CREATE TABLE orders_default PARTITION OF orders DEFAULT")
+        # One partition per month from the oldest order until a few months out
+        op.execute(f"""
+            DO $$
+            DECLARE
+                partition_start date := date_trunc('month', coalesce((SELECT min(time) FROM orders_previous), now()));
+            BEGIN
+                WHILE partition_start <= date_trunc('month', now()) + interval '{MONTHS_AHEAD} months' LOOP
+                    EXECUTE format(
+                        'CREATE TABLE %I PARTITION OF orders FOR VALUES FROM (%L) TO (%L)',
+                        'orders_p' || to_char(partition_start, 'YYYY_MM'), partition_start, partition_start + interval '1 month'
+                    );
+                    partition_start := partition_start + interval '1 month';
+                END LOOP;
+            END $$
+        """)
+    op.execute(f"INSERT INTO orders ({COLUMNS}) SELECT {COLUMNS} FROM orders_previous")
+    op.execute("DROP TABLE orders_previous")
+    op.create_index('ix_orders_customer_id_time', 'orders', ['customer_id', 'time'], unique=False)
+    op.create_index('ix_orders_time_amount', 'orders', ['time', 'amount'], unique=False)
+    if time_brin:
+        op.create_index('ix_orders_time_brin', 'orders', ['time'], postgresql_using='brin')
+
+
+def upgrade() -> None:
+    if not _partitioning_requested():
+        return
+    op.execute("UPDATE orders SET time = coalesce(date_created, now()) WHERE time IS NULL")
+    _swap_orders(partitioned=True)
+
+
+def downgrade() -> None:
+    if op.get_context().dialect.name != 'postgresql':
+        return
+    # Offline there is no database to inspect, so follow the same -x flag as upgrade
+    partitioned = _partitioning_requested() if context.is_offline_mode() else _orders_is_partitioned()
+    if partitioned:
+        _swap_orders(partitioned=False)
+
+
+def _orders_is_partitioned() -> bool:
+    return op.get_bind().exec_driver_sql(
+        "SELECT EXISTS (SELECT 1 FROM pg_partitioned_table pt "
+        "JOIN pg_class c ON c.oid = pt.partrelid WHERE c.relname = 'orders')"
+    ).scalar()
@@ -0,0 +1,33 @@
+"""add sms outbox
+
+Revision ID: e1a7c42d9b60
+Revises: 4c1b3056f892
+Create Date: 2026-10-17 18:41:07.215093
+
+"""
+from typing import Sequence, Union
+
+import sqlalchemy as sa
+
+from alembic import op
+
+# revision identifiers, used by Alembic.
+revision: str = 'e1a7c42d9b60'
+down_revision: Union[str, None] = '4c1b3056f892'
+branch_labels: Union[str, Sequence[str], None] = None
+depends_on: Union[str, Sequence[str], None] = None
+
+
+def upgrade() -> None:
+    op.create_table('sms_outbox',
+    sa.Column('id', sa.Integer(), nullable=False),
+    sa.Column('phone_number', sa.String(), nullable=False),
+    sa.Column('message', sa.Text(), nullable=False),
+    sa.Column('date_created', sa.DateTime(), server_default=sa.text('now()'), nullable=True),
+    sa.Column('claimed_until', sa.DateTime(), nullable=True),
+    sa.PrimaryKeyConstraint('id')
+    )
+
+
+def downgrade() -> None:
+    op.drop_table('sms_outbox')
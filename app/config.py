@@ -1,6 +1,6 @@
 import os
 from functools import lru_cache
-from typing import Literal
+from typing import List, Literal, Optional
 
 from pydantic_settings import BaseSettings
 
@@ -15,6 +15,59 @@ class Settings(BaseSettings):
     database_url: str
     env: Literal["development", "production", "test"] = "development"
 
+    db_pool_size: int = 10
+    db_max_overflow: int = 10
+    db_pool_timeout: float = 30
+    db_pool_recycle: int = 1800
+    db_pool_pre_ping: bool = True
+
+    # JSON list in the environment, e.g. DATABASE_REPLICA_URLS='["postgresql://replica1/db"]'
+    database_replica_urls: List[str] = []
+    db_replica_health_check_interval: float = 5
+    db_replica_health_check_timeout: float = 2
+    db_read_your_writes_window: float = 5
+
+    sms_provider: Literal["infobip", "stub"] = "infobip"
+    sms_batch_size: int = 100
+    sms_flush_interval: float = 0.05
+    sms_max_retries: int = 3
+    sms_retry_backoff: float = 0.5
+    sms_outbox_lease: float = 60
+    sms_outbox_poll_interval: float = 0.5
+
+    bulk_chunk_size: int = 1000
+
+    auth_token_cache_size: int = 10000
+    auth_token_cache_ttl: float = 300
+    auth_jwks_refresh_interval: float = 3600
+    auth_m2m_token_refresh_margin: float = 60
+
+    http_client_timeout: float = 10
+    http_client_max_connections: int = 100
+
+    cache_backend: Literal["memory", "redis", "none"] = "memory"
+    cache_ttl: float = 60
+    cache_max_entries: int = 10000
+    redis_url: Optional[str] = None
+    state_backend: Literal["memory", "redis"] = "memory"
+
+    web_concurrency: Optional[int] = None
+
+    order_feed_buffer_size: int = 1000
+    order_feed_max_pending: int = 1000
+    order_feed_heartbeat: float = 15
+
+    idempotency_ttl: float = 86400
+    idempotency_purge_interval: float = 3600
+
+    customer_purge_interval: float = 60
+    customer_purge_batch_size: int = 1000
+    customer_purge_pause: float = 0.1
+
+    profiling_enabled: bool = False
+    profiling_sample_rate: float = 0.01
+    profiling_n_plus_one_threshold: int = 10
+
     class Config:
         env_file = ".env"
 
@@ -1,20 +1,87 @@
+from fastapi import Request
 from sqlalchemy import create_engine
+from sqlalchemy.engine import make_url
+from sqlalchemy.exc import DBAPIError
+from sqlalchemy.ext.asyncio import async_sessionmaker, create_async_engine
 from sqlalchemy.ext.declarative import declarative_base
 from sqlalchemy.orm import sessionmaker
 
 from .config import get_settings
+from .utils.pool_metrics import (InstrumentedAsyncQueuePool,
+                                 InstrumentedQueuePool, PoolMetrics)
+from .utils.replicas import ReplicaRouter
 
 settings = get_settings()
 
 SQLALCHEMY_DATABASE_URL = settings.database_url
 
-engine = create_engine(SQLALCHEMY_DATABASE_URL)
+ASYNC_DRIVERS = {
+    "postgres": "postgresql+asyncpg",
+    "postgresql": "postgresql+asyncpg",
+    "sqlite": "sqlite+aiosqlite",
+}
+
+def async_database_url(url: str) -> str:
+    """Maps a sync database URL onto the matching asyncio driver"""
+    parsed = make_url(url.replace("postgres://", "postgresql://", 1))
+    backend = parsed.get_backend_name()
+    if backend not in ASYNC_DRIVERS:
+        raise ValueError(f"No async driver configured for {backend}")
+    return parsed.set(drivername=ASYNC_DRIVERS[backend]).render_as_string(hide_password=False)
+
+def engine_options(url: str, is_async: bool = False) -> dict:
+    # SQLite uses a static/null pool that does not accept sizing arguments
+    if make_url(url).get_backend_name() == "sqlite":
+        return {}
+    return {
+        "poolclass": InstrumentedAsyncQueuePool if is_async else InstrumentedQueuePool,
+        "pool_size": settings.db_pool_size,
+        "max_overflow": settings.db_max_overflow,
+        "pool_timeout": settings.db_pool_timeout,
+        "pool_recycle": settings.db_pool_recycle,
+        "pool_pre_ping": settings.db_pool_pre_ping,
+    }
+
+engine = create_engine(SQLALCHEMY_DATABASE_URL, **engine_options(SQLALCHEMY_DATABASE_URL))
 SessionLocal = sessionmaker(autocommit=False, autoflush=False, bind=engine)
 Base = declarative_base()
 
+async_engine = create_async_engine(
+    async_database_url(SQLALCHEMY_DATABASE_URL), **engine_options(SQLALCHEMY_DATABASE_URL, is_async=True)
+)
+AsyncSessionLocal = async_sessionmaker(async_engine, autoflush=False, expire_on_commit=False)
+
+replica_engines = [
+    create_async_engine(async_database_url(url), **engine_options(url, is_async=True))
+    for url in settings.database_replica_urls
+]
+replica_router = ReplicaRouter(async_engine, replica_engines, sticky_window=settings.db_read_your_writes_window)
+
+pool_metrics = {
+    "sync": PoolMetrics("sync").attach(engine),
+    "async": PoolMetrics("async").attach(async_engine.sync_engine),
+    **{f"replica{index}": PoolMetrics(f"replica{index}").attach(replica.sync_engine)
+       for index, replica in enumerate(replica_engines)},
+}
+
 def get_db():
     db = SessionLocal()
     try:
         yield db
     finally:
-        db.close()
\ No newline at end of file
+        db.close()
+
+async def get_async_db():
+    async with AsyncSessionLocal() as db:
+        yield db
+
+async def get_read_db(request: Request):
+    """Session for read-only handlers: on a replica when one is configured and healthy"""
+    bind = await replica_router.engine_for(request.scope)
+    async with AsyncSessionLocal(bind=bind) as db:
+        try:
+            yield db
+        except DBAPIError as error:
+            if error.connection_invalidated and bind is not async_engine:
+                replica_router.mark_down(bind)
+            raise
@@ -1,10 +1,51 @@
+import asyncio
+from contextlib import asynccontextmanager
+
+import httpx
 from fastapi import Depends, FastAPI
 
 from app.config import get_settings
-from app.routes import customers, orders, token_router
+from app.db import (AsyncSessionLocal, async_engine, engine, replica_engines,
+                    replica_router)
+from app.routes import customers, metrics, orders, token_router
+from app.utils.idempotency import run_purger
+from app.utils.order_feed import get_order_feed
+from app.utils.profiling import ProfilingMiddleware, attach_sql_timing
+from app.utils.replicas import ReadYourWritesMiddleware
+from app.utils.sms_queue import get_sms_queue
 from app.utils.utils import VerifyToken
 
-app = FastAPI()
+
+@asynccontextmanager
+async def lifespan(app: FastAPI):
+    # One pooled client for outbound calls, so each does not pay for a new TLS handshake
+    app.state.http_client = httpx.AsyncClient(
+        timeout=settings.http_client_timeout,
+        limits=httpx.Limits(max_connections=settings.http_client_max_connections),
+    )
+    sms_queue = get_sms_queue()
+    await sms_queue.start()
+    order_feed = get_order_feed()
+    await order_feed.start()
+    tasks = [
+        asyncio.create_task(run_purger(AsyncSessionLocal, settings.idempotency_purge_interval)),
+        asyncio.create_task(customers.run_customer_purger(
+            AsyncSessionLocal, settings.customer_purge_interval,
+            settings.customer_purge_batch_size, settings.customer_purge_pause,
+        )),
+    ]
+    if replica_engines:
+        tasks.append(asyncio.create_task(replica_router.run_health_checks(
+            settings.db_replica_health_check_interval, settings.db_replica_health_check_timeout
+        )))
+    yield
+    for task in tasks:
+        task.cancel()
+    await order_feed.stop()
+    await sms_queue.stop()
+    await app.state.http_client.aclose()
+
+app = FastAPI(lifespan=lifespan)
 
 settings = get_settings()
 
@@ -18,10 +59,26 @@ if settings.env == "test":
 
     app.dependency_overrides[VerifyToken] = get_test_token_verifier
 
+if settings.profiling_enabled:
+    attach_sql_timing(engine)
+    attach_sql_timing(async_engine.sync_engine)
+    for replica in replica_engines:
+        attach_sql_timing(replica.sync_engine)
+    app.add_middleware(
+        ProfilingMiddleware,
+        sample_rate=settings.profiling_sample_rate,
+        n_plus_one_threshold=settings.profiling_n_plus_one_threshold,
+    )
+
+if replica_engines:
+    app.add_middleware(ReadYourWritesMiddleware, router=replica_router)
+
 app.include_router(token_router.router, tags=["token"], prefix="/api")
 app.include_router(customers.router, tags=["customers"], prefix="/api")
 app.include_router(orders.router, tags=["orders"], prefix="/api")
+app.include_router(metrics.router, tags=["metrics"], prefix="/api")
 
 if __name__ == "__main__":
     import uvicorn
-    uvicorn.run(app, host="0.0.0.0", port=8001, reload=True)
\ No newline at end of file
+    # Reloading needs an import string; production runs under gunicorn.conf.py instead
+    uvicorn.run("app.main:app", host="0.0.0.0", port=8001, reload=settings.env == "development")
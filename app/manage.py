@@ -0,0 +1,69 @@
+"""Maintenance commands.
+
+    python -m app.manage partitions list
+    python -m app.manage partitions ensure --months-ahead 3
+    python -m app.manage partitions archive --keep-months 12 --directory ./archive --format csv.gz
+
+Run `ensure` from cron at least monthly so inserts never fall into the
+default partition. Rows that did land there are moved into their month's
+partition by `ensure` for the months it covers, and for every month before
+`archive` exports anything.
+"""
+import argparse
+import sys
+
+from app.db import engine
+from app.utils.partitions import (ARCHIVE_FORMATS, archive_partition,
+                                  cold_partitions, ensure_partitions,
+                                  is_partitioned, list_partitions,
+                                  partition_name, split_default_partition)
+
+
+def partitions_command(args) -> int:
+    with engine.connect() as conn:
+        if not is_partitioned(conn):
+            print("orders is not partitioned; run the partitioning migration on PostgreSQL first")
+            return 0
+
+    if args.action == "list":
+        with engine.connect() as conn:
+            for month in list_partitions(conn):
+                print(partition_name(month))
+    elif args.action == "ensure":
+        with engine.begin() as conn:
+            created = ensure_partitions(conn, args.months_ahead)
+        print(f"Created {len(created)} partitions: {', '.join(created)}" if created else "All partitions exist")
+    else:
+        with engine.begin() as conn:
+            split = split_default_partition(conn)
+        if split:
+            print(f"Moved rows out of the default partition into: {', '.join(split)}")
+        with engine.connect() as conn:
+            months = cold_partitions(list_partitions(conn), args.keep_months)
+        for month in months:
+            # One transaction per partition: it is only dropped once its export is complete
+            with engine.begin() as conn:
+                path = archive_partition(conn, month, args.directory, args.format)
+            print(f"Archived {partition_name(month)} to {path}")
+        if not months:
+            print("No partitions to archive")
+    return 0
+
+
+def main(argv=None) -> int:
+    parser = argparse.ArgumentParser(prog="python -m app.manage")
+    commands = parser.add_subparsers(dest="command", required=True)
+
+    partitions = commands.add_parser("partitions", help="Manage monthly orders partitions")
+    partitions.add_argument("action", choices=["list", "ensure", "archive"])
+    partitions.add_argument("--months-ahead", type=int, default=3, help="Future months to create partitions for")
+    partitions.add_argument("--keep-months", type=int, default=12, help="Recent months to keep when archiving")
+    partitions.add_argument("--directory", default="./archive", help="Where archives are written")
+    partitions.add_argument("--format", choices=ARCHIVE_FORMATS, default="csv.gz")
+
+    args = parser.parse_args(argv)
+    return partitions_command(args)
+
+
+if __name__ == "__main__":
+    sys.exit(main())
@@ -1,5 +1,5 @@
-from sqlalchemy import (Column, DateTime, Float, ForeignKey, Index, Integer,
-                        String)
+from sqlalchemy import (Column, Date, DateTime, Float, ForeignKey, Index,
+                        Integer, String, Text)
 from sqlalchemy.ext.declarative import declarative_base
 from sqlalchemy.orm import relationship
 from sqlalchemy.sql import func
@@ -10,30 +10,69 @@ class Customer(Base):
     __tablename__ = 'customers'
     id = Column(Integer, primary_key=True, index=True)
     name = Column(String, index=True)
-    code = Column(String, unique=True, index=True)
+    code = Column(String)
     phone_number = Column(String, index=True, nullable=True)
     date_created = Column(DateTime, server_default=func.now(), index=True)
     date_updated = Column(DateTime, server_default=func.now(), onupdate=func.now(), index=True)
+    # Set by a soft delete; the customer and its orders are hidden until the purger removes them
+    deleted_at = Column(DateTime, nullable=True)
 
     orders = relationship("Order", back_populates="customer", lazy="dynamic")
 
     __table_args__ = (
         Index('ix_customers_name_code', 'name', 'code'),
+        # Unique among live customers, so a deleted customer's code can be reused before the purge
+        Index('ix_customers_code', 'code', unique=True,
+              postgresql_where=deleted_at.is_(None), sqlite_where=deleted_at.is_(None)),
+        # Only customers awaiting the purge, which reads anti-join against and the purger walks
+        Index('ix_customers_deleted', 'deleted_at', 'id',
+              postgresql_where=deleted_at.isnot(None), sqlite_where=deleted_at.isnot(None)),
     )
 
 class Order(Base):
     __tablename__ = 'orders'
-    id = Column(Integer, primary_key=True, index=True)
-    customer_id = Column(Integer, ForeignKey('customers.id'), index=True)
-    item = Column(String, index=True)
-    amount = Column(Float, index=True)
-    time = Column(DateTime, index=True)
-    date_created = Column(DateTime, server_default=func.now(), index=True)
-    date_updated = Column(DateTime, server_default=func.now(), onupdate=func.now(), index=True)
+    # Only the composites are indexed: (customer_id, time) serves per-customer
+    # history and the FK, (time, amount) serves date ranges and amount stats
+    id = Column(Integer, primary_key=True)
+    customer_id = Column(Integer, ForeignKey('customers.id'))
+    item = Column(String)
+    amount = Column(Float)
+    time = Column(DateTime)
+    date_created = Column(DateTime, server_default=func.now())
+    date_updated = Column(DateTime, server_default=func.now(), onupdate=func.now())
 
     customer = relationship("Customer", back_populates="orders")
 
     __table_args__ = (
         Index('ix_orders_customer_id_time', 'customer_id', 'time'),
         Index('ix_orders_time_amount', 'time', 'amount'),
-    )
\ No newline at end of file
+    )
+
+class OrderDailyRollup(Base):
+    __tablename__ = 'order_daily_rollups'
+    day = Column(Date, primary_key=True)
+    customer_id = Column(Integer, primary_key=True)
+    item = Column(String, primary_key=True)
+    order_count = Column(Integer, nullable=False)
+    total_amount = Column(Float, nullable=False)
+    min_amount = Column(Float, nullable=False)
+    max_amount = Column(Float, nullable=False)
+
+class IdempotencyKey(Base):
+    __tablename__ = 'idempotency_keys'
+    key = Column(String(255), primary_key=True)
+    request_hash = Column(String(64), nullable=False)
+    response = Column(Text, nullable=False)
+    date_created = Column(DateTime, server_default=func.now())
+    expires_at = Column(DateTime, nullable=False, index=True)
+
+class SmsOutbox(Base):
+    __tablename__ = 'sms_outbox'
+    # Written in the order's transaction and deleted once sent, so a notification
+    # is lost neither by a rollback nor by a crash between commit and send
+    id = Column(Integer, primary_key=True)
+    phone_number = Column(String, nullable=False)
+    message = Column(Text, nullable=False)
+    date_created = Column(DateTime, server_default=func.now())
+    # Set while a worker sends the row; a worker that dies lets the claim lapse
+    claimed_until = Column(DateTime, nullable=True)
@@ -1,16 +1,40 @@
-from typing import List, Optional
+import asyncio
+import logging
+from collections import defaultdict
+from datetime import datetime
+from typing import IO, List, Literal, Optional, Union
 
-from fastapi import APIRouter, Depends, HTTPException
-from pydantic import BaseModel
+from fastapi import (APIRouter, Depends, File, HTTPException, Query, Request,
+                     UploadFile)
+from fastapi.concurrency import run_in_threadpool
+from pydantic import BaseModel, Field, ValidationError
+from sqlalchemy import case, delete, exists, or_, select, tuple_, update
+from sqlalchemy.dialects import postgresql, sqlite
+from sqlalchemy.exc import SQLAlchemyError
+from sqlalchemy.ext.asyncio import AsyncSession
 from sqlalchemy.orm import Session
+from sqlalchemy.sql import func
 
-from app.db import get_db
-from app.utils.utils import VerifyToken
+from app.config import get_settings
+from app.db import get_async_db, get_db, get_read_db
+from app.utils.cache import etag_response, get_cache
+from app.utils.importer import iter_upload_rows
+from app.utils.order_feed import get_order_feed
+from app.utils.pagination import decode_cursor, keyset_page
+from app.utils.search import (customer_search_index, escape_like,
+                              order_item_search_index)
+from app.utils.shared_state import get_state_client
+from app.utils.soft_delete import CUSTOMER_IS_LIVE, ORDER_IS_LIVE
+from app.utils.utils import get_token_verifier
 
-from ..models.models import Customer
+from ..models.models import Customer, Order, OrderDailyRollup
+from .orders import (LOOKUP_MAX_KEYS, ORDER_RESPONSE_COLUMNS, OrderResponse,
+                     order_cache_key, parse_date_range)
+
+logger = logging.getLogger(__name__)
 
 router = APIRouter()
-verify_token = VerifyToken()
+verify_token = get_token_verifier()
 
 class CustomerBase(BaseModel):
     name: str
@@ -31,60 +55,404 @@ class CustomerResponse(CustomerBase):
     class Config:
         from_attributes = True
 
-async def create_customer(customer: CustomerCreate, db: Session):
+class CustomerPage(BaseModel):
+    items: List[CustomerResponse]
+    next_cursor: Optional[str] = None
+
+class CustomerImportError(BaseModel):
+    row: int
+    error: str
+
+class CustomerImportResult(BaseModel):
+    processed: int
+    upserted: int
+    errors: List[CustomerImportError]
+
+class CustomerOrdersSummary(BaseModel):
+    order_count: int
+    total_amount: float
+    last_order_time: Optional[datetime] = None
+
+class CustomerOrdersPage(BaseModel):
+    items: List[OrderResponse]
+    next_cursor: Optional[str] = None
+    summary: Optional[CustomerOrdersSummary] = None
+
+class CustomerSearchResult(CustomerResponse):
+    score: float
+
+class CustomerLookup(BaseModel):
+    ids: List[int] = Field(default_factory=list, max_length=LOOKUP_MAX_KEYS)
+    codes: List[str] = Field(default_factory=list, max_length=LOOKUP_MAX_KEYS)
+    phone_numbers: List[str] = Field(default_factory=list, max_length=LOOKUP_MAX_KEYS)
+
+class CustomerLookupResult(BaseModel):
+    items: List[CustomerResponse]
+    missing: CustomerLookup
+
+CUSTOMER_ORDERS_PAGE_SIZE = 50
+PURGER_LOCK_KEY = "lock:customer-purger"
+UPSERT_DIALECTS = {"postgresql": postgresql, "sqlite": sqlite}
+CUSTOMER_LOOKUP_COLUMNS = {"ids": Customer.id, "codes": Customer.code, "phone_numbers": Customer.phone_number}
+
+async def create_customer(customer: CustomerCreate, db: AsyncSession):
     db_customer = Customer(**customer.dict())
     db.add(db_customer)
-    db.commit()
-    db.refresh(db_customer)
+    await db.commit()
+    customer_search_index.mark_stale()
+    await db.refresh(db_customer)
     return db_customer
 
-async def get_all_customers(skip: int, limit: int, db: Session):
-    customers = db.query(Customer).offset(skip).limit(limit).all()
-    return customers
+async def get_all_customers(skip: int, limit: int, db: AsyncSession):
+    result = await db.execute(select(Customer).where(CUSTOMER_IS_LIVE).offset(skip).limit(limit))
+    return result.scalars().all()
 
-async def get_customer(customer_id: int, db: Session):
-    db_customer = db.query(Customer).filter(Customer.id == customer_id).first()
-    if db_customer is None:
+async def get_customers_page(cursor: Optional[str], limit: int, db: AsyncSession):
+    query = select(Customer).where(CUSTOMER_IS_LIVE).order_by(Customer.id)
+    if cursor:
+        (last_id,) = decode_cursor(cursor, int)
+        query = query.where(Customer.id > last_id)
+    result = await db.execute(query.limit(limit + 1))
+    return keyset_page(result.scalars().all(), limit, lambda customer: (customer.id,))
+
+async def get_customer(customer_id: int, db: AsyncSession):
+    db_customer = await db.get(Customer, customer_id)
+    if db_customer is None or db_customer.deleted_at is not None:
         raise HTTPException(status_code=404, detail="Customer not found")
     return db_customer
 
-async def update_customer(customer_id: int, customer: CustomerUpdate, db: Session):
-    db_customer = db.query(Customer).filter(Customer.id == customer_id).first()
-    if db_customer is None:
-        raise HTTPException(status_code=404, detail="Customer not found")
+async def lookup_customers(lookup: CustomerLookup, db: AsyncSession):
+    """Customers for the requested ids, codes and phone numbers, with one IN query per key type.
+
+    Results follow the request order, ids first, then codes, then phone numbers. A
+    customer matched by several keys is listed once, at its first key; a phone
+    number shared by several customers lists them all.
+    """
+    items, seen, missing = [], set(), {}
+    for field, column in CUSTOMER_LOOKUP_COLUMNS.items():
+        keys = list(dict.fromkeys(getattr(lookup, field)))
+        matches = defaultdict(list)
+        if keys:
+            result = await db.execute(select(Customer).where(column.in_(keys), CUSTOMER_IS_LIVE).order_by(Customer.id))
+            for customer in result.scalars():
+                matches[getattr(customer, column.key)].append(customer)
+        missing[field] = [key for key in keys if key not in matches]
+        for key in keys:
+            for customer in matches.get(key, ()):
+                if customer.id not in seen:
+                    seen.add(customer.id)
+                    items.append(customer)
+    return {"items": items, "missing": missing}
+
+def customer_cache_key(customer_id: int) -> str:
+    return f"customer:{customer_id}"
+
+async def get_customer_json(customer_id: int, db: AsyncSession) -> str:
+    """Serialised customer, read through the cache"""
+    cache = get_cache()
+    body = await cache.get(customer_cache_key(customer_id))
+    if body is None:
+        db_customer = await get_customer(customer_id, db)
+        body = CustomerResponse.from_orm(db_customer).json()
+        await cache.set(customer_cache_key(customer_id), body)
+    return body
 
+async def update_customer(customer_id: int, customer: CustomerUpdate, db: AsyncSession):
     update_data = customer.dict(exclude_unset=True)
-    for key, value in update_data.items():
-        setattr(db_customer, key, value)
+    if not update_data:
+        return await get_customer(customer_id, db)
+    result = await db.execute(
+        update(Customer).where(Customer.id == customer_id, CUSTOMER_IS_LIVE).values(**update_data).returning(Customer)
+    )
+    db_customer = result.scalar_one_or_none()
+    if db_customer is None:
+        raise HTTPException(status_code=404, detail="Customer not found")
 
-    db.commit()
-    db.refresh(db_customer)
+    await db.commit()
+    await get_cache().delete(customer_cache_key(customer_id))
+    customer_search_index.mark_stale()
     return db_customer
 
-async def delete_customer(customer_id: int, db: Session):
-    db_customer = db.query(Customer).filter(Customer.id == customer_id).first()
-    if db_customer is None:
+async def evict_cached_orders(customer_id: int, db: AsyncSession, batch_size: int):
+    """Drops a customer's orders from the cache, reading their ids `batch_size` at a time"""
+    cache = get_cache()
+    result = await db.stream_scalars(
+        select(Order.id).where(Order.customer_id == customer_id).execution_options(yield_per=batch_size)
+    )
+    async for order_ids in result.partitions():
+        await cache.delete(*(order_cache_key(order_id) for order_id in order_ids))
+
+async def delete_customer(customer_id: int, db: AsyncSession):
+    """Soft delete: one row update that hides the customer and its orders;
+    run_customer_purger removes them later. Only the order ids are read, to
+    evict orders cached before the delete"""
+    result = await db.execute(
+        update(Customer).where(Customer.id == customer_id, CUSTOMER_IS_LIVE)
+        .values(deleted_at=func.now()).returning(Customer.id)
+    )
+    if result.scalar_one_or_none() is None:
         raise HTTPException(status_code=404, detail="Customer not found")
-    db.delete(db_customer)
-    db.commit()
+    await db.commit()
+    await get_cache().delete(customer_cache_key(customer_id))
+    await evict_cached_orders(customer_id, db, get_settings().customer_purge_batch_size)
+    customer_search_index.mark_stale()
+    order_item_search_index.mark_stale()
     return {"message": "Customer deleted successfully"}
 
+async def purge_deleted_customer(customer_id: int, db: AsyncSession, batch_size: int, pause: float) -> int:
+    """Hard-deletes a soft-deleted customer's orders, `batch_size` rows per transaction
+    with `pause` seconds between them, then the customer; returns the orders removed"""
+    batch = select(Order.id).where(Order.customer_id == customer_id).limit(batch_size)
+    purged = 0
+    while True:
+        result = await db.execute(
+            delete(Order).where(Order.id.in_(batch.scalar_subquery())).returning(*ORDER_RESPONSE_COLUMNS),
+            execution_options={"synchronize_session": False},
+        )
+        rows = result.all()
+        await db.commit()
+        if rows:
+            purged += len(rows)
+            await get_cache().delete(*(order_cache_key(row.id) for row in rows))
+            order_item_search_index.mark_stale()
+            await get_order_feed().publish("order.deleted", rows)
+        if len(rows) < batch_size:
+            break
+        await asyncio.sleep(pause)
+
+    await db.execute(delete(OrderDailyRollup).where(OrderDailyRollup.customer_id == customer_id))
+    # An order that slipped in during the purge keeps the customer for the next run
+    await db.execute(delete(Customer).where(
+        Customer.id == customer_id, Customer.deleted_at.isnot(None),
+        ~exists().where(Order.customer_id == customer_id),
+    ))
+    await db.commit()
+    return purged
+
+async def purge_deleted_customers(db: AsyncSession, batch_size: int, pause: float) -> int:
+    result = await db.execute(
+        select(Customer.id).where(Customer.deleted_at.isnot(None)).order_by(Customer.deleted_at)
+    )
+    customer_ids = result.scalars().all()
+    await db.commit()
+    purged = 0
+    for customer_id in customer_ids:
+        purged += await purge_deleted_customer(customer_id, db, batch_size, pause)
+    return purged
+
+async def run_customer_purger(session_factory, interval: float, batch_size: int, pause: float):
+    """Purges soft-deleted customers every `interval` seconds until cancelled.
+
+    Every worker runs this loop; a lease in the shared state lets only one of
+    them purge per interval. A purge outlasting the lease may overlap the next
+    one, which only finds the rows already gone.
+    """
+    while True:
+        await asyncio.sleep(interval)
+        try:
+            if not await get_state_client().set(PURGER_LOCK_KEY, "1", nx=True, px=int(interval * 1000)):
+                continue
+            async with session_factory() as db:
+                purged = await purge_deleted_customers(db, batch_size, pause)
+            if purged:
+                logger.info("Purged %d orders of deleted customers", purged)
+        except Exception:
+            logger.exception("Purging deleted customers failed")
+
+async def get_customer_orders_summary(customer_id: int, db: AsyncSession):
+    """Lifetime order count, spend and last order time for one customer"""
+    result = await db.execute(
+        select(func.count(Order.id), func.coalesce(func.sum(Order.amount), 0.0), func.max(Order.time))
+        .where(Order.customer_id == customer_id, ORDER_IS_LIVE)
+    )
+    order_count, total_amount, last_order_time = result.one()
+    return {"order_count": order_count, "total_amount": total_amount, "last_order_time": last_order_time}
+
+async def get_customer_orders(customer_id: int, db: AsyncSession, start_date: Optional[str] = None,
+                              end_date: Optional[str] = None, cursor: Optional[str] = None,
+                              limit: int = CUSTOMER_ORDERS_PAGE_SIZE, include_summary: bool = False):
+    """Newest-first page of one customer's orders, walking ix_orders_customer_id_time backwards"""
+    query = select(Order).where(Order.customer_id == customer_id, ORDER_IS_LIVE).order_by(
+        Order.time.desc(), Order.id.desc()
+    )
+    if start_date or end_date:
+        start_datetime, end_datetime = parse_date_range(start_date or end_date, end_date or start_date)
+        if start_date:
+            query = query.where(Order.time >= start_datetime)
+        if end_date:
+            query = query.where(Order.time <= end_datetime)
+    if cursor:
+        last_time, last_id = decode_cursor(cursor, datetime, int)
+        query = query.where(tuple_(Order.time, Order.id) < tuple_(last_time, last_id))
+
+    result = await db.execute(query.limit(limit + 1))
+    page = keyset_page(result.scalars().all(), limit, lambda order: (order.time, order.id))
+    # An empty first page is the only case where the customer may not exist
+    if not page["items"] and not cursor:
+        await get_customer(customer_id, db)
+    page["items"] = [OrderResponse.from_orm(order) for order in page["items"]]
+    if include_summary:
+        page["summary"] = await get_customer_orders_summary(customer_id, db)
+    return page
+
+async def search_customers_in_memory(q: str, mode: str, limit: int, db: AsyncSession):
+    if customer_search_index.stale:
+        version = customer_search_index.version
+        result = await db.execute(select(Customer.id, Customer.name, Customer.code).where(CUSTOMER_IS_LIVE))
+        customer_search_index.rebuild(((row.id, (row.name, row.code)) for row in result), version)
+    matches = customer_search_index.search(q, mode, limit)
+    if not matches:
+        return []
+    result = await db.execute(select(Customer).where(Customer.id.in_([key for key, _ in matches]), CUSTOMER_IS_LIVE))
+    customers = {customer.id: customer for customer in result.scalars()}
+    return [(customers[key], score) for key, score in matches if key in customers]
+
+async def search_customers(q: str, mode: str, limit: int, db: AsyncSession):
+    """Customers whose name or code matches, best first; pg_trgm on PostgreSQL, an in-process index elsewhere"""
+    if db.get_bind().dialect.name != "postgresql":
+        matches = await search_customers_in_memory(q, mode, limit, db)
+    else:
+        q = q.strip()
+        score = func.greatest(func.similarity(Customer.name, q), func.similarity(Customer.code, q))
+        if mode == "prefix":
+            pattern = escape_like(q) + "%"
+            condition = or_(Customer.name.ilike(pattern, escape="\\"), Customer.code.ilike(pattern, escape="\\"))
+            exact = or_(func.lower(Customer.name) == q.lower(), func.lower(Customer.code) == q.lower())
+            score = case((exact, 1.0), else_=score)
+        else:
+            condition = or_(
+                Customer.name.op("%")(q),
+                Customer.code.op("%")(q),
+                Customer.name.ilike(f"%{escape_like(q)}%", escape="\\"),
+            )
+        result = await db.execute(
+            select(Customer, score.label("score")).where(condition, CUSTOMER_IS_LIVE)
+            .order_by(score.desc(), Customer.id).limit(limit)
+        )
+        matches = result.all()
+    return [
+        CustomerSearchResult(**CustomerResponse.from_orm(customer).dict(), score=round(score, 4))
+        for customer, score in matches
+    ]
+
+def upsert_customers(batch: dict, db: Session) -> List[int]:
+    """Inserts or updates customers keyed on their unique code in one statement, returning their ids"""
+    dialect = UPSERT_DIALECTS.get(db.get_bind().dialect.name)
+    if dialect is None:
+        raise HTTPException(status_code=500, detail="Customer import requires PostgreSQL or SQLite")
+
+    statement = dialect.insert(Customer).values(list(batch.values()))
+    statement = statement.on_conflict_do_update(
+        index_elements=[Customer.code],
+        index_where=CUSTOMER_IS_LIVE,
+        set_={
+            "name": statement.excluded.name,
+            "phone_number": statement.excluded.phone_number,
+            "date_updated": func.now(),
+        }
+    )
+    customer_ids = list(db.execute(statement.returning(Customer.id)).scalars())
+    db.commit()
+    return customer_ids
+
+def import_customers(file: IO[bytes], filename: str, db: Session, batch_size: Optional[int] = None):
+    """Streams an .xlsx or .csv upload into the customers table in upsert batches"""
+    batch_size = batch_size or get_settings().bulk_chunk_size
+    try:
+        rows = iter_upload_rows(file, filename)
+    except ValueError as error:
+        raise HTTPException(status_code=400, detail=str(error))
+
+    processed, errors, customer_ids = 0, [], []
+    batch, batch_rows = {}, []
+
+    def flush():
+        try:
+            customer_ids.extend(upsert_customers(batch, db))
+        except SQLAlchemyError as error:
+            db.rollback()
+            detail = str(getattr(error, "orig", None) or error)
+            errors.extend({"row": number, "error": detail} for number in batch_rows)
+        batch.clear()
+        batch_rows.clear()
+
+    for number, row in rows:
+        processed += 1
+        try:
+            customer = CustomerCreate.model_validate(row)
+        except ValidationError as error:
+            errors.append({"row": number, "error": str(error)})
+            continue
+        # A code may appear twice in one batch; ON CONFLICT can only touch a row once
+        batch[customer.code] = customer.dict()
+        batch_rows.append(number)
+        if len(batch) >= batch_size:
+            flush()
+    if batch:
+        flush()
+
+    return {"processed": processed, "upserted": len(customer_ids), "errors": errors, "customer_ids": customer_ids}
+
 @router.post("/customers", response_model=CustomerResponse, dependencies=[Depends(verify_token.verify)], tags=["customers"])
-async def create_customer_route(customer: CustomerCreate, db: Session = Depends(get_db)):
+async def create_customer_route(customer: CustomerCreate, db: AsyncSession = Depends(get_async_db)):
     return await create_customer(customer, db)
 
-@router.get("/customers", response_model=List[CustomerResponse], dependencies=[Depends(verify_token.verify)], tags=["customers"])
-async def get_all_customers_route(skip: int = 0, limit: int = 100, db: Session = Depends(get_db)):
+@router.post("/customers/import", response_model=CustomerImportResult, dependencies=[Depends(verify_token.verify)], tags=["customers"])
+async def import_customers_route(
+    file: UploadFile = File(..., description="Excel (.xlsx) or CSV file with name, code and phone_number columns"),
+    batch_size: Optional[int] = Query(None, ge=1, description="Rows per upsert statement"),
+    db: Session = Depends(get_db)
+):
+    # Parsing and upserting are blocking, keep them off the event loop
+    result = await run_in_threadpool(import_customers, file.file, file.filename or "", db, batch_size)
+    await get_cache().delete(*(customer_cache_key(customer_id) for customer_id in result["customer_ids"]))
+    customer_search_index.mark_stale()
+    return result
+
+@router.get("/customers", response_model=Union[List[CustomerResponse], CustomerPage], dependencies=[Depends(verify_token.verify)], tags=["customers"])
+async def get_all_customers_route(
+    skip: int = 0,
+    limit: int = 100,
+    cursor: Optional[str] = Query(None, description="Keyset cursor; pass an empty value for the first page"),
+    db: AsyncSession = Depends(get_read_db)
+):
+    if cursor is not None:
+        return await get_customers_page(cursor, limit, db)
     return await get_all_customers(skip, limit, db)
 
+@router.post("/customers/lookup", response_model=CustomerLookupResult, dependencies=[Depends(verify_token.verify)], tags=["customers"])
+async def lookup_customers_route(lookup: CustomerLookup, db: AsyncSession = Depends(get_read_db)):
+    return await lookup_customers(lookup, db)
+
+@router.get("/customers/search", response_model=List[CustomerSearchResult], dependencies=[Depends(verify_token.verify)], tags=["customers"])
+async def search_customers_route(
+    q: str = Query(..., min_length=1, max_length=100, description="Text to match against name and code"),
+    mode: Literal["prefix", "fuzzy"] = Query("prefix", description="Prefix match, or trigram similarity"),
+    limit: int = Query(20, ge=1, le=100, description="Maximum number of results"),
+    db: AsyncSession = Depends(get_async_db)
+):
+    return await search_customers(q, mode, limit, db)
+
 @router.get("/customers/{customer_id}", response_model=CustomerResponse, dependencies=[Depends(verify_token.verify)], tags=["customers"])
-async def get_customer_route(customer_id: int, db: Session = Depends(get_db)):
-    return await get_customer(customer_id, db)
+async def get_customer_route(customer_id: int, request: Request, db: AsyncSession = Depends(get_async_db)):
+    return etag_response(request, await get_customer_json(customer_id, db))
+
+@router.get("/customers/{customer_id}/orders", response_model=CustomerOrdersPage, dependencies=[Depends(verify_token.verify)], tags=["customers"])
+async def get_customer_orders_route(
+    customer_id: int,
+    start_date: Optional[str] = Query(None, description="Earliest order date (format: yyyy.mm.dd)", example="2024.01.01"),
+    end_date: Optional[str] = Query(None, description="Latest order date (format: yyyy.mm.dd)", example="2024.12.31"),
+    cursor: Optional[str] = Query(None, description="Keyset cursor from the previous page"),
+    limit: int = Query(CUSTOMER_ORDERS_PAGE_SIZE, ge=1, le=1000, description="Orders per page"),
+    summary: bool = Query(False, description="Embed lifetime order count, spend and last order time"),
+    db: AsyncSession = Depends(get_async_db)
+):
+    return await get_customer_orders(customer_id, db, start_date, end_date, cursor, limit, summary)
 
 @router.put("/customers/{customer_id}", response_model=CustomerResponse, dependencies=[Depends(verify_token.verify)], tags=["customers"])
-async def update_customer_route(customer_id: int, customer: CustomerUpdate, db: Session = Depends(get_db)):
+async def update_customer_route(customer_id: int, customer: CustomerUpdate, db: AsyncSession = Depends(get_async_db)):
     return await update_customer(customer_id, customer, db)
 
 @router.delete("/customers/{customer_id}", dependencies=[Depends(verify_token.verify)], tags=["customers"])
-async def delete_customer_route(customer_id: int, db: Session = Depends(get_db)):
+async def delete_customer_route(customer_id: int, db: AsyncSession = Depends(get_async_db)):
     return await delete_customer(customer_id, db)
\ No newline at end of file
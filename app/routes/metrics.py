@@ -0,0 +1,23 @@
+from fastapi import APIRouter, Depends
+from fastapi.responses import PlainTextResponse
+
+from app.db import pool_metrics
+from app.utils.cache import get_cache
+from app.utils.profiling import profiling_metrics
+from app.utils.utils import get_token_verifier
+
+router = APIRouter()
+verify_token = get_token_verifier()
+
+@router.get("/metrics/db", dependencies=[Depends(verify_token.verify)], tags=["metrics"])
+async def get_db_pool_metrics_route():
+    return {name: metrics.snapshot() for name, metrics in pool_metrics.items()}
+
+@router.get("/metrics/cache", dependencies=[Depends(verify_token.verify)], tags=["metrics"])
+async def get_cache_metrics_route():
+    cache = get_cache()
+    return {"backend": type(cache).__name__, **cache.stats.snapshot()}
+
+@router.get("/metrics/prometheus", response_class=PlainTextResponse, dependencies=[Depends(verify_token.verify)], tags=["metrics"])
+async def get_prometheus_metrics_route():
+    return PlainTextResponse(profiling_metrics.render(), media_type="text/plain; version=0.0.4")
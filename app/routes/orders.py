@@ -1,19 +1,54 @@
-from datetime import datetime
-from typing import List
+import asyncio
+import json
+import logging
+from datetime import date, datetime
+from typing import Any, Dict, Iterable, List, Literal, Optional, Tuple, Union
 
-from fastapi import APIRouter, Depends, HTTPException, Query
-from pydantic import BaseModel
-from sqlalchemy import and_
+from fastapi import (APIRouter, Body, Depends, File, Header, HTTPException,
+                     Query, Request, UploadFile, WebSocket)
+from fastapi.encoders import jsonable_encoder
+from fastapi.security import HTTPAuthorizationCredentials, SecurityScopes
+from fastapi.responses import JSONResponse, Response, StreamingResponse
+from fastapi.websockets import WebSocketDisconnect, WebSocketState
+from pydantic import BaseModel, Field, ValidationError
+from sqlalchemy import (and_, case, delete, func, insert, or_, select, tuple_,
+                        update)
+from sqlalchemy.exc import IntegrityError, SQLAlchemyError
+from sqlalchemy.ext.asyncio import AsyncSession
 from sqlalchemy.orm import Session
 
-from app.db import SessionLocal
-from app.utils.sms_sender import send_sms
-from app.utils.utils import VerifyToken
+from app.config import get_settings
+from app.db import SessionLocal, get_async_db, get_read_db
+from app.utils.cache import etag_response, get_cache
+from app.utils.export import dumps, encode_csv, encode_ndjson, order_dicts
+from app.utils.idempotency import (get_stored_response, remember_response,
+                                   request_fingerprint, store_response)
+from app.utils.order_feed import get_order_feed
+from app.utils.pagination import decode_cursor, keyset_page
+from app.utils.profiling import profile_phase
+from app.utils.rollups import (add_to_daily_rollups, refresh_daily_rollups,
+                               truncate_to_period)
+from app.utils.search import escape_like, order_item_search_index
+from app.utils.sms_queue import get_sms_queue
+from app.utils.soft_delete import CUSTOMER_IS_LIVE, ORDER_IS_LIVE, ROLLUP_IS_LIVE
+from app.utils.utils import get_token_verifier
 
-from ..models.models import Customer, Order
+from ..models.models import Customer, Order, OrderDailyRollup
 
+logger = logging.getLogger(__name__)
 router = APIRouter()
-verify_token = VerifyToken()
+verify_token = get_token_verifier()
+
+# Keys per type in one batch lookup, so a single request cannot build an unbounded IN list
+LOOKUP_MAX_KEYS = 1000
+# Customer ids per existence check in a bulk insert, so the IN list stays bounded however large the upload
+BULK_CUSTOMER_CHUNK = 250
+# Bytes per read of an NDJSON upload
+NDJSON_READ_SIZE = 64 * 1024
+# WebSocket subprotocol that carries the token as the next offered protocol, for browsers that cannot set headers
+FEED_TOKEN_PROTOCOL = "bearer"
+# Seconds a feed WebSocket has to send its token as the first message
+FEED_AUTH_TIMEOUT = 5.0
 
 class OrderCreate(BaseModel):
     customer_id: int
@@ -26,6 +61,19 @@ class OrderUpdate(BaseModel):
     amount: float
     time: datetime
 
+class OrderPatch(BaseModel):
+    item: Optional[str] = None
+    amount: Optional[float] = None
+    time: Optional[datetime] = None
+
+class OrderBatchPatch(OrderPatch):
+    id: int
+
+class OrderBatchPatchResult(BaseModel):
+    updated: int
+    order_ids: List[int]
+    missing: List[int]
+
 class OrderResponse(BaseModel):
     id: int
     customer_id: int
@@ -48,16 +96,63 @@ class OrderResponse(BaseModel):
             formatted_time=obj.time.strftime("%Y-%m-%d %H:%M:%S")
         )
 
-def get_db():
-    db = SessionLocal()
-    try:
-        yield db
-    finally:
-        db.close()
+class OrderPage(BaseModel):
+    items: List[OrderResponse]
+    next_cursor: Optional[str] = None
+
+class BulkOrderError(BaseModel):
+    index: int
+    error: str
+
+class BulkOrderResult(BaseModel):
+    inserted: int
+    order_ids: List[int]
+    errors: List[BulkOrderError]
+
+class OrderSearchResult(OrderResponse):
+    score: float
+
+class OrderLookup(BaseModel):
+    ids: List[int] = Field(default_factory=list, max_length=LOOKUP_MAX_KEYS)
+
+class OrderLookupResult(BaseModel):
+    items: List[OrderResponse]
+    missing: OrderLookup
 
-async def create_order(order: OrderCreate, db: Session):
-    db_customer = db.query(Customer).filter(Customer.id == order.customer_id).first()
-    if db_customer is None:
+class OrderStatsBucket(BaseModel):
+    key: Union[int, str]
+    count: int
+    sum: float
+    avg: float
+    min: float
+    max: float
+
+class OrderStats(BaseModel):
+    group_by: str
+    source: str
+    buckets: List[OrderStatsBucket]
+    total: Optional[OrderStatsBucket] = None
+
+DATE_RANGE_PAGE_SIZE = 100
+EXPORT_CHUNK_SIZE = 1000
+ORDER_RESPONSE_COLUMNS = (Order.id, Order.customer_id, Order.item, Order.amount, Order.time)
+EXPORT_FORMATS = {
+    "ndjson": (encode_ndjson, "application/x-ndjson"),
+    "csv": (encode_csv, "text/csv"),
+}
+
+def replayed_response(body: Any) -> JSONResponse:
+    return JSONResponse(content=body, headers={"Idempotent-Replayed": "true"})
+
+async def create_order(order: OrderCreate, db: AsyncSession, idempotency_key: Optional[str] = None):
+    if idempotency_key is not None:
+        fingerprint = request_fingerprint(order)
+        stored = await get_stored_response(idempotency_key, fingerprint, db)
+        if stored is not None:
+            return replayed_response(stored)
+
+    db_customer = await db.get(Customer, order.customer_id)
+    if db_customer is None or db_customer.deleted_at is not None:
         raise HTTPException(status_code=404, detail="Customer not found")
 
     db_order = Order(
@@ -66,87 +161,607 @@ async def create_order(order: OrderCreate, db: Session):
         amount=order.amount,
         time=order.time
     )
-    db.add(db_order)
-    db.commit()
-    db.refresh(db_order)
+    try:
+        db.add(db_order)
+        await db.flush()
+        await add_to_daily_rollups(db, [db_order])
+        await get_sms_queue().stage(db, [(str(db_customer.phone_number), order_message(order))])
+        if idempotency_key is not None:
+            # Stored in the order's transaction, so a retry sees both or neither
+            await db.refresh(db_order)
+            body = store_response(idempotency_key, fingerprint, {"order": db_order, "sms_response": {"status": "queued"}},
+                                  get_settings().idempotency_ttl, db)
+        await db.commit()
+    except IntegrityError:
+        if idempotency_key is None:
+            raise
+        # A concurrent retry with the same key committed first, whether we collided
+        # with it while writing or at commit; its order stands
+        await db.rollback()
+        stored = await get_stored_response(idempotency_key, fingerprint, db)
+        if stored is None:
+            raise
+        return replayed_response(stored)
+    await db.refresh(db_order)
+    order_item_search_index.add(db_order.item, (db_order.item,))
+    if idempotency_key is not None:
+        await remember_response(idempotency_key, fingerprint, body)
+
+    await get_order_feed().publish("order.created", [order_row(db_order)])
+
+    return {"order": db_order, "sms_response": {"status": "queued"}}
+
+def order_row(order: Order) -> tuple:
+    return order.id, order.customer_id, order.item, order.amount, order.time
+
+def order_message(order) -> str:
+    return f"New order placed: {order.item} for ${order.amount:.2f}"
+
+def validate_bulk_rows(rows: Iterable[Any], start: int = 0) -> Tuple[List[Tuple[int, OrderCreate]], List[dict]]:
+    """Validates raw rows (dicts or NDJSON lines) one by one so a bad row only fails itself"""
+    valid, errors = [], []
+    for index, row in enumerate(rows, start):
+        if isinstance(row, (str, bytes)) and not row.strip():
+            continue
+        try:
+            if isinstance(row, (str, bytes)):
+                valid.append((index, OrderCreate.model_validate_json(row)))
+            else:
+                valid.append((index, OrderCreate.model_validate(row)))
+        except ValidationError as error:
+            errors.append({"index": index, "error": str(error)})
+    return valid, errors
+
+async def read_bulk_ndjson(file: UploadFile, read_size: int = NDJSON_READ_SIZE):
+    """Validates an NDJSON upload a read at a time instead of loading the whole file first"""
+    rows, errors = [], []
+    index, pending = 0, b""
+    while chunk := await file.read(read_size):
+        # The last piece may be a partial line, it is completed by the next read
+        *lines, pending = (pending + chunk).split(b"\n")
+        valid, invalid = validate_bulk_rows(lines, index)
+        rows.extend(valid)
+        errors.extend(invalid)
+        index += len(lines)
+    valid, invalid = validate_bulk_rows([pending], index)
+    return rows + valid, errors + invalid
 
-    message = f"New order placed: {order.item} for ${order.amount:.2f}"
-    sms_response = send_sms(str(db_customer.phone_number), message)  # Convert to string
+async def create_orders_bulk(rows: List[Tuple[int, OrderCreate]], db: AsyncSession,
+                             chunk_size: Optional[int] = None, errors: Optional[List[dict]] = None):
+    chunk_size = chunk_size or get_settings().bulk_chunk_size
+    errors = list(errors or [])
 
-    return {"order": db_order, "sms_response": sms_response}
+    customer_ids = sorted({order.customer_id for _, order in rows})
+    phone_numbers: Dict[int, Any] = {}
+    for start in range(0, len(customer_ids), BULK_CUSTOMER_CHUNK):
+        result = await db.execute(select(Customer.id, Customer.phone_number).where(
+            Customer.id.in_(customer_ids[start:start + BULK_CUSTOMER_CHUNK]), CUSTOMER_IS_LIVE
+        ))
+        phone_numbers.update(result.all())
 
-async def get_orders(skip: int, limit: int, db: Session):
-    return db.query(Order).offset(skip).limit(limit).all()
+    pending = []
+    for index, order in rows:
+        if order.customer_id not in phone_numbers:
+            errors.append({"index": index, "error": "Customer not found"})
+        else:
+            pending.append((index, order))
 
-async def search_orders_by_date_range(start_date: str, end_date: str, db: Session):
+    order_ids: List[int] = []
+    sms_queue = get_sms_queue()
+    statement = insert(Order).returning(Order.id, sort_by_parameter_order=True)
+    for start in range(0, len(pending), chunk_size):
+        chunk = pending[start:start + chunk_size]
+        try:
+            result = await db.execute(statement, [order.dict() for _, order in chunk])
+            chunk_ids = list(result.scalars())
+            await add_to_daily_rollups(db, (order for _, order in chunk))
+            await sms_queue.stage(db, (
+                (str(phone_numbers[order.customer_id]), order_message(order)) for _, order in chunk
+            ))
+            await db.commit()
+        except SQLAlchemyError as error:
+            await db.rollback()
+            detail = str(getattr(error, "orig", None) or error)
+            errors.extend({"index": index, "error": detail} for index, _ in chunk)
+            continue
+
+        order_ids.extend(chunk_ids)
+        for item in {order.item for _, order in chunk}:
+            order_item_search_index.add(item, (item,))
+        await get_order_feed().publish("order.created", (
+            (order_id, order.customer_id, order.item, order.amount, order.time)
+            for order_id, (_, order) in zip(chunk_ids, chunk)
+        ))
+
+    errors.sort(key=lambda error: error["index"])
+    return {"inserted": len(order_ids), "order_ids": order_ids, "errors": errors}
+
+async def get_orders(skip: int, limit: int, db: AsyncSession):
+    result = await db.execute(select(Order).where(ORDER_IS_LIVE).offset(skip).limit(limit))
+    return result.scalars().all()
+
+async def get_orders_page(cursor: Optional[str], limit: int, db: AsyncSession):
+    query = select(Order).where(ORDER_IS_LIVE).order_by(Order.id)
+    if cursor:
+        (last_id,) = decode_cursor(cursor, int)
+        query = query.where(Order.id > last_id)
+    result = await db.execute(query.limit(limit + 1))
+    return keyset_page(result.scalars().all(), limit, lambda order: (order.id,))
+
+def parse_date_range(start_date: str, end_date: str):
     try:
         start_datetime = datetime.strptime(start_date, "%Y.%m.%d")
         end_datetime = datetime.strptime(end_date, "%Y.%m.%d").replace(hour=23, minute=59, second=59)
     except ValueError:
         raise HTTPException(status_code=400, detail="Invalid date format. Use yyyy.mm.dd")
+    return start_datetime, end_datetime
+
+async def search_orders_by_date_range(start_date: str, end_date: str, db: AsyncSession,
+                                      limit: Optional[int] = None, cursor: Optional[str] = None):
+    """Orders in the range as OrderResponse-shaped dicts.
 
-    orders = db.query(Order).filter(
+    Selects plain columns, so no ORM objects or identity map entries are
+    built; the route encodes the dicts directly without response_model validation.
+    """
+    start_datetime, end_datetime = parse_date_range(start_date, end_date)
+
+    # Plain range bounds on time let a partitioned orders table prune to the months in range
+    query = select(*ORDER_RESPONSE_COLUMNS).where(
         and_(
             Order.time >= start_datetime,
             Order.time <= end_datetime
-        )
-    ).all()
+        ),
+        ORDER_IS_LIVE
+    )
 
-    if not orders:
+    if cursor is not None:
+        page_size = limit or DATE_RANGE_PAGE_SIZE
+        query = query.order_by(Order.time, Order.id)
+        if cursor:
+            last_time, last_id = decode_cursor(cursor, datetime, int)
+            query = query.where(tuple_(Order.time, Order.id) > tuple_(last_time, last_id))
+        with profile_phase("query"):
+            result = await db.execute(query.limit(page_size + 1))
+            page = keyset_page(result.all(), page_size, lambda row: (row.time, row.id))
+        with profile_phase("serialize"):
+            page["items"] = order_dicts(page["items"])
+        return page
+
+    if limit is not None:
+        query = query.order_by(Order.time, Order.id).limit(limit)
+    with profile_phase("query"):
+        rows = (await db.execute(query)).all()
+
+    if not rows:
         raise HTTPException(status_code=404, detail="No orders found in the specified date range")
 
-    return [OrderResponse.from_orm(order) for order in orders]
+    with profile_phase("serialize"):
+        return order_dicts(rows)
+
+def iter_orders_by_date_range(start_datetime: datetime, end_datetime: datetime, db: Session,
+                              chunk_size: int = EXPORT_CHUNK_SIZE):
+    """Streams plain column tuples in chunks through a server-side cursor"""
+    return db.query(*ORDER_RESPONSE_COLUMNS).filter(
+        and_(
+            Order.time >= start_datetime,
+            Order.time <= end_datetime
+        ),
+        ORDER_IS_LIVE
+    ).order_by(Order.time, Order.id).yield_per(chunk_size)
+
+def export_orders_by_date_range(start_date: str, end_date: str, export_format: str, session_factory=SessionLocal):
+    start_datetime, end_datetime = parse_date_range(start_date, end_date)
+    encoder, media_type = EXPORT_FORMATS[export_format]
+
+    # The session must outlive the route, so the stream owns it rather than a dependency
+    def generate():
+        with session_factory() as db:
+            yield from encoder(iter_orders_by_date_range(start_datetime, end_datetime, db), EXPORT_CHUNK_SIZE)
+
+    filename = f"orders_{start_datetime:%Y%m%d}_{end_datetime:%Y%m%d}.{export_format}"
+    return StreamingResponse(
+        generate(),
+        media_type=media_type,
+        headers={"Content-Disposition": f'attachment; filename="{filename}"'}
+    )
+
+async def get_order_stats(start_date: str, end_date: str, group_by: str, source: str, db: AsyncSession):
+    """Order count/sum/avg/min/max per period, customer or item
+
+    The rollup source reads the daily rollup table; the orders source aggregates
+    live rows over the time/amount index.
+    """
+    start_datetime, end_datetime = parse_date_range(start_date, end_date)
+    dialect_name = db.get_bind().dialect.name
+
+    if source == "rollup":
+        table = OrderDailyRollup
+        groups = {"customer": table.customer_id, "item": table.item}
+        key = groups.get(group_by)
+        if key is None:
+            key = truncate_to_period(table.day, group_by, dialect_name)
+        query = select(
+            key, func.sum(table.order_count), func.sum(table.total_amount),
+            func.min(table.min_amount), func.max(table.max_amount)
+        ).where(table.day >= start_datetime.date(), table.day <= end_datetime.date(), ROLLUP_IS_LIVE)
+    else:
+        groups = {"customer": Order.customer_id, "item": Order.item}
+        key = groups.get(group_by)
+        if key is None:
+            key = truncate_to_period(Order.time, group_by, dialect_name)
+        query = select(
+            key, func.count(Order.id), func.sum(Order.amount), func.min(Order.amount), func.max(Order.amount)
+        ).where(Order.time >= start_datetime, Order.time <= end_datetime, ORDER_IS_LIVE)
+
+    rows = (await db.execute(query.group_by(key).order_by(key))).all()
+    buckets = [
+        {"key": group.isoformat() if isinstance(group, date) else group, "count": count, "sum": total,
+         "avg": total / count, "min": low, "max": high}
+        for group, count, total, low, high in rows if count
+    ]
+
+    total = None
+    if buckets:
+        count = sum(bucket["count"] for bucket in buckets)
+        amount = sum(bucket["sum"] for bucket in buckets)
+        total = {"key": "total", "count": count, "sum": amount, "avg": amount / count,
+                 "min": min(bucket["min"] for bucket in buckets),
+                 "max": max(bucket["max"] for bucket in buckets)}
 
-async def get_order(order_id: int, db: Session):
-    order = db.query(Order).filter(Order.id == order_id).first()
+    return {"group_by": group_by, "source": source, "buckets": buckets, "total": total}
+
+async def search_orders_in_memory(q: str, mode: str, limit: int, db: AsyncSession):
+    if order_item_search_index.stale:
+        version = order_item_search_index.version
+        result = await db.execute(select(Order.item).distinct())
+        order_item_search_index.rebuild(((item, (item,)) for item in result.scalars() if item), version)
+    # Every order of a matching item shares its score, so the best `limit` items hold the
+    # best orders; the page can still come up short once deleted customers' orders are filtered
+    item_scores = dict(order_item_search_index.search(q, mode, limit))
+    if not item_scores:
+        return []
+    score = case(item_scores, value=Order.item, else_=0.0)
+    result = await db.execute(
+        select(*ORDER_RESPONSE_COLUMNS, score.label("score"))
+        .where(Order.item.in_(item_scores), ORDER_IS_LIVE)
+        .order_by(score.desc(), Order.time.desc(), Order.id.desc())
+        .limit(limit)
+    )
+    return result.all()
+
+async def search_orders(q: str, mode: str, limit: int, db: AsyncSession):
+    """Orders whose item matches, best match then newest first; pg_trgm on PostgreSQL, an in-process index elsewhere"""
+    if db.get_bind().dialect.name != "postgresql":
+        rows = await search_orders_in_memory(q, mode, limit, db)
+    else:
+        q = q.strip()
+        score = func.similarity(Order.item, q)
+        if mode == "prefix":
+            condition = Order.item.ilike(escape_like(q) + "%", escape="\\")
+            score = case((func.lower(Order.item) == q.lower(), 1.0), else_=score)
+        else:
+            condition = or_(Order.item.op("%")(q), Order.item.ilike(f"%{escape_like(q)}%", escape="\\"))
+        result = await db.execute(
+            select(*ORDER_RESPONSE_COLUMNS, score.label("score"))
+            .where(condition, ORDER_IS_LIVE)
+            .order_by(score.desc(), Order.time.desc(), Order.id.desc())
+            .limit(limit)
+        )
+        rows = result.all()
+    orders = order_dicts(row[:5] for row in rows)
+    for order, row in zip(orders, rows):
+        order["score"] = round(row.score, 4)
+    return orders
+
+async def get_order(order_id: int, db: AsyncSession):
+    result = await db.execute(select(Order).where(Order.id == order_id, ORDER_IS_LIVE))
+    order = result.scalar_one_or_none()
     if order is None:
         raise HTTPException(status_code=404, detail="Order not found")
     return order
 
-async def update_order(order_id: int, order: OrderUpdate, db: Session):
-    db_order = db.query(Order).filter(Order.id == order_id).first()
-    if db_order is None:
-        raise HTTPException(status_code=404, detail="Order not found")
+async def lookup_orders(lookup: OrderLookup, db: AsyncSession):
+    """Orders for the requested ids in one query, in request order, with the ids that matched nothing"""
+    ids = list(dict.fromkeys(lookup.ids))
+    rows = {}
+    if ids:
+        result = await db.execute(select(*ORDER_RESPONSE_COLUMNS).where(Order.id.in_(ids), ORDER_IS_LIVE))
+        rows = {row[0]: row for row in result}
+    return {
+        "items": order_dicts(rows[order_id] for order_id in ids if order_id in rows),
+        "missing": {"ids": [order_id for order_id in ids if order_id not in rows]},
+    }
+
+def order_cache_key(order_id: int) -> str:
+    return f"order:{order_id}"
+
+async def get_order_json(order_id: int, db: AsyncSession) -> str:
+    """Serialised order, read through the cache"""
+    cache = get_cache()
+    body = await cache.get(order_cache_key(order_id))
+    if body is None:
+        order = await get_order(order_id, db)
+        body = json.dumps(jsonable_encoder(order), ensure_ascii=False, separators=(",", ":"))
+        await cache.set(order_cache_key(order_id), body)
+    return body
+
+async def update_order_returning(order_id: int, values: Dict[str, Any], db: AsyncSession):
+    """Applies `values` and returns (order, previous (day, customer_id, item) bucket), or None"""
+    if db.get_bind().dialect.name == "postgresql":
+        # The locked self-join reads the row as it was before the UPDATE, in the same statement
+        previous_orders = Order.__table__.alias("previous_orders")
+        previous = select(previous_orders.c.id, previous_orders.c.time, previous_orders.c.customer_id,
+                          previous_orders.c.item).where(previous_orders.c.id == order_id).with_for_update().subquery()
+        result = await db.execute(
+            update(Order).where(Order.id == previous.c.id, ORDER_IS_LIVE).values(**values)
+            .returning(Order, previous.c.time, previous.c.customer_id, previous.c.item)
+        )
+        row = result.first()
+        if row is None:
+            return None
+        return row[0], (row[1].date(), row[2], row[3])
+
+    # SQLite's RETURNING cannot see other tables, so the previous bucket takes a SELECT
+    result = await db.execute(
+        select(Order.time, Order.customer_id, Order.item).where(Order.id == order_id, ORDER_IS_LIVE)
+    )
+    previous = result.first()
+    if previous is None:
+        return None
+    result = await db.execute(update(Order).where(Order.id == order_id).values(**values).returning(Order))
+    return result.scalar_one(), (previous.time.date(), previous.customer_id, previous.item)
 
-    for key, value in order.dict().items():
-        setattr(db_order, key, value)
+async def update_order(order_id: int, order: Union[OrderUpdate, OrderPatch], db: AsyncSession):
+    values = order.dict(exclude_unset=True, exclude_none=True)
+    if not values:
+        return await get_order(order_id, db)
+    updated = await update_order_returning(order_id, values, db)
+    if updated is None:
+        raise HTTPException(status_code=404, detail="Order not found")
 
-    db.commit()
-    db.refresh(db_order)
+    db_order, previous_bucket = updated
+    await refresh_daily_rollups(db, [previous_bucket, (db_order.time.date(), db_order.customer_id, db_order.item)])
+    await db.commit()
+    await get_cache().delete(order_cache_key(order_id))
+    order_item_search_index.add(db_order.item, (db_order.item,))
+    await get_order_feed().publish("order.updated", [order_row(db_order)])
     return db_order
 
-async def delete_order(order_id: int, db: Session):
-    db_order = db.query(Order).filter(Order.id == order_id).first()
-    if db_order is None:
+async def update_orders_batch(patches: List[OrderBatchPatch], db: AsyncSession):
+    """Partial updates for many orders: one SELECT for the rows they touch and one
+    executemany UPDATE; later patches for the same id win field by field"""
+    values: Dict[int, Dict[str, Any]] = {}
+    for patch in patches:
+        values.setdefault(patch.id, {}).update(patch.dict(exclude_unset=True, exclude_none=True, exclude={"id"}))
+
+    previous = {}
+    if values:
+        result = await db.execute(select(*ORDER_RESPONSE_COLUMNS).where(
+            Order.id.in_(values), ORDER_IS_LIVE
+        ).with_for_update())
+        previous = {row.id: row for row in result}
+
+    updated = [(previous[order_id], changes) for order_id, changes in values.items()
+               if order_id in previous and changes]
+    rows = [
+        (row.id, row.customer_id, changes.get("item", row.item), changes.get("amount", row.amount),
+         changes.get("time", row.time))
+        for row, changes in updated
+    ]
+    if updated:
+        # ORM bulk UPDATE by primary key, sent as executemany per set of changed columns
+        await db.execute(update(Order), [{"id": row.id, **changes} for row, changes in updated])
+        buckets = [(row.time.date(), row.customer_id, row.item) for row, _ in updated]
+        buckets.extend((order_time.date(), customer_id, item) for _, customer_id, item, _, order_time in rows)
+        await refresh_daily_rollups(db, buckets)
+    await db.commit()
+
+    cache = get_cache()
+    for order_id, _, item, _, _ in rows:
+        await cache.delete(order_cache_key(order_id))
+        order_item_search_index.add(item, (item,))
+    await get_order_feed().publish("order.updated", rows)
+    return {
+        "updated": len(rows),
+        "order_ids": [row[0] for row in rows],
+        "missing": [order_id for order_id in values if order_id not in previous],
+    }
+
+async def delete_order(order_id: int, db: AsyncSession):
+    result = await db.execute(
+        delete(Order).where(Order.id == order_id, ORDER_IS_LIVE).returning(*ORDER_RESPONSE_COLUMNS)
+    )
+    row = result.first()
+    if row is None:
         raise HTTPException(status_code=404, detail="Order not found")
-    db.delete(db_order)
-    db.commit()
+    await refresh_daily_rollups(db, [(row.time.date(), row.customer_id, row.item)])
+    await db.commit()
+    await get_cache().delete(order_cache_key(order_id))
+    order_item_search_index.mark_stale()
+    await get_order_feed().publish("order.deleted", [tuple(row)])
     return {"message": "Order deleted successfully"}
 
 @router.post("/orders", dependencies=[Depends(verify_token.verify)], tags=["orders"])
-async def create_order_route(order: OrderCreate, db: Session = Depends(get_db)):
-    return await create_order(order, db)
+async def create_order_route(
+    order: OrderCreate,
+    idempotency_key: Optional[str] = Header(None, max_length=255, description="Client-generated key; retries with the same key return the first response"),
+    db: AsyncSession = Depends(get_async_db)
+):
+    return await create_order(order, db, idempotency_key)
+
+@router.post("/orders/bulk", response_model=BulkOrderResult, dependencies=[Depends(verify_token.verify)], tags=["orders"])
+async def create_orders_bulk_route(
+    orders: List[Dict[str, Any]] = Body(..., description="Orders to insert, validated row by row"),
+    chunk_size: Optional[int] = Query(None, ge=1, description="Rows per insert transaction"),
+    db: AsyncSession = Depends(get_async_db)
+):
+    rows, errors = validate_bulk_rows(orders)
+    return await create_orders_bulk(rows, db, chunk_size, errors)
+
+@router.post("/orders/bulk/ndjson", response_model=BulkOrderResult, dependencies=[Depends(verify_token.verify)], tags=["orders"])
+async def upload_orders_bulk_route(
+    file: UploadFile = File(..., description="NDJSON file with one order per line"),
+    chunk_size: Optional[int] = Query(None, ge=1, description="Rows per insert transaction"),
+    db: AsyncSession = Depends(get_async_db)
+):
+    rows, errors = await read_bulk_ndjson(file)
+    return await create_orders_bulk(rows, db, chunk_size, errors)
 
 @router.get("/orders", dependencies=[Depends(verify_token.verify)], tags=["orders"])
-async def get_orders_route(skip: int = 0, limit: int = 10, db: Session = Depends(get_db)):
+async def get_orders_route(
+    skip: int = 0,
+    limit: int = 10,
+    cursor: Optional[str] = Query(None, description="Keyset cursor; pass an empty value for the first page"),
+    db: AsyncSession = Depends(get_read_db)
+):
+    if cursor is not None:
+        return await get_orders_page(cursor, limit, db)
     return await get_orders(skip, limit, db)
 
-@router.get("/orders/date_range", response_model=List[OrderResponse], dependencies=[Depends(verify_token.verify)], tags=["orders"])
+@router.get("/orders/date_range", response_model=Union[List[OrderResponse], OrderPage], dependencies=[Depends(verify_token.verify)], tags=["orders"])
 async def search_orders_by_date_range_route(
     start_date: str = Query(..., description="Start date for the search range (format: yyyy.mm.dd)", example="2024.01.01"),
     end_date: str = Query(..., description="End date for the search range (format: yyyy.mm.dd)", example="2024.12.31"),
-    db: Session = Depends(get_db)
+    limit: Optional[int] = Query(None, ge=1, description="Maximum number of orders to return"),
+    cursor: Optional[str] = Query(None, description="Keyset cursor; pass an empty value for the first page"),
+    db: AsyncSession = Depends(get_read_db)
 ):
-    return await search_orders_by_date_range(start_date, end_date, db)
+    result = await search_orders_by_date_range(start_date, end_date, db, limit, cursor)
+    with profile_phase("encode"):
+        return Response(content=dumps(result), media_type="application/json")
+
+@router.get("/orders/date_range/export", dependencies=[Depends(verify_token.verify)], tags=["orders"])
+async def export_orders_by_date_range_route(
+    start_date: str = Query(..., description="Start date for the export range (format: yyyy.mm.dd)", example="2024.01.01"),
+    end_date: str = Query(..., description="End date for the export range (format: yyyy.mm.dd)", example="2024.12.31"),
+    format: Literal["ndjson", "csv"] = Query("ndjson", description="Export format")
+):
+    return export_orders_by_date_range(start_date, end_date, format)
+
+@router.get("/orders/stats", response_model=OrderStats, dependencies=[Depends(verify_token.verify)], tags=["orders"])
+async def get_order_stats_route(
+    start_date: str = Query(..., description="Start date for the stats range (format: yyyy.mm.dd)", example="2024.01.01"),
+    end_date: str = Query(..., description="End date for the stats range (format: yyyy.mm.dd)", example="2024.12.31"),
+    group_by: Literal["day", "week", "month", "customer", "item"] = Query("day", description="Grouping for the buckets"),
+    source: Literal["rollup", "orders"] = Query("rollup", description="Read the daily rollups or aggregate live orders"),
+    db: AsyncSession = Depends(get_async_db)
+):
+    return await get_order_stats(start_date, end_date, group_by, source, db)
+
+@router.get("/orders/search", response_model=List[OrderSearchResult], dependencies=[Depends(verify_token.verify)], tags=["orders"])
+async def search_orders_route(
+    q: str = Query(..., min_length=1, max_length=100, description="Text to match against the item"),
+    mode: Literal["prefix", "fuzzy"] = Query("prefix", description="Prefix match, or trigram similarity"),
+    limit: int = Query(20, ge=1, le=100, description="Maximum number of results"),
+    db: AsyncSession = Depends(get_async_db)
+):
+    return Response(content=dumps(await search_orders(q, mode, limit, db)), media_type="application/json")
+
+def encode_sse(event: Optional[dict]) -> bytes:
+    if event is None:
+        return b": keepalive\n\n"
+    event_id = f"id: {event['id']}\n" if "id" in event else ""
+    return f"{event_id}event: {event['type']}\ndata: ".encode() + dumps(event) + b"\n\n"
+
+async def stream_order_feed(customer_id: Optional[int], last_event_id: Optional[int]):
+    async for event in get_order_feed().subscribe(customer_id, last_event_id, get_settings().order_feed_heartbeat):
+        yield encode_sse(event)
+
+@router.get("/orders/feed", dependencies=[Depends(verify_token.verify)], tags=["orders"])
+async def order_feed_route(
+    customer_id: Optional[int] = Query(None, description="Only events for this customer's orders"),
+    last_event_id: Optional[int] = Query(None, description="Resume after this event id"),
+    last_event_id_header: Optional[int] = Header(None, alias="Last-Event-ID")
+):
+    """Server-Sent Events for created, updated and deleted orders; browsers resume via Last-Event-ID"""
+    resume_after = last_event_id if last_event_id is not None else last_event_id_header
+    return StreamingResponse(
+        stream_order_feed(customer_id, resume_after),
+        media_type="text/event-stream",
+        # Stops proxies from buffering the stream
+        headers={"Cache-Control": "no-cache", "X-Accel-Buffering": "no"},
+    )
+
+def feed_websocket_token(websocket: WebSocket) -> Tuple[Optional[str], Optional[str]]:
+    """The token from an Authorization header or the `bearer, <token>` subprotocols, and the subprotocol to accept"""
+    authorization = websocket.headers.get("authorization", "")
+    if authorization.lower().startswith("bearer "):
+        return authorization[7:], None
+    protocols = [protocol.strip() for protocol in websocket.headers.get("sec-websocket-protocol", "").split(",")]
+    if len(protocols) == 2 and protocols[0] == FEED_TOKEN_PROTOCOL:
+        return protocols[1], FEED_TOKEN_PROTOCOL
+    return None, None
+
+@router.websocket("/orders/feed/ws")
+async def order_feed_websocket(
+    websocket: WebSocket,
+    customer_id: Optional[int] = None,
+    last_event_id: Optional[int] = None
+):
+    """The same events as JSON messages. Browsers cannot set headers here, so the token comes as the
+    `bearer, <token>` subprotocols or as a first {"token": ...} message; never in the URL, which ends up in logs"""
+    credentials, subprotocol = feed_websocket_token(websocket)
+    try:
+        if credentials is None:
+            await websocket.accept()
+            message = await asyncio.wait_for(websocket.receive_json(), FEED_AUTH_TIMEOUT)
+            credentials = message.get("token") if isinstance(message, dict) else None
+        if not credentials:
+            raise HTTPException(status_code=401, detail="Requires authentication")
+        await verify_token.verify(SecurityScopes(), HTTPAuthorizationCredentials(scheme="Bearer", credentials=credentials))
+    except (HTTPException, asyncio.TimeoutError, KeyError, ValueError):
+        await websocket.close(code=1008)
+        return
+    except WebSocketDisconnect:
+        return
+    if websocket.client_state == WebSocketState.CONNECTING:
+        await websocket.accept(subprotocol)
+
+    async def forward():
+        heartbeat = get_settings().order_feed_heartbeat
+        async for event in get_order_feed().subscribe(customer_id, last_event_id, heartbeat):
+            await websocket.send_text(dumps(event or {"type": "ping"}).decode())
+        # The feed only ends after a resync; the client reconnects with its last event id
+        await websocket.close()
+
+    sender = asyncio.create_task(forward())
+    try:
+        # Nothing more is expected from the client; reading is how a disconnect is noticed
+        while (await websocket.receive())["type"] != "websocket.disconnect":
+            pass
+    finally:
+        sender.cancel()
+        try:
+            await sender
+        except asyncio.CancelledError:
+            pass
+        except Exception:
+            logger.exception("Order feed WebSocket stopped sending")
+
+@router.post("/orders/lookup", response_model=OrderLookupResult, dependencies=[Depends(verify_token.verify)], tags=["orders"])
+async def lookup_orders_route(lookup: OrderLookup, db: AsyncSession = Depends(get_read_db)):
+    return Response(content=dumps(await lookup_orders(lookup, db)), media_type="application/json")
 
 @router.get("/orders/{order_id}", dependencies=[Depends(verify_token.verify)], tags=["orders"])
-async def get_order_route(order_id: int, db: Session = Depends(get_db)):
-    return await get_order(order_id, db)
+async def get_order_route(order_id: int, request: Request, db: AsyncSession = Depends(get_async_db)):
+    # On the primary: a miss fills the shared cache, and a lagging replica's row would be served for the whole TTL
+    return etag_response(request, await get_order_json(order_id, db))
 
 @router.put("/orders/{order_id}", dependencies=[Depends(verify_token.verify)], tags=["orders"])
-async def update_order_route(order_id: int, order: OrderUpdate, db: Session = Depends(get_db)):
+async def update_order_route(order_id: int, order: OrderUpdate, db: AsyncSession = Depends(get_async_db)):
+    return await update_order(order_id, order, db)
+
+@router.patch("/orders", response_model=OrderBatchPatchResult, dependencies=[Depends(verify_token.verify)], tags=["orders"])
+async def update_orders_batch_route(
+    patches: List[OrderBatchPatch] = Body(..., max_length=LOOKUP_MAX_KEYS, description="Order ids with the fields to change"),
+    db: AsyncSession = Depends(get_async_db)
+):
+    return await update_orders_batch(patches, db)
+
+@router.patch("/orders/{order_id}", dependencies=[Depends(verify_token.verify)], tags=["orders"])
+async def patch_order_route(order_id: int, order: OrderPatch, db: AsyncSession = Depends(get_async_db)):
     return await update_order(order_id, order, db)
 
 @router.delete("/orders/{order_id}", dependencies=[Depends(verify_token.verify)], tags=["orders"])
-async def delete_order_route(order_id: int, db: Session = Depends(get_db)):
+async def delete_order_route(order_id: int, db: AsyncSession = Depends(get_async_db)):
     return await delete_order(order_id, db)
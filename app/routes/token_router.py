@@ -1,26 +1,42 @@
+from typing import Optional
+
 import httpx
-from fastapi import APIRouter, HTTPException
+from fastapi import APIRouter, Depends, HTTPException, Request
 from pydantic import BaseModel
 
 from ..config import get_settings
+from ..utils.utils import ClientCredentialsCache
 
 router = APIRouter()
 settings = get_settings()
+token_cache = ClientCredentialsCache(settings.auth_m2m_token_refresh_margin)
 
 class TokenRequest(BaseModel):
     grant_type: str = "client_credentials"
     client_id: str = settings.auth0_client_id
     client_secret: str = settings.auth0_client_secret
     audience: str = settings.auth0_api_audience
+    scope: Optional[str] = None
 
-@router.post("/token")
-async def get_token(request: TokenRequest):
-    token_url = f"https://{settings.auth0_domain}/oauth/token"
+def get_http_client(request: Request) -> httpx.AsyncClient:
+    """The pooled client opened in the app lifespan"""
+    return request.app.state.http_client
 
-    async with httpx.AsyncClient() as client:
-        response = await client.post(token_url, json=request.dict())
+async def fetch_token(request: TokenRequest, client: httpx.AsyncClient) -> dict:
+    token_url = f"https://{settings.auth0_domain}/oauth/token"
+    response = await client.post(token_url, json=request.dict(exclude_none=True))
 
     if response.status_code == 200:
         return response.json()
     else:
         raise HTTPException(status_code=response.status_code, detail=response.text)
+
+async def get_token(request: TokenRequest, client: httpx.AsyncClient, cache: ClientCredentialsCache = token_cache):
+    if request.grant_type != "client_credentials":
+        return await fetch_token(request, client)
+    key = cache.key(request.client_id, request.client_secret, request.audience, request.scope)
+    return await cache.get(key, lambda: fetch_token(request, client))
+
+@router.post("/token")
+async def get_token_route(request: TokenRequest, client: httpx.AsyncClient = Depends(get_http_client)):
+    return await get_token(request, client)
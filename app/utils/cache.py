@@ -0,0 +1,120 @@
+import hashlib
+import time
+from collections import OrderedDict
+from functools import lru_cache
+from typing import Callable, Optional
+
+from fastapi import Request, Response
+
+from app.config import get_settings
+from app.utils.shared_state import get_state_client
+
+
+class CacheStats:
+    def __init__(self):
+        self.hits = 0
+        self.misses = 0
+        self.evictions = 0
+
+    def snapshot(self) -> dict:
+        return {"hits": self.hits, "misses": self.misses, "evictions": self.evictions}
+
+
+class MemoryCache:
+    """In-process LRU cache with a per-entry TTL"""
+
+    def __init__(self, max_entries: int = 10000, ttl: float = 60, clock: Callable[[], float] = time.monotonic):
+        self.max_entries = max_entries
+        self.ttl = ttl
+        self.clock = clock
+        self.stats = CacheStats()
+        self._entries: "OrderedDict[str, tuple]" = OrderedDict()
+
+    async def get(self, key: str) -> Optional[str]:
+        entry = self._entries.get(key)
+        if entry is not None and entry[1] <= self.clock():
+            del self._entries[key]
+            self.stats.evictions += 1
+            entry = None
+        if entry is None:
+            self.stats.misses += 1
+            return None
+        self._entries.move_to_end(key)
+        self.stats.hits += 1
+        return entry[0]
+
+    async def set(self, key: str, value: str, ttl: Optional[float] = None):
+        self._entries[key] = (value, self.clock() + (ttl or self.ttl))
+        self._entries.move_to_end(key)
+        while len(self._entries) > self.max_entries:
+            self._entries.popitem(last=False)
+            self.stats.evictions += 1
+
+    async def delete(self, *keys: str):
+        for key in keys:
+            self._entries.pop(key, None)
+
+    def __len__(self):
+        return len(self._entries)
+
+
+class RedisCache:
+    """Cache over any client exposing the redis.asyncio get/set/delete API"""
+
+    def __init__(self, client, ttl: float = 60, prefix: str = "cache:"):
+        self.client = client
+        self.ttl = ttl
+        self.prefix = prefix
+        self.stats = CacheStats()
+
+    async def get(self, key: str) -> Optional[str]:
+        value = await self.client.get(self.prefix + key)
+        if value is None:
+            self.stats.misses += 1
+            return None
+        self.stats.hits += 1
+        return value.decode() if isinstance(value, bytes) else value
+
+    async def set(self, key: str, value: str, ttl: Optional[float] = None):
+        # Redis evicts on its own, so evictions are not counted here
+        await self.client.set(self.prefix + key, value, px=int((ttl or self.ttl) * 1000))
+
+    async def delete(self, *keys: str):
+        if keys:
+            await self.client.delete(*(self.prefix + key for key in keys))
+
+
+class NullCache:
+    """Disables caching while keeping the cache interface"""
+
+    def __init__(self):
+        self.stats = CacheStats()
+
+    async def get(self, key: str) -> Optional[str]:
+        self.stats.misses += 1
+        return None
+
+    async def set(self, key: str, value: str, ttl: Optional[float] = None):
+        pass
+
+    async def delete(self, *keys: str):
+        pass
+
+
+@lru_cache()
+def get_cache():
+    settings = get_settings()
+    if settings.cache_backend == "redis":
+        return RedisCache(get_state_client(), ttl=settings.cache_ttl)
+    if settings.cache_backend == "none":
+        return NullCache()
+    return MemoryCache(max_entries=settings.cache_max_entries, ttl=settings.cache_ttl)
+
+
+def etag_response(request: Request, body: str) -> Response:
+    """JSON response with a strong ETag, or 304 when the client already has it"""
+    etag = '"' + hashlib.sha1(body.encode()).hexdigest() + '"'
+    if_none_match = request.headers.get("if-none-match", "")
+    if etag in (tag.strip() for tag in if_none_match.split(",")) or if_none_match.strip() == "*":
+        return Response(status_code=304, headers={"ETag": etag})
+    return Response(content=body, media_type="application/json", headers={"ETag": etag})
@@ -0,0 +1,70 @@
+import csv
+import io
+import json
+from typing import Any, Iterable, Iterator, List
+
+try:
+    import orjson
+except ImportError:  # pragma: no cover - stdlib fallback
+    orjson = None
+
+ORDER_EXPORT_COLUMNS = ("id", "customer_id", "item", "amount", "time", "formatted_time")
+
+
+def _order_values(row) -> tuple:
+    order_id, customer_id, item, amount, time = row
+    time = time.isoformat()
+    # formatted_time is "%Y-%m-%d %H:%M:%S", sliced from the ISO string instead of a second strftime
+    return (order_id, customer_id, item, amount, time, time[:19].replace("T", " "))
+
+
+def order_dicts(rows: Iterable) -> List[dict]:
+    """OrderResponse-shaped dicts from (id, customer_id, item, amount, time) rows"""
+    orders = []
+    for order_id, customer_id, item, amount, time in rows:
+        time = time.isoformat()
+        orders.append({
+            "id": order_id,
+            "customer_id": customer_id,
+            "item": item,
+            "amount": amount,
+            "time": time,
+            "formatted_time": time[:19].replace("T", " "),
+        })
+    return orders
+
+
+def dumps(value: Any) -> bytes:
+    """Compact JSON, through orjson when it is installed"""
+    if orjson is not None:
+        return orjson.dumps(value)
+    return json.dumps(value, separators=(",", ":")).encode()
+
+
+def encode_ndjson(rows: Iterable, chunk_size: int = 1000) -> Iterator[str]:
+    """Encodes order rows as NDJSON, yielding one chunk of lines at a time"""
+    lines = []
+    for row in rows:
+        lines.append(json.dumps(dict(zip(ORDER_EXPORT_COLUMNS, _order_values(row)))))
+        if len(lines) >= chunk_size:
+            yield "\n".join(lines) + "\n"
+            lines = []
+    if lines:
+        yield "\n".join(lines) + "\n"
+
+
+def encode_csv(rows: Iterable, chunk_size: int = 1000) -> Iterator[str]:
+    """Encodes order rows as CSV with a header, yielding one chunk at a time"""
+    buffer = io.StringIO()
+    writer = csv.writer(buffer)
+    writer.writerow(ORDER_EXPORT_COLUMNS)
+    pending = 0
+    for row in rows:
+        writer.writerow(_order_values(row))
+        pending += 1
+        if pending >= chunk_size:
+            yield buffer.getvalue()
+            buffer.seek(0)
+            buffer.truncate()
+            pending = 0
+    yield buffer.getvalue()
@@ -0,0 +1,84 @@
+import asyncio
+import hashlib
+import json
+import logging
+from datetime import datetime, timedelta, timezone
+from typing import Any, Optional
+
+from fastapi import HTTPException
+from fastapi.encoders import jsonable_encoder
+from sqlalchemy import delete
+from sqlalchemy.ext.asyncio import AsyncSession
+
+from app.models.models import IdempotencyKey
+from app.utils.cache import get_cache
+
+logger = logging.getLogger(__name__)
+
+CACHE_PREFIX = "idempotency:"
+
+
+def _utcnow() -> datetime:
+    return datetime.now(timezone.utc).replace(tzinfo=None)
+
+
+def request_fingerprint(payload: Any) -> str:
+    """Hash of the request body, so a key cannot be replayed for a different request"""
+    return hashlib.sha256(json.dumps(jsonable_encoder(payload), sort_keys=True).encode()).hexdigest()
+
+
+def _replay(request_hash: str, fingerprint: str, response: str) -> Any:
+    if request_hash != fingerprint:
+        raise HTTPException(status_code=422, detail="Idempotency-Key was already used for a different request")
+    return json.loads(response)
+
+
+async def remember_response(key: str, request_hash: str, response: str):
+    # Retries arrive within seconds, so the cache's own TTL is enough here
+    await get_cache().set(CACHE_PREFIX + key, json.dumps({"request_hash": request_hash, "response": response}))
+
+
+async def get_stored_response(key: str, fingerprint: str, db: AsyncSession) -> Optional[Any]:
+    """The stored response for a key, from the cache first and then the table"""
+    cached = await get_cache().get(CACHE_PREFIX + key)
+    if cached is not None:
+        entry = json.loads(cached)
+        return _replay(entry["request_hash"], fingerprint, entry["response"])
+
+    stored = await db.get(IdempotencyKey, key)
+    if stored is None:
+        return None
+    if stored.expires_at <= _utcnow():
+        # Free the key now rather than waiting for the purger
+        await db.delete(stored)
+        await db.flush()
+        return None
+    await remember_response(key, stored.request_hash, stored.response)
+    return _replay(stored.request_hash, fingerprint, stored.response)
+
+
+def store_response(key: str, fingerprint: str, response: Any, ttl: float, db: AsyncSession) -> str:
+    """Adds the response to the session, to commit in the same transaction as the work it describes"""
+    body = json.dumps(jsonable_encoder(response), separators=(",", ":"))
+    db.add(IdempotencyKey(key=key, request_hash=fingerprint, response=body,
+                          expires_at=_utcnow() + timedelta(seconds=ttl)))
+    return body
+
+
+async def purge_expired_keys(db: AsyncSession) -> int:
+    result = await db.execute(delete(IdempotencyKey).where(IdempotencyKey.expires_at <= _utcnow()))
+    await db.commit()
+    return result.rowcount
+
+
+async def run_purger(session_factory, interval: float):
+    """Deletes expired keys every `interval` seconds until cancelled"""
+    while True:
+        await asyncio.sleep(interval)
+        try:
+            async with session_factory() as db:
+                purged = await purge_expired_keys(db)
+            if purged:
+                logger.info("Purged %d expired idempotency keys", purged)
+        except Exception:
+            logger.exception("Purging idempotency keys failed")
@@ -0,0 +1,55 @@
+import csv
+import io
+from typing import IO, Any, Dict, Iterator, Tuple
+
+from openpyxl import load_workbook
+
+
+def _normalise_header(value: Any) -> str:
+    return str(value or "").strip().lower().replace(" ", "_")
+
+
+def _cell_to_str(value: Any):
+    if value is None:
+        return None
+    if isinstance(value, float) and value.is_integer():
+        value = int(value)
+    value = str(value).strip()
+    return value or None
+
+
+def iter_xlsx_rows(file: IO[bytes]) -> Iterator[Tuple[int, Dict[str, Any]]]:
+    """Yields (row number, row dict) from the first sheet without loading the whole workbook"""
+    workbook = load_workbook(file, read_only=True, data_only=True)
+    try:
+        rows = workbook.worksheets[0].iter_rows(values_only=True)
+        header = [_normalise_header(cell) for cell in next(rows, ())]
+        for number, values in enumerate(rows, start=2):
+            row = {key: _cell_to_str(value) for key, value in zip(header, values) if key}
+            if any(row.values()):
+                yield number, row
+    finally:
+        workbook.close()
+
+
+def iter_csv_rows(file: IO[bytes]) -> Iterator[Tuple[int, Dict[str, Any]]]:
+    """Yields (row number, row dict) from a CSV file with a header row"""
+    text = io.TextIOWrapper(file, encoding="utf-8-sig", newline="")
+    try:
+        reader = csv.reader(text)
+        header = [_normalise_header(cell) for cell in next(reader, [])]
+        for number, values in enumerate(reader, start=2):
+            row = {key: _cell_to_str(value) for key, value in zip(header, values) if key}
+            if any(row.values()):
+                yield number, row
+    finally:
+        # Leave the underlying upload open for its owner to close
+        text.detach()
+
+
+def iter_upload_rows(file: IO[bytes], filename: str) -> Iterator[Tuple[int, Dict[str, Any]]]:
+    if filename.lower().endswith((".xlsx", ".xlsm")):
+        return iter_xlsx_rows(file)
+    if filename.lower().endswith(".csv"):
+        return iter_csv_rows(file)
+    raise ValueError("Unsupported file type. Upload a .xlsx or .csv file")
@@ -0,0 +1,174 @@
+"""Live order events for dashboards, pushed over SSE and WebSocket.
+
+Writers publish through a broker, which assigns the event id and delivers the
+event to the feed in every worker. Each feed keeps the latest events in a ring
+buffer so a reconnecting client can resume from its last event id.
+"""
+import asyncio
+import itertools
+import json
+import logging
+import time
+from collections import deque
+from functools import lru_cache
+from typing import (AsyncIterator, Callable, Deque, Iterable, List, Optional,
+                    Set)
+
+from app.config import get_settings
+from app.utils.export import order_dicts
+from app.utils.shared_state import get_state_client
+
+logger = logging.getLogger(__name__)
+
+# Sent when events between the client's last id and the buffer were lost, so it
+# should reload its view (e.g. from /orders/date_range) before following the feed
+RESYNC = {"type": "resync"}
+LISTENER_RETRY_INTERVAL = 1.0
+
+
+class MemoryBroker:
+    """Delivers to this process only"""
+
+    def __init__(self):
+        # Millisecond-based ids keep growing across restarts, so old ids never look new
+        self._ids = itertools.count(int(time.time() * 1000))
+        self._deliver: Optional[Callable[[dict], None]] = None
+
+    async def publish(self, event_type: str, order: dict):
+        if self._deliver is not None:
+            self._deliver({"id": next(self._ids), "type": event_type, "order": order})
+
+    async def listen(self, deliver: Callable[[dict], None]):
+        self._deliver = deliver
+        try:
+            await asyncio.Event().wait()
+        finally:
+            self._deliver = None
+
+
+class RedisBroker:
+    """Ids from INCR, fan-out to every worker over pub/sub"""
+
+    def __init__(self, client, channel: str = "order-feed"):
+        self.client = client
+        self.channel = channel
+
+    async def publish(self, event_type: str, order: dict):
+        event_id = await self.client.incr(f"{self.channel}:id")
+        await self.client.publish(self.channel, json.dumps({"id": event_id, "type": event_type, "order": order}))
+
+    async def listen(self, deliver: Callable[[dict], None]):
+        pubsub = self.client.pubsub()
+        await pubsub.subscribe(self.channel)
+        try:
+            async for message in pubsub.listen():
+                if message["type"] == "message":
+                    deliver(json.loads(message["data"]))
+        finally:
+            await pubsub.aclose()
+
+
+class Subscription:
+    def __init__(self, customer_id: Optional[int], max_pending: int):
+        self.customer_id = customer_id
+        self.events: asyncio.Queue = asyncio.Queue(max_pending)
+        self.overflowed = False
+
+    def wants(self, event: dict) -> bool:
+        return self.customer_id is None or event["order"].get("customer_id") == self.customer_id
+
+    def offer(self, event: dict):
+        if self.overflowed or not self.wants(event):
+            return
+        try:
+            self.events.put_nowait(event)
+        except asyncio.QueueFull:
+            # A client this far behind gets a resync instead of unbounded memory
+            self.overflowed = True
+
+
+class OrderFeed:
+    def __init__(self, broker=None, buffer_size: int = 1000, max_pending: int = 1000):
+        self.broker = broker or MemoryBroker()
+        self.buffer: Deque[dict] = deque(maxlen=buffer_size)
+        self.max_pending = max_pending
+        self._subscriptions: Set[Subscription] = set()
+        self._listener: Optional[asyncio.Task] = None
+
+    async def start(self):
+        if self._listener is None:
+            self._listener = asyncio.create_task(self._listen())
+
+    async def stop(self):
+        if self._listener is None:
+            return
+        self._listener.cancel()
+        try:
+            await self._listener
+        except asyncio.CancelledError:
+            pass
+        self._listener = None
+
+    async def _listen(self):
+        while True:
+            try:
+                await self.broker.listen(self.deliver)
+            except Exception:
+                logger.exception("Order feed broker disconnected, reconnecting")
+            await asyncio.sleep(LISTENER_RETRY_INTERVAL)
+
+    async def publish(self, event_type: str, rows: Iterable[tuple]):
+        """One event per (id, customer_id, item, amount, time) row; the write already
+        committed, so failures are only logged"""
+        try:
+            for order in order_dicts(rows):
+                await self.broker.publish(event_type, order)
+        except Exception:
+            logger.exception("Publishing %s events failed", event_type)
+
+    def deliver(self, event: dict):
+        self.buffer.append(event)
+        for subscription in list(self._subscriptions):
+            subscription.offer(event)
+
+    def _replay(self, last_event_id: int) -> Optional[List[dict]]:
+        """Buffered events after last_event_id, or None when that id is not in the buffer:
+        it was evicted, was lost with a restart or has not reached this worker yet"""
+        for index, event in enumerate(self.buffer):
+            if event["id"] == last_event_id:
+                return list(itertools.islice(self.buffer, index + 1, None))
+        return None
+
+    async def subscribe(self, customer_id: Optional[int] = None, last_event_id: Optional[int] = None,
+                        heartbeat: Optional[float] = None) -> AsyncIterator[Optional[dict]]:
+        """Events for one client, optionally resumed after last_event_id; yields None
+        after `heartbeat` idle seconds so transports can send keepalives"""
+        subscription = Subscription(customer_id, self.max_pending)
+        # Registered and replayed without awaiting in between, so no event is missed or sent twice
+        self._subscriptions.add(subscription)
+        backlog = self._replay(last_event_id) if last_event_id is not None else []
+        try:
+            if backlog is None:
+                yield RESYNC
+                backlog = []
+            for event in backlog:
+                if subscription.wants(event):
+                    yield event
+            while True:
+                if subscription.overflowed and subscription.events.empty():
+                    yield RESYNC
+                    return
+                try:
+                    yield await asyncio.wait_for(subscription.events.get(), heartbeat)
+                except asyncio.TimeoutError:
+                    yield None
+        finally:
+            self._subscriptions.discard(subscription)
+
+
+@lru_cache()
+def get_order_feed() -> OrderFeed:
+    settings = get_settings()
+    broker = RedisBroker(get_state_client()) if settings.state_backend == "redis" else MemoryBroker()
+    return OrderFeed(broker, buffer_size=settings.order_feed_buffer_size,
+                     max_pending=settings.order_feed_max_pending)
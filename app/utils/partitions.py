@@ -0,0 +1,168 @@
+import csv
+import gzip
+import os
+import re
+from datetime import date
+from typing import Iterable, List, Optional, Sequence
+
+from sqlalchemy import text
+from sqlalchemy.engine import Connection
+
+ARCHIVE_COLUMNS = ("id", "customer_id", "item", "amount", "time", "date_created", "date_updated")
+ARCHIVE_FORMATS = ("csv.gz", "parquet")
+ARCHIVE_CHUNK_SIZE = 10000
+PARTITION_NAME = re.compile(r"^orders_p(\d{4})_(\d{2})$")
+DEFAULT_PARTITION = "orders_default"
+
+
+def add_months(month: date, months: int) -> date:
+    index = month.year * 12 + month.month - 1 + months
+    return date(index // 12, index % 12 + 1, 1)
+
+
+def partition_name(month: date) -> str:
+    return f"orders_p{month:%Y_%m}"
+
+
+def is_partitioned(conn: Connection) -> bool:
+    """Whether orders was migrated to the partitioned layout (PostgreSQL only)"""
+    if conn.dialect.name != "postgresql":
+        return False
+    return conn.execute(text(
+        "SELECT EXISTS (SELECT 1 FROM pg_partitioned_table pt "
+        "JOIN pg_class c ON c.oid = pt.partrelid WHERE c.relname = 'orders')"
+    )).scalar()
+
+
+def list_partitions(conn: Connection) -> List[date]:
+    """Months that have a partition, oldest first; the default partition is left out"""
+    names = conn.execute(text(
+        "SELECT child.relname FROM pg_inherits i "
+        "JOIN pg_class child ON child.oid = i.inhrelid "
+        "JOIN pg_class parent ON parent.oid = i.inhparent "
+        "WHERE parent.relname = 'orders'"
+    )).scalars()
+    months = []
+    for name in names:
+        match = PARTITION_NAME.match(name)
+        if match:
+            months.append(date(int(match.group(1)), int(match.group(2)), 1))
+    return sorted(months)
+
+
+def default_partition_months(conn: Connection) -> List[date]:
+    """Months that have rows in the default partition, oldest first"""
+    return [month for month in conn.execute(text(
+        f"SELECT DISTINCT date_trunc('month', time)::date FROM {DEFAULT_PARTITION} ORDER BY 1"
+    )).scalars()]
+
+
+def create_partition(conn: Connection, month: date) -> str:
+    """Creates the partition for one month, moving its rows out of the default partition first
+
+    PostgreSQL refuses `CREATE TABLE ... PARTITION OF` while the default
+    partition holds rows for the new range, so in that case the partition is
+    built as a plain table, filled from the default partition and attached.
+    """
+    name = partition_name(month)
+    start, end = month.isoformat(), add_months(month, 1).isoformat()
+    bounds = f"FOR VALUES FROM ('{start}') TO ('{end}')"
+    in_range = f"time >= '{start}' AND time < '{end}'"
+    # Blocks writes to the default partition until commit, so no row for the month lands there after the move
+    conn.execute(text(f"LOCK TABLE {DEFAULT_PARTITION} IN SHARE ROW EXCLUSIVE MODE"))
+    if not conn.execute(text(f"SELECT EXISTS (SELECT 1 FROM {DEFAULT_PARTITION} WHERE {in_range})")).scalar():
+        conn.execute(text(f"CREATE TABLE {name} PARTITION OF orders {bounds}"))
+        return name
+    columns = ", ".join(ARCHIVE_COLUMNS)
+    conn.execute(text(f"CREATE TABLE {name} (LIKE orders INCLUDING DEFAULTS INCLUDING CONSTRAINTS)"))
+    conn.execute(text(
+        f"WITH moved AS (DELETE FROM {DEFAULT_PARTITION} WHERE {in_range} RETURNING {columns}) "
+        f"INSERT INTO {name} ({columns}) SELECT {columns} FROM moved"
+    ))
+    conn.execute(text(f"ALTER TABLE orders ATTACH PARTITION {name} {bounds}"))
+    return name
+
+
+def ensure_partitions(conn: Connection, months_ahead: int = 3, today: Optional[date] = None) -> List[str]:
+    """Creates monthly partitions from the current month up to `months_ahead` months out"""
+    current = (today or date.today()).replace(day=1)
+    existing = set(list_partitions(conn))
+    created = []
+    for offset in range(months_ahead + 1):
+        month = add_months(current, offset)
+        if month not in existing:
+            created.append(create_partition(conn, month))
+    return created
+
+
+def split_default_partition(conn: Connection) -> List[str]:
+    """Gives every month with rows in the default partition its own partition, so they can be archived"""
+    existing = set(list_partitions(conn))
+    return [create_partition(conn, month) for month in default_partition_months(conn) if month not in existing]
+
+
+def cold_partitions(months: Sequence[date], keep_months: int, today: Optional[date] = None) -> List[date]:
+    """Partitions older than the `keep_months` most recent months, the current one included"""
+    cutoff = add_months((today or date.today()).replace(day=1), 1 - keep_months)
+    return [month for month in months if add_months(month, 1) <= cutoff]
+
+
+def _write_csv_gz(rows: Iterable[tuple], path: str):
+    with gzip.open(path, "wt", newline="", encoding="utf-8") as output:
+        writer = csv.writer(output)
+        writer.writerow(ARCHIVE_COLUMNS)
+        writer.writerows(rows)
+
+
+def _write_parquet(rows: Iterable[tuple], path: str):
+    try:
+        import pyarrow as pa
+        import pyarrow.parquet as pq
+    except ImportError:
+        raise RuntimeError("Parquet archives need the 'pyarrow' package; use csv.gz instead")
+
+    schema = pa.schema([
+        ("id", pa.int64()), ("customer_id", pa.int64()), ("item", pa.string()), ("amount", pa.float64()),
+        ("time", pa.timestamp("us")), ("date_created", pa.timestamp("us")), ("date_updated", pa.timestamp("us")),
+    ])
+    with pq.ParquetWriter(path, schema, compression="zstd") as writer:
+        chunk = []
+        for row in rows:
+            chunk.append(dict(zip(ARCHIVE_COLUMNS, row)))
+            if len(chunk) >= ARCHIVE_CHUNK_SIZE:
+                writer.write_table(pa.Table.from_pylist(chunk, schema=schema))
+                chunk = []
+        if chunk:
+            writer.write_table(pa.Table.from_pylist(chunk, schema=schema))
+
+
+def write_archive(rows: Iterable[tuple], path: str, archive_format: str = "csv.gz") -> str:
+    """Writes rows to a temporary file and renames it into place once complete"""
+    if archive_format not in ARCHIVE_FORMATS:
+        raise ValueError(f"Unsupported archive format {archive_format!r}")
+    partial = path + ".partial"
+    try:
+        if archive_format == "parquet":
+            _write_parquet(rows, partial)
+        else:
+            _write_csv_gz(rows, partial)
+    except BaseException:
+        if os.path.exists(partial):
+            os.remove(partial)
+        raise
+    os.replace(partial, path)
+    return path
+
+
+def archive_partition(conn: Connection, month: date, directory: str, archive_format: str = "csv.gz") -> str:
+    """Exports one partition, then detaches and drops it in the caller's transaction"""
+    name = partition_name(month)
+    os.makedirs(directory, exist_ok=True)
+    rows = conn.execution_options(stream_results=True, yield_per=ARCHIVE_CHUNK_SIZE).execute(
+        text(f"SELECT {', '.join(ARCHIVE_COLUMNS)} FROM {name} ORDER BY time, id")
+    )
+    path = write_archive((tuple(row) for row in rows), os.path.join(directory, f"{name}.{archive_format}"),
+                         archive_format)
+    conn.execute(text(f"ALTER TABLE orders DETACH PARTITION {name}"))
+    conn.execute(text(f"DROP TABLE {name}"))
+    return path
@@ -0,0 +1,66 @@
+import threading
+import time
+from typing import Dict
+
+from sqlalchemy import event
+from sqlalchemy.pool import AsyncAdaptedQueuePool, Pool, QueuePool
+
+from app.utils.metrics import Histogram
+
+
+class InstrumentedQueuePool(QueuePool):
+    """QueuePool that records how long callers wait for a connection"""
+
+    def __init__(self, *args, **kwargs):
+        super().__init__(*args, **kwargs)
+        self.wait_time = Histogram()
+
+    def _do_get(self):
+        started = time.perf_counter()
+        try:
+            return super()._do_get()
+        finally:
+            self.wait_time.observe(time.perf_counter() - started)
+
+
+class InstrumentedAsyncQueuePool(InstrumentedQueuePool, AsyncAdaptedQueuePool):
+    pass
+
+
+class PoolMetrics:
+    """Connection pool counters fed by SQLAlchemy pool events"""
+
+    def __init__(self, name: str):
+        self.name = name
+        self.engine = None
+        self.counters: Dict[str, int] = {"connects": 0, "checkouts": 0, "checkins": 0, "invalidations": 0}
+        self._lock = threading.Lock()
+
+    def _increment(self, counter: str):
+        with self._lock:
+            self.counters[counter] += 1
+
+    def attach(self, engine):
+        """Listens on a sync Engine (use AsyncEngine.sync_engine for async engines)"""
+        self.engine = engine
+        event.listen(engine, "connect", lambda *args: self._increment("connects"))
+        event.listen(engine, "checkout", lambda *args: self._increment("checkouts"))
+        event.listen(engine, "checkin", lambda *args: self._increment("checkins"))
+        event.listen(engine, "invalidate", lambda *args: self._increment("invalidations"))
+        return self
+
+    def snapshot(self) -> dict:
+        # Read the pool from the engine each time, dispose() replaces it
+        pool: Pool = self.engine.pool
+        stats = {"pool": type(pool).__name__, **self.counters}
+        if isinstance(pool, QueuePool):
+            stats.update({
+                "size": pool.size(),
+                "checked_out": pool.checkedout(),
+                "idle": pool.checkedin(),
+                "overflow": pool.overflow(),
+            })
+        wait_time = getattr(pool, "wait_time", None)
+        if wait_time is not None:
+            stats["wait_time_seconds"] = wait_time.snapshot()
+        return stats
@@ -0,0 +1,183 @@
+import logging
+import random
+import re
+import threading
+import time
+from collections import Counter
+from contextlib import contextmanager
+from contextvars import ContextVar
+from typing import Callable, Dict, Optional, Tuple
+
+from sqlalchemy import event
+
+from app.utils.metrics import Histogram
+
+logger = logging.getLogger(__name__)
+
+SQL_COUNT_BUCKETS = (1, 2, 5, 10, 20, 50, 100, 200, 500)
+_LITERALS = re.compile(r"'(?:[^']|'')*'|\b\d+(?:\.\d+)?\b")
+
+
+class RequestProfile:
+    """Timings collected for one sampled request"""
+
+    def __init__(self):
+        self.started = time.perf_counter()
+        self.phases: Dict[str, float] = {}
+        self.sql_count = 0
+        self.sql_time = 0.0
+        self.statements: Counter = Counter()
+
+    def add_phase(self, name: str, seconds: float):
+        self.phases[name] = self.phases.get(name, 0.0) + seconds
+
+    def add_statement(self, statement: str, seconds: float):
+        self.sql_count += 1
+        self.sql_time += seconds
+        # Literals are bound parameters in ORM queries, but strip any inlined ones
+        self.statements[_LITERALS.sub("?", statement)] += 1
+
+    def repeated_statements(self, threshold: int):
+        return [(statement, count) for statement, count in self.statements.items() if count >= threshold]
+
+    def server_timing(self, total: float) -> str:
+        entries = [f"{name};dur={seconds * 1000:.2f}" for name, seconds in self.phases.items()]
+        entries.append(f'db;dur={self.sql_time * 1000:.2f};desc="{self.sql_count} statements"')
+        entries.append(f"total;dur={total * 1000:.2f}")
+        return ", ".join(entries)
+
+
+_current_profile: ContextVar[Optional[RequestProfile]] = ContextVar("request_profile", default=None)
+
+
+def current_profile() -> Optional[RequestProfile]:
+    return _current_profile.get()
+
+
+@contextmanager
+def profile_phase(name: str):
+    """Times a block into the current request profile; a no-op for unsampled requests"""
+    profile = _current_profile.get()
+    if profile is None:
+        yield
+        return
+    started = time.perf_counter()
+    try:
+        yield
+    finally:
+        profile.add_phase(name, time.perf_counter() - started)
+
+
+def attach_sql_timing(engine):
+    """Counts and times statements on a sync Engine (AsyncEngine.sync_engine for async engines)"""
+
+    @event.listens_for(engine, "before_cursor_execute")
+    def before_cursor_execute(conn, cursor, statement, parameters, context, executemany):
+        if _current_profile.get() is not None:
+            conn.info.setdefault("profile_started", []).append(time.perf_counter())
+
+    @event.listens_for(engine, "after_cursor_execute")
+    def after_cursor_execute(conn, cursor, statement, parameters, context, executemany):
+        profile = _current_profile.get()
+        started = conn.info.get("profile_started")
+        if profile is not None and started:
+            profile.add_statement(statement, time.perf_counter() - started.pop())
+
+    return engine
+
+
+class ProfilingMetrics:
+    """Per-route histograms of sampled requests, rendered in the Prometheus text format"""
+
+    def __init__(self):
+        self.request_duration: Dict[Tuple[str, str], Histogram] = {}
+        self.db_duration: Dict[Tuple[str, str], Histogram] = {}
+        self.sql_statements: Dict[Tuple[str, str], Histogram] = {}
+        self.n_plus_one: Counter = Counter()
+        self._lock = threading.Lock()
+
+    def _histogram(self, family: dict, labels: Tuple[str, str], buckets=None) -> Histogram:
+        histogram = family.get(labels)
+        if histogram is None:
+            with self._lock:
+                histogram = family.setdefault(labels, Histogram(buckets) if buckets else Histogram())
+        return histogram
+
+    def observe(self, method: str, route: str, total: float, profile: RequestProfile, n_plus_one: bool):
+        labels = (method, route)
+        self._histogram(self.request_duration, labels).observe(total)
+        self._histogram(self.db_duration, labels).observe(profile.sql_time)
+        self._histogram(self.sql_statements, labels, SQL_COUNT_BUCKETS).observe(profile.sql_count)
+        if n_plus_one:
+            with self._lock:
+                self.n_plus_one[labels] += 1
+
+    def render(self) -> str:
+        lines = []
+        for name, description, family in (
+            ("http_request_duration_seconds", "Sampled request duration", self.request_duration),
+            ("http_request_db_duration_seconds", "Time spent executing SQL per sampled request", self.db_duration),
+            ("http_request_sql_statements", "SQL statements per sampled request", self.sql_statements),
+        ):
+            lines += [f"# HELP {name} {description}", f"# TYPE {name} histogram"]
+            for (method, route), histogram in sorted(family.items()):
+                labels = f'method="{method}",route="{route}"'
+                for bound, count in histogram.cumulative():
+                    le = "+Inf" if bound == float("inf") else repr(float(bound))
+                    lines.append(f'{name}_bucket{{{labels},le="{le}"}} {count}')
+                lines.append(f"{name}_sum{{{labels}}} {histogram.sum}")
+                lines.append(f"{name}_count{{{labels}}} {histogram.count}")
+        lines += ["# HELP http_request_n_plus_one_total Sampled requests that repeated one statement",
+                  "# TYPE http_request_n_plus_one_total counter"]
+        for (method, route), count in sorted(self.n_plus_one.items()):
+            lines.append(f'http_request_n_plus_one_total{{method="{method}",route="{route}"}} {count}')
+        return "\n".join(lines) + "\n"
+
+
+profiling_metrics = ProfilingMetrics()
+
+
+class ProfilingMiddleware:
+    """Profiles a sample of HTTP requests.
+
+    A sampled request gets a Server-Timing header and feeds the Prometheus
+    histograms. A request that runs one statement at least n_plus_one_threshold
+    times is logged as a likely N+1.
+    """
+
+    def __init__(self, app, sample_rate: float = 0.01, n_plus_one_threshold: int = 10,
+                 metrics: ProfilingMetrics = profiling_metrics, sample: Callable[[], float] = random.random):
+        self.app = app
+        self.sample_rate = sample_rate
+        self.n_plus_one_threshold = n_plus_one_threshold
+        self.metrics = metrics
+        self.sample = sample
+
+    async def __call__(self, scope, receive, send):
+        if scope["type"] != "http" or self.sample() >= self.sample_rate:
+            return await self.app(scope, receive, send)
+
+        profile = RequestProfile()
+        token = _current_profile.set(profile)
+
+        async def send_with_timing(message):
+            if message["type"] == "http.response.start":
+                total = time.perf_counter() - profile.started
+                headers = list(message.get("headers", []))
+                headers.append((b"server-timing", profile.server_timing(total).encode()))
+                message = {**message, "headers": headers}
+            await send(message)
+
+        try:
+            await self.app(scope, receive, send_with_timing)
+        finally:
+            _current_profile.reset(token)
+            self._record(scope, profile, time.perf_counter() - profile.started)
+
+    def _record(self, scope, profile: RequestProfile, total: float):
+        route = getattr(scope.get("route"), "path", None) or "unmatched"
+        repeated = profile.repeated_statements(self.n_plus_one_threshold)
+        for statement, count in repeated:
+            logger.warning("Possible N+1 on %s %s: statement ran %d times: %s",
+                           scope["method"], route, count, statement)
+        self.metrics.observe(scope["method"], route, total, profile, bool(repeated))
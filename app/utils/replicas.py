@@ -0,0 +1,101 @@
+import asyncio
+import hashlib
+import itertools
+import logging
+from typing import List, Sequence
+
+from sqlalchemy import text
+from sqlalchemy.ext.asyncio import AsyncEngine
+
+from app.utils.shared_state import get_state_client
+
+logger = logging.getLogger(__name__)
+
+STICKY_PREFIX = "db-primary:"
+READ_METHODS = ("GET", "HEAD", "OPTIONS")
+
+
+def client_key(scope) -> str:
+    """Identifies the caller by its bearer token, or its address when there is none"""
+    headers = dict(scope.get("headers") or [])
+    identity = headers.get(b"authorization") or (scope.get("client") or ("",))[0].encode()
+    return STICKY_PREFIX + hashlib.sha256(identity).hexdigest()[:32]
+
+
+class ReplicaRouter:
+    """Picks the engine for a read: replicas round-robin, skipping any that failed
+    their last health check, and the primary for clients that wrote recently"""
+
+    def __init__(self, primary: AsyncEngine, replicas: Sequence[AsyncEngine], sticky_window: float = 5):
+        self.primary = primary
+        self.replicas = list(replicas)
+        self.healthy: List[AsyncEngine] = list(self.replicas)
+        self.sticky_window = sticky_window
+        self._turn = itertools.count()
+
+    def choose(self) -> AsyncEngine:
+        healthy = self.healthy
+        if not healthy:
+            return self.primary
+        return healthy[next(self._turn) % len(healthy)]
+
+    def mark_down(self, engine: AsyncEngine):
+        if engine in self.healthy:
+            logger.warning("Read replica %s is down, sending its reads elsewhere", engine.url.render_as_string())
+            self.healthy = [replica for replica in self.healthy if replica is not engine]
+
+    async def mark_write(self, scope):
+        """Pins the client's reads to the primary until replicas have caught up with its write"""
+        await get_state_client().set(client_key(scope), "1", px=int(self.sticky_window * 1000))
+
+    async def engine_for(self, scope) -> AsyncEngine:
+        if not self.replicas or await get_state_client().get(client_key(scope)) is not None:
+            return self.primary
+        return self.choose()
+
+    async def _is_up(self, engine: AsyncEngine, timeout: float) -> bool:
+        try:
+            async with engine.connect() as conn:
+                await asyncio.wait_for(conn.execute(text("SELECT 1")), timeout)
+            return True
+        except Exception as error:
+            logger.debug("Health check on %s failed: %s", engine.url.render_as_string(), error)
+            return False
+
+    async def check(self, timeout: float = 2):
+        results = await asyncio.gather(*(self._is_up(engine, timeout) for engine in self.replicas))
+        healthy = [engine for engine, up in zip(self.replicas, results) if up]
+        for engine in set(healthy) - set(self.healthy):
+            logger.info("Read replica %s is back", engine.url.render_as_string())
+        for engine in set(self.healthy) - set(healthy):
+            logger.warning("Read replica %s failed its health check", engine.url.render_as_string())
+        self.healthy = healthy
+
+    async def run_health_checks(self, interval: float, timeout: float = 2):
+        """Checks every replica every `interval` seconds until cancelled"""
+        while True:
+            await asyncio.sleep(interval)
+            try:
+                await self.check(timeout)
+            except Exception:
+                logger.exception("Checking read replicas failed")
+
+
+class ReadYourWritesMiddleware:
+    """Marks the client as having written after any successful non-read request"""
+
+    def __init__(self, app, router: ReplicaRouter):
+        self.app = app
+        self.router = router
+
+    async def __call__(self, scope, receive, send):
+        if scope["type"] != "http" or scope["method"] in READ_METHODS:
+            return await self.app(scope, receive, send)
+
+        async def send_after_marking(message):
+            # Before the response leaves, so the client's next read already sees the pin
+            if message["type"] == "http.response.start" and message["status"] < 400:
+                await self.router.mark_write(scope)
+            await send(message)
+
+        await self.app(scope, receive, send_after_marking)
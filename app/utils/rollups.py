@@ -0,0 +1,143 @@
+from datetime import date, datetime, time, timedelta
+from typing import Dict, Iterable, List, Tuple
+
+from sqlalchemy import and_, delete, func, or_, select, tuple_
+from sqlalchemy.dialects import postgresql, sqlite
+from sqlalchemy.ext.asyncio import AsyncSession
+
+from app.models.models import Order, OrderDailyRollup
+
+ROLLUP_DIALECTS = {"postgresql": postgresql, "sqlite": sqlite}
+# Buckets per refresh statement; SQLite parses OR chains as nested expressions capped at depth 1000
+ROLLUP_REFRESH_CHUNK = 250
+
+
+def _dialect_name(db: AsyncSession) -> str:
+    return db.get_bind().dialect.name
+
+
+def truncate_to_period(column, period: str, dialect_name: str):
+    """Date expression for the start of the day/week/month containing `column`"""
+    if dialect_name == "postgresql":
+        return func.date(func.date_trunc(period, column))
+    if period == "week":
+        # SQLite: move to the coming Sunday, then back to that week's Monday
+        return func.date(column, "weekday 0", "-6 days")
+    if period == "month":
+        return func.strftime("%Y-%m-01", column)
+    return func.date(column)
+
+
+async def add_to_daily_rollups(db: AsyncSession, orders: Iterable):
+    """Folds newly inserted orders into their daily rollup rows with one upsert"""
+    buckets: Dict[Tuple[date, int, str], list] = {}
+    for order in orders:
+        key = (order.time.date(), order.customer_id, order.item)
+        bucket = buckets.get(key)
+        if bucket is None:
+            buckets[key] = [1, order.amount, order.amount, order.amount]
+        else:
+            bucket[0] += 1
+            bucket[1] += order.amount
+            bucket[2] = min(bucket[2], order.amount)
+            bucket[3] = max(bucket[3], order.amount)
+    if not buckets:
+        return
+
+    dialect_name = _dialect_name(db)
+    dialect = ROLLUP_DIALECTS[dialect_name]
+    least, greatest = (func.least, func.greatest) if dialect_name == "postgresql" else (func.min, func.max)
+
+    # Key order, the same order _lock_buckets takes row locks in, so the two cannot deadlock
+    statement = dialect.insert(OrderDailyRollup).values([
+        {"day": day, "customer_id": customer_id, "item": item, "order_count": count,
+         "total_amount": total, "min_amount": low, "max_amount": high}
+        for (day, customer_id, item), (count, total, low, high) in sorted(buckets.items())
+    ])
+    excluded = statement.excluded
+    await db.execute(statement.on_conflict_do_update(
+        index_elements=[OrderDailyRollup.day, OrderDailyRollup.customer_id, OrderDailyRollup.item],
+        set_={
+            "order_count": OrderDailyRollup.order_count + excluded.order_count,
+            "total_amount": OrderDailyRollup.total_amount + excluded.total_amount,
+            "min_amount": least(OrderDailyRollup.min_amount, excluded.min_amount),
+            "max_amount": greatest(OrderDailyRollup.max_amount, excluded.max_amount),
+        }
+    ))
+
+
+async def _lock_buckets(db: AsyncSession, buckets: List[Tuple[date, int, str]]):
+    """Holds the buckets' rollup rows until commit, inserting empty ones where missing.
+
+    The recount that follows then reads every order whose increment already
+    landed, and add_to_daily_rollups in a concurrent transaction waits for the
+    lock and applies its increment on top of the recount instead of being
+    overwritten by it.
+    """
+    key = (OrderDailyRollup.day, OrderDailyRollup.customer_id, OrderDailyRollup.item)
+    await db.execute(postgresql.insert(OrderDailyRollup).values([
+        {"day": day, "customer_id": customer_id, "item": item, "order_count": 0,
+         "total_amount": 0.0, "min_amount": 0.0, "max_amount": 0.0}
+        for day, customer_id, item in buckets
+    ]).on_conflict_do_nothing(index_elements=list(key)))
+    await db.execute(
+        select(*key).where(tuple_(*key).in_(buckets)).order_by(*key).with_for_update()
+    )
+
+
+async def refresh_daily_rollups(db: AsyncSession, buckets: Iterable[Tuple[date, int, str]]):
+    """Recomputes (day, customer, item) rollup rows from the orders table
+
+    Used after updates and deletes, where min/max cannot be maintained incrementally.
+    On PostgreSQL the rows are locked first (see _lock_buckets); SQLite runs one
+    writer at a time. Buckets left without orders are deleted. Runs in the
+    caller's transaction so the rollups commit with the order writes.
+    """
+    dialect_name = _dialect_name(db)
+    dialect = ROLLUP_DIALECTS[dialect_name]
+    buckets = sorted(set(buckets))
+    for start in range(0, len(buckets), ROLLUP_REFRESH_CHUNK):
+        chunk = buckets[start:start + ROLLUP_REFRESH_CHUNK]
+        if dialect_name == "postgresql":
+            await _lock_buckets(db, chunk)
+        aggregate = select(
+            func.date(Order.time),
+            Order.customer_id,
+            Order.item,
+            func.count(Order.id),
+            func.sum(Order.amount),
+            func.min(Order.amount),
+            func.max(Order.amount),
+        ).where(or_(*(
+            and_(
+                Order.customer_id == customer_id,
+                Order.time >= datetime.combine(day, time.min),
+                Order.time < datetime.combine(day, time.min) + timedelta(days=1),
+                Order.item == item,
+            )
+            for day, customer_id, item in chunk
+        ))).group_by(func.date(Order.time), Order.customer_id, Order.item)
+
+        statement = dialect.insert(OrderDailyRollup).from_select(
+            ["day", "customer_id", "item", "order_count", "total_amount", "min_amount", "max_amount"],
+            aggregate,
+        )
+        excluded = statement.excluded
+        result = await db.execute(statement.on_conflict_do_update(
+            index_elements=[OrderDailyRollup.day, OrderDailyRollup.customer_id, OrderDailyRollup.item],
+            set_={
+                "order_count": excluded.order_count,
+                "total_amount": excluded.total_amount,
+                "min_amount": excluded.min_amount,
+                "max_amount": excluded.max_amount,
+            }
+        ).returning(OrderDailyRollup.day, OrderDailyRollup.customer_id, OrderDailyRollup.item))
+        empty = set(chunk) - {tuple(row) for row in result}
+        if empty:
+            await db.execute(delete(OrderDailyRollup).where(
+                tuple_(OrderDailyRollup.day, OrderDailyRollup.customer_id, OrderDailyRollup.item).in_(empty)
+            ))
+
+
+async def refresh_daily_rollup(db: AsyncSession, day: date, customer_id: int, item: str):
+    await refresh_daily_rollups(db, [(day, customer_id, item)])
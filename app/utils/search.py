@@ -0,0 +1,137 @@
+import re
+import threading
+import time
+from collections import defaultdict
+from typing import (Any, Callable, Dict, Hashable, Iterable, List, Optional,
+                    Sequence, Set, Tuple)
+
+# pg_trgm's default similarity threshold, used by the % operator
+SIMILARITY_THRESHOLD = 0.3
+# Seconds before an index is rebuilt even if this process saw no write
+SEARCH_INDEX_MAX_AGE = 60.0
+_WORDS = re.compile(r"[^\W_]+")
+
+
+def escape_like(value: str) -> str:
+    return value.replace("\\", "\\\\").replace("%", "\\%").replace("_", "\\_")
+
+
+def trigrams(value: str) -> Set[str]:
+    """Trigrams the way pg_trgm builds them: per lowercased word, padded with two spaces before and one after"""
+    grams = set()
+    for word in _WORDS.findall(value.lower()):
+        padded = f"  {word} "
+        grams.update(padded[i:i + 3] for i in range(len(padded) - 2))
+    return grams
+
+
+def similarity(left: Set[str], right: Set[str]) -> float:
+    if not left or not right:
+        return 0.0
+    return len(left & right) / len(left | right)
+
+
+class TrigramIndex:
+    """In-process stand-in for pg_trgm indexes on databases without them (SQLite).
+
+    Documents are keyed values with one or more text fields. Writers call
+    mark_stale() and the owner rebuilds the index before the next search.
+    Each worker process holds its own copy and only sees its own writes, so
+    the index also goes stale `max_age` seconds after a rebuild; that bounds
+    how long another worker's writes stay invisible.
+    """
+
+    def __init__(self, max_age: Optional[float] = SEARCH_INDEX_MAX_AGE,
+                 clock: Callable[[], float] = time.monotonic):
+        self.max_age = max_age
+        self.clock = clock
+        self.version = 0
+        self._built_version = -1
+        self._built_at = 0.0
+        self._fields: Dict[Hashable, Tuple[str, ...]] = {}
+        self._grams: Dict[Hashable, Tuple[Set[str], ...]] = {}
+        self._postings: Dict[str, Set[Hashable]] = defaultdict(set)
+        self._lock = threading.Lock()
+
+    @property
+    def stale(self) -> bool:
+        if self._built_version != self.version:
+            return True
+        return self.max_age is not None and self.clock() - self._built_at > self.max_age
+
+    def mark_stale(self):
+        self.version += 1
+
+    def rebuild(self, documents: Iterable[Tuple[Hashable, Sequence[Any]]], version: int):
+        """Replaces the contents; pass the version read before loading the documents,
+        so a write that lands during the load leaves the index stale"""
+        built_at = self.clock()
+        fields, grams, postings = {}, {}, defaultdict(set)
+        for key, values in documents:
+            values = tuple((value or "").lower() for value in values)
+            fields[key] = values
+            grams[key] = tuple(trigrams(value) for value in values)
+            for field_grams in grams[key]:
+                for gram in field_grams:
+                    postings[gram].add(key)
+        with self._lock:
+            self._fields, self._grams, self._postings = fields, grams, postings
+            self._built_version = version
+            self._built_at = built_at
+
+    def add(self, key: Hashable, values: Sequence[Any]):
+        """Adds or replaces one document; skipped while stale, as the next rebuild covers it"""
+        if self.stale:
+            return
+        values = tuple((value or "").lower() for value in values)
+        grams = tuple(trigrams(value) for value in values)
+        with self._lock:
+            self._fields[key] = values
+            self._grams[key] = grams
+            for field_grams in grams:
+                for gram in field_grams:
+                    self._postings[gram].add(key)
+
+    def __len__(self):
+        return len(self._fields)
+
+    def _prefix(self, query: str) -> List[Tuple[Hashable, float]]:
+        # Every field starting with the query holds the grams of its first word's
+        # padded start ("  b" and " ba" for "ba"), whatever the word's length
+        words = _WORDS.findall(query)
+        leading = {f"  {words[0]}"[i:i + 3] for i in range(min(len(words[0]), 2))} if words else set()
+        candidates = set.intersection(*(self._postings.get(gram, set()) for gram in leading)) if leading else set(self._fields)
+        results = []
+        for key in candidates:
+            for value in self._fields[key]:
+                if value.startswith(query):
+                    # Exact matches first, then the closest in length
+                    results.append((key, 1.0 if value == query else len(query) / len(value)))
+                    break
+        return results
+
+    def _fuzzy(self, query: str) -> List[Tuple[Hashable, float]]:
+        query_grams = trigrams(query)
+        candidates = set()
+        for gram in query_grams:
+            candidates |= self._postings.get(gram, set())
+        results = []
+        for key in candidates:
+            score = max(similarity(query_grams, field_grams) for field_grams in self._grams[key])
+            if score >= SIMILARITY_THRESHOLD or any(query in value for value in self._fields[key]):
+                results.append((key, score))
+        return results
+
+    def search(self, query: str, mode: str = "prefix", limit: int = 20) -> List[Tuple[Hashable, float]]:
+        """Ranked (key, score) pairs, best first"""
+        query = query.lower().strip()
+        if not query:
+            return []
+        with self._lock:
+            results = self._prefix(query) if mode == "prefix" else self._fuzzy(query)
+        results.sort(key=lambda result: (-result[1], result[0]))
+        return results[:limit]
+
+
+customer_search_index = TrigramIndex()
+order_item_search_index = TrigramIndex()
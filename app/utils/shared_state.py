@@ -0,0 +1,227 @@
+"""State shared by every worker process: the Redis client and work queues.
+
+With state_backend=memory each process keeps its own queues, which is only
+correct for a single worker. With state_backend=redis they live in the
+server at redis_url; without a URL the FakeRedis stand-in keeps the same code
+path inside one process.
+"""
+import asyncio
+import json
+import time
+from collections import defaultdict, deque
+from functools import lru_cache
+from typing import Callable, Dict, List, Optional, Sequence, Set
+
+from app.config import get_settings
+
+# How often blocking list reads on FakeRedis check for new items
+FAKE_REDIS_POLL_INTERVAL = 0.005
+
+
+def _encode(value):
+    return value.encode() if isinstance(value, str) else value
+
+
+class FakePubSub:
+    """Subscriber side of FakeRedis pub/sub, shaped like redis.asyncio's PubSub"""
+
+    def __init__(self, redis: "FakeRedis"):
+        self.redis = redis
+        self.channels: Set[str] = set()
+        self._messages: asyncio.Queue = asyncio.Queue()
+
+    async def subscribe(self, *channels: str):
+        for channel in channels:
+            self.channels.add(channel)
+            self.redis._subscribers[channel].add(self)
+            self._messages.put_nowait({"type": "subscribe", "channel": channel.encode(), "data": len(self.channels)})
+
+    async def unsubscribe(self, *channels: str):
+        for channel in channels or list(self.channels):
+            self.channels.discard(channel)
+            self.redis._subscribers[channel].discard(self)
+
+    async def listen(self):
+        while self.channels:
+            yield await self._messages.get()
+
+    async def aclose(self):
+        await self.unsubscribe()
+
+
+class FakeRedis:
+    """In-process stand-in for the subset of redis.asyncio the app uses"""
+
+    def __init__(self, clock: Callable[[], float] = time.monotonic):
+        self.clock = clock
+        self._data: Dict[str, tuple] = {}
+        self._subscribers: Dict[str, Set[FakePubSub]] = defaultdict(set)
+
+    def _live(self, key: str):
+        entry = self._data.get(key)
+        if entry is not None and entry[1] is not None and entry[1] <= self.clock():
+            del self._data[key]
+            return None
+        return entry
+
+    async def get(self, key: str):
+        entry = self._live(key)
+        return None if entry is None else entry[0]
+
+    async def set(self, key: str, value, px: Optional[int] = None, ex: Optional[int] = None, nx: bool = False):
+        if nx and self._live(key) is not None:
+            return None
+        expires_at = None
+        if px is not None:
+            expires_at = self.clock() + px / 1000
+        elif ex is not None:
+            expires_at = self.clock() + ex
+        self._data[key] = (_encode(value), expires_at)
+        return True
+
+    async def delete(self, *keys: str) -> int:
+        return sum(1 for key in keys if self._data.pop(key, None) is not None)
+
+    async def incr(self, key: str) -> int:
+        entry = self._live(key)
+        value = int(entry[0]) + 1 if entry is not None else 1
+        self._data[key] = (str(value).encode(), entry[1] if entry is not None else None)
+        return value
+
+    async def publish(self, channel: str, message) -> int:
+        subscribers = list(self._subscribers.get(channel, ()))
+        for subscriber in subscribers:
+            subscriber._messages.put_nowait({"type": "message", "channel": channel.encode(), "data": _encode(message)})
+        return len(subscribers)
+
+    def pubsub(self) -> FakePubSub:
+        return FakePubSub(self)
+
+    async def rpush(self, key: str, *values) -> int:
+        entry = self._live(key)
+        items = entry[0] if entry is not None else deque()
+        items.extend(_encode(value) for value in values)
+        self._data[key] = (items, None)
+        return len(items)
+
+    async def lpop(self, key: str, count: Optional[int] = None):
+        entry = self._live(key)
+        if entry is None:
+            return None
+        items = entry[0]
+        popped = [items.popleft() for _ in range(min(count or 1, len(items)))]
+        if not items:
+            del self._data[key]
+        return popped if count is not None else popped[0]
+
+    async def blpop(self, keys: Sequence[str], timeout: float = 0):
+        deadline = None if not timeout else self.clock() + timeout
+        while True:
+            for key in keys:
+                value = await self.lpop(key)
+                if value is not None:
+                    return key.encode(), value
+            if deadline is not None and self.clock() >= deadline:
+                return None
+            await asyncio.sleep(FAKE_REDIS_POLL_INTERVAL)
+
+    async def llen(self, key: str) -> int:
+        entry = self._live(key)
+        return 0 if entry is None else len(entry[0])
+
+
+def redis_client(url: Optional[str]):
+    if not url:
+        return FakeRedis()
+    try:
+        from redis import asyncio as redis
+    except ImportError:
+        raise RuntimeError("redis_url is set but the 'redis' package is not installed")
+    return redis.from_url(url)
+
+
+@lru_cache()
+def get_state_client():
+    """The one client per process for caches, idempotency and queues"""
+    return redis_client(get_settings().redis_url)
+
+
+class MemoryQueue:
+    """FIFO local to this process; whatever is left in it is lost on exit"""
+
+    shared = False
+
+    def __init__(self):
+        self._items: asyncio.Queue = asyncio.Queue()
+
+    async def put_many(self, items: Sequence):
+        for item in items:
+            self._items.put_nowait(item)
+
+    async def get_batch(self, max_items: int, wait: float, timeout: Optional[float] = None) -> List:
+        """Waits up to `timeout` for an item, then up to `wait` more for the rest of a batch"""
+        try:
+            batch = [await asyncio.wait_for(self._items.get(), timeout)]
+        except asyncio.TimeoutError:
+            return []
+        loop = asyncio.get_running_loop()
+        deadline = loop.time() + wait
+        while len(batch) < max_items:
+            remaining = deadline - loop.time()
+            if remaining <= 0:
+                break
+            try:
+                batch.append(await asyncio.wait_for(self._items.get(), remaining))
+            except asyncio.TimeoutError:
+                break
+        return batch
+
+    async def ack(self, batch: List):
+        """Nothing to do: get_batch already removed the items"""
+
+    async def size(self) -> int:
+        return self._items.qsize()
+
+
+class RedisQueue:
+    """FIFO in a Redis list, shared by every process using the same server and name.
+
+    Queued items outlive the process, but get_batch pops them: a batch is
+    delivered at most once and is lost if its worker dies before handling it.
+    """
+
+    shared = True
+
+    def __init__(self, client, name: str, poll_interval: float = 0.01):
+        self.client = client
+        self.key = f"queue:{name}"
+        self.poll_interval = poll_interval
+
+    async def put_many(self, items: Sequence):
+        if items:
+            await self.client.rpush(self.key, *(json.dumps(list(item)) for item in items))
+
+    async def get_batch(self, max_items: int, wait: float, timeout: Optional[float] = None) -> List:
+        # BLPOP treats 0 as "block forever"
+        popped = await self.client.blpop([self.key], timeout=0 if timeout is None else max(timeout, 0.001))
+        if popped is None:
+            return []
+        batch = [popped[1]]
+        loop = asyncio.get_running_loop()
+        deadline = loop.time() + wait
+        while len(batch) < max_items:
+            more = await self.client.lpop(self.key, max_items - len(batch))
+            if more:
+                batch.extend(more)
+                continue
+            remaining = deadline - loop.time()
+            if remaining <= 0:
+                break
+            await asyncio.sleep(min(self.poll_interval, remaining))
+        return [tuple(json.loads(item)) for item in batch]
+
+    async def ack(self, batch: List):
+        """Nothing to do: get_batch already popped the items"""
+
+    async def size(self) -> int:
+        return await self.client.llen(self.key)
@@ -0,0 +1,199 @@
+import asyncio
+import logging
+from collections import deque
+from datetime import datetime, timedelta, timezone
+from functools import lru_cache
+from typing import Deque, List, Optional, Sequence, Tuple
+
+from sqlalchemy import delete, func, insert, or_, select, update
+from sqlalchemy.ext.asyncio import AsyncSession
+
+from app.config import get_settings
+from app.db import AsyncSessionLocal
+from app.models.models import SmsOutbox
+from app.utils.shared_state import MemoryQueue
+from app.utils.sms_sender import InfobipProvider, StubSmsProvider
+
+logger = logging.getLogger(__name__)
+
+# Longest the worker waits for messages before checking whether it should stop
+STOP_POLL_INTERVAL = 0.1
+# Messages given up on that are kept for inspection; older ones are only in the log
+FAILED_HISTORY = 1000
+
+
+def _utcnow() -> datetime:
+    return datetime.now(timezone.utc).replace(tzinfo=None)
+
+
+class OutboxQueue:
+    """Queue over the sms_outbox table, shared by every worker on the same database.
+
+    Producers stage() rows in their own transaction, so a message exists exactly
+    when its order does. get_batch() claims rows for `lease` seconds and ack()
+    deletes them once handled; rows of a worker that dies mid-send are claimed
+    again when the lease lapses, so delivery is at least once. One consumer per
+    instance, as ack() applies to the batch last returned.
+    """
+
+    shared = True
+
+    def __init__(self, session_factory, lease: float = 60, poll_interval: float = 0.5):
+        self.session_factory = session_factory
+        self.lease = lease
+        self.poll_interval = poll_interval
+        self._claimed: List[int] = []
+        self._next_poll = 0.0
+
+    async def stage(self, db: AsyncSession, items: Sequence):
+        if items:
+            await db.execute(insert(SmsOutbox), [{"phone_number": to, "message": message} for to, message in items])
+
+    async def put_many(self, items: Sequence):
+        async with self.session_factory() as db:
+            await self.stage(db, items)
+            await db.commit()
+
+    async def _claim(self, max_items: int) -> List:
+        now = _utcnow()
+        claimable = select(SmsOutbox.id).where(
+            or_(SmsOutbox.claimed_until.is_(None), SmsOutbox.claimed_until < now)
+        ).order_by(SmsOutbox.id).limit(max_items).with_for_update(skip_locked=True)
+        async with self.session_factory() as db:
+            result = await db.execute(
+                update(SmsOutbox).where(SmsOutbox.id.in_(claimable.scalar_subquery()))
+                .values(claimed_until=now + timedelta(seconds=self.lease))
+                .returning(SmsOutbox.id, SmsOutbox.phone_number, SmsOutbox.message),
+                execution_options={"synchronize_session": False},
+            )
+            rows = sorted(result.all())
+            await db.commit()
+        self._claimed = [row.id for row in rows]
+        return [(row.phone_number, row.message) for row in rows]
+
+    async def get_batch(self, max_items: int, wait: float, timeout: Optional[float] = None) -> List:
+        """Claims up to `max_items` rows, reading the table at most every poll_interval
+        for up to `timeout`. Rows are committed already, so `wait` is not needed"""
+        loop = asyncio.get_running_loop()
+        deadline = None if timeout is None else loop.time() + timeout
+        while True:
+            now = loop.time()
+            if now >= self._next_poll:
+                batch = await self._claim(max_items)
+                # A full batch suggests a backlog, so read again straight away
+                self._next_poll = now if len(batch) == max_items else now + self.poll_interval
+                if batch:
+                    return batch
+            if deadline is not None and now >= deadline:
+                return []
+            wake = self._next_poll if deadline is None else min(self._next_poll, deadline)
+            await asyncio.sleep(wake - now)
+
+    async def ack(self, batch: List):
+        claimed, self._claimed = self._claimed, []
+        if claimed:
+            async with self.session_factory() as db:
+                await db.execute(delete(SmsOutbox).where(SmsOutbox.id.in_(claimed)))
+                await db.commit()
+
+    async def size(self) -> int:
+        async with self.session_factory() as db:
+            return (await db.execute(select(func.count(SmsOutbox.id)))).scalar_one()
+
+
+class SmsQueue:
+    """Outbox for SMS notifications, drained in batches by a background worker"""
+
+    def __init__(self, provider, batch_size: int = 100, flush_interval: float = 0.05,
+                 max_retries: int = 3, retry_backoff: float = 0.5, backend=None,
+                 max_failed: int = FAILED_HISTORY):
+        self.provider = provider
+        self.batch_size = batch_size
+        self.flush_interval = flush_interval
+        self.max_retries = max_retries
+        self.retry_backoff = retry_backoff
+        self.backend = backend or MemoryQueue()
+        self._worker: Optional[asyncio.Task] = None
+        self._stopping = False
+        self.failed: Deque[Tuple[str, str]] = deque(maxlen=max_failed)
+
+    async def stage(self, db: AsyncSession, messages):
+        """Adds messages to the caller's transaction: they are sent once it commits,
+        and never if it rolls back. Needs a backend with stage(), such as OutboxQueue"""
+        await self.backend.stage(db, list(messages))
+
+    async def enqueue(self, to: str, message: str):
+        await self.backend.put_many([(to, message)])
+
+    async def enqueue_many(self, messages):
+        await self.backend.put_many(list(messages))
+
+    async def pending(self) -> int:
+        return await self.backend.size()
+
+    async def start(self):
+        if self._worker is None:
+            self._stopping = False
+            self._worker = asyncio.create_task(self._run())
+
+    async def stop(self):
+        """Flushes what this process enqueued, then stops the worker.
+
+        A shared backend keeps its backlog for the other workers, so only the
+        batch in flight is finished. If the process is killed before that batch
+        is sent, OutboxQueue hands it to another worker once its lease lapses;
+        RedisQueue has already popped it, so it is lost.
+        """
+        if self._worker is None:
+            return
+        self._stopping = True
+        await self._worker
+        self._worker = None
+        self.provider.close()
+
+    async def _run(self):
+        while not (self._stopping and (self.backend.shared or await self.backend.size() == 0)):
+            try:
+                batch = await self.backend.get_batch(self.batch_size, self.flush_interval, timeout=STOP_POLL_INTERVAL)
+            except Exception:
+                # A shared backend can be briefly unreachable; keep the worker alive
+                logger.exception("Reading the SMS queue failed")
+                await asyncio.sleep(self.retry_backoff)
+                continue
+            if batch:
+                await self._dispatch(batch)
+                try:
+                    await self.backend.ack(batch)
+                except Exception:
+                    # The batch is sent again when its claim lapses
+                    logger.exception("Acknowledging %d sent SMS failed", len(batch))
+
+    async def _dispatch(self, batch: List[Tuple[str, str]]):
+        for attempt in range(self.max_retries + 1):
+            try:
+                # The provider uses blocking I/O, keep it off the event loop
+                return await asyncio.to_thread(self.provider.send_batch, batch)
+            except Exception as error:
+                if attempt == self.max_retries:
+                    logger.error("Dropping %d SMS after %d attempts: %s", len(batch), attempt + 1, error)
+                    self.failed.extend(batch)
+                    return None
+                await asyncio.sleep(self.retry_backoff * 2 ** attempt)
+
+
+@lru_cache()
+def get_sms_queue() -> SmsQueue:
+    settings = get_settings()
+    if settings.env == "test" or settings.sms_provider == "stub":
+        provider = StubSmsProvider()
+    else:
+        provider = InfobipProvider()
+    return SmsQueue(
+        provider,
+        batch_size=settings.sms_batch_size,
+        flush_interval=settings.sms_flush_interval,
+        max_retries=settings.sms_max_retries,
+        retry_backoff=settings.sms_retry_backoff,
+        backend=OutboxQueue(AsyncSessionLocal, lease=settings.sms_outbox_lease,
+                            poll_interval=settings.sms_outbox_poll_interval),
+    )
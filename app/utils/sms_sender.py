@@ -1,24 +1,89 @@
 import http.client
 import json
+from typing import Iterable, List, Tuple
 
+SMS_HOST = "z16rz6.api.infobip.com"
+SMS_PATH = "/sms/2/text/advanced"
+SMS_FROM = "ServiceSMS"
+SMS_HEADERS = {
+    'Authorization': 'App ac9d986eb238795d6a795a9b91f9b3b7-99347ff5-6560-4d8f-84ee-323bd0d5064c',
+    'Content-Type': 'application/json',
+    'Accept': 'application/json'
+}
 
-def send_sms(to: str, message: str):
-    conn = http.client.HTTPSConnection("z16rz6.api.infobip.com")
-    payload = json.dumps({
+
+class SmsDeliveryError(Exception):
+    """Raised when the provider rejects a batch with a retryable error"""
+
+
+def build_payload(messages: Iterable[Tuple[str, str]]) -> str:
+    return json.dumps({
         "messages": [
             {
                 "destinations": [{"to": to}],
-                "from": "ServiceSMS",
-                "text": message
+                "from": SMS_FROM,
+                "text": text
             }
+            for to, text in messages
         ]
     })
-    headers = {
-        'Authorization': 'App ac9d986eb238795d6a795a9b91f9b3b7-99347ff5-6560-4d8f-84ee-323bd0d5064c',
-        'Content-Type': 'application/json',
-        'Accept': 'application/json'
-    }
-    conn.request("POST", "/sms/2/text/advanced", payload, headers)
-    res = conn.getresponse()
-    data = res.read()
-    return data.decode("utf-8")
\ No newline at end of file
+
+
+class InfobipProvider:
+    """Sends SMS batches over a single keep-alive HTTPS connection"""
+
+    def __init__(self, host: str = SMS_HOST, timeout: float = 10.0):
+        self.host = host
+        self.timeout = timeout
+        self._conn = None
+
+    def _connection(self):
+        if self._conn is None:
+            self._conn = http.client.HTTPSConnection(self.host, timeout=self.timeout)
+        return self._conn
+
+    def send_batch(self, messages: List[Tuple[str, str]]) -> str:
+        conn = self._connection()
+        try:
+            conn.request("POST", SMS_PATH, build_payload(messages), SMS_HEADERS)
+            res = conn.getresponse()
+            data = res.read()
+        except (http.client.HTTPException, OSError):
+            # The pooled connection is unusable after a transport error
+            self.close()
+            raise
+
+        if res.status == 429 or res.status >= 500:
+            raise SmsDeliveryError(f"SMS provider returned {res.status}")
+        return data.decode("utf-8")
+
+    def close(self):
+        if self._conn is not None:
+            self._conn.close()
+            self._conn = None
+
+
+class StubSmsProvider:
+    """Records batches in memory instead of calling the provider"""
+
+    def __init__(self):
+        self.batches: List[List[Tuple[str, str]]] = []
+
+    @property
+    def sent(self) -> List[Tuple[str, str]]:
+        return [message for batch in self.batches for message in batch]
+
+    def send_batch(self, messages: List[Tuple[str, str]]) -> str:
+        self.batches.append(list(messages))
+        return json.dumps({"messages": [{"to": to, "status": "STUB"} for to, _ in messages]})
+
+    def close(self):
+        pass
+
+
+def send_sms(to: str, message: str):
+    provider = InfobipProvider()
+    try:
+        return provider.send_batch([(to, message)])
+    finally:
+        provider.close()
@@ -0,0 +1,24 @@
+"""Read conditions for soft-deleted customers.
+
+Deleting a customer only sets customers.deleted_at, so the request returns at
+once however many orders the customer has; the purger in app/routes/customers.py
+removes the orders later in batches. Until then every read filters with the
+conditions below. The order conditions anti-join against ix_customers_deleted,
+a partial index holding only the customers awaiting the purge, so they stay
+cheap however large the tables are.
+"""
+from sqlalchemy import exists
+
+from app.models.models import Customer, Order, OrderDailyRollup
+
+CUSTOMER_IS_LIVE = Customer.deleted_at.is_(None)
+
+
+def _customer_is_deleted(customer_id_column):
+    return exists().where(
+        Customer.id == customer_id_column, Customer.deleted_at.isnot(None)
+    ).correlate_except(Customer)
+
+
+ORDER_IS_LIVE = ~_customer_is_deleted(Order.customer_id)
+ROLLUP_IS_LIVE = ~_customer_is_deleted(OrderDailyRollup.customer_id)
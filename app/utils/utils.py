@@ -1,4 +1,10 @@
-from typing import Any, Optional
+import asyncio
+import hashlib
+import logging
+import time
+from collections import OrderedDict
+from functools import lru_cache
+from typing import Any, Awaitable, Callable, Dict, Optional, Tuple
 
 import jwt
 from fastapi import Depends, HTTPException, status
@@ -6,6 +12,9 @@ from fastapi.security import (HTTPAuthorizationCredentials, HTTPBearer,
                               SecurityScopes)
 
 from app.config import get_settings
+from app.utils.profiling import profile_phase
+
+logger = logging.getLogger(__name__)
 
 
 class UnauthorizedException(HTTPException):
@@ -21,16 +30,183 @@ class UnauthenticatedException(HTTPException):
         )
 
 
+class TokenCache:
+    """LRU of validated token payloads keyed by token hash, bounded by each token's exp"""
+
+    def __init__(self, max_size: int = 10000, ttl: float = 300, clock: Callable[[], float] = time.time):
+        self.max_size = max_size
+        self.ttl = ttl
+        self.clock = clock
+        self._entries: "OrderedDict[str, tuple]" = OrderedDict()
+
+    @staticmethod
+    def _key(token: str) -> str:
+        return hashlib.sha256(token.encode()).hexdigest()
+
+    def get(self, token: str) -> Optional[dict]:
+        key = self._key(token)
+        entry = self._entries.get(key)
+        if entry is None:
+            return None
+        payload, expires_at = entry
+        if expires_at <= self.clock():
+            del self._entries[key]
+            return None
+        self._entries.move_to_end(key)
+        return payload
+
+    def set(self, token: str, payload: dict):
+        expires_at = self.clock() + self.ttl
+        if "exp" in payload:
+            expires_at = min(expires_at, float(payload["exp"]))
+        key = self._key(token)
+        self._entries[key] = (payload, expires_at)
+        self._entries.move_to_end(key)
+        while len(self._entries) > self.max_size:
+            self._entries.popitem(last=False)
+
+    def __len__(self):
+        return len(self._entries)
+
+
+class JwksCache:
+    """Signing keys indexed by kid, refreshed in the background and fetched once per unknown kid"""
+
+    # Floor between forced fetches so unknown kids cannot hammer the JWKS endpoint
+    min_refresh_interval = 10.0
+
+    def __init__(self, jwks_url: str, refresh_interval: float = 3600,
+                 fetch: Optional[Callable[[], Dict[str, Any]]] = None,
+                 clock: Callable[[], float] = time.monotonic):
+        self.jwks_url = jwks_url
+        self.refresh_interval = refresh_interval
+        self.clock = clock
+        self._fetch = fetch or self._fetch_keys
+        self._keys: Dict[str, Any] = {}
+        self._fetched_at: Optional[float] = None
+        self._refresh_task: Optional[asyncio.Task] = None
+
+    def _fetch_keys(self) -> Dict[str, Any]:
+        client = jwt.PyJWKClient(self.jwks_url, cache_jwk_set=False)
+        return {
+            jwk.key_id: jwk.key
+            for jwk in client.get_jwk_set().keys
+            if jwk.public_key_use in ("sig", None) and jwk.key_id
+        }
+
+    async def _do_refresh(self):
+        self._keys = await asyncio.to_thread(self._fetch)
+        self._fetched_at = self.clock()
+
+    async def refresh(self):
+        # Concurrent callers share one in-flight fetch
+        if self._refresh_task is None or self._refresh_task.done():
+            self._refresh_task = asyncio.create_task(self._do_refresh())
+        await asyncio.shield(self._refresh_task)
+
+    def _refresh_in_background(self):
+        if self._refresh_task is not None and not self._refresh_task.done():
+            return
+        self._refresh_task = asyncio.create_task(self._do_refresh())
+        self._refresh_task.add_done_callback(self._log_refresh_error)
+
+    @staticmethod
+    def _log_refresh_error(task: asyncio.Task):
+        if not task.cancelled() and task.exception() is not None:
+            logger.warning("JWKS refresh failed: %s", task.exception())
+
+    async def get_signing_key(self, kid: Optional[str]):
+        key = self._keys.get(kid) if kid else None
+        now = self.clock()
+        if key is None:
+            if self._fetched_at is None or now - self._fetched_at >= self.min_refresh_interval:
+                try:
+                    await self.refresh()
+                except Exception as error:
+                    raise jwt.exceptions.PyJWKClientError(f"Fail to fetch data from the url, err: {error}")
+                key = self._keys.get(kid) if kid else None
+            if key is None:
+                raise jwt.exceptions.PyJWKClientError(f'Unable to find a signing key that matches: "{kid}"')
+        elif now - self._fetched_at >= self.refresh_interval:
+            self._refresh_in_background()
+        return key
+
+
+class ClientCredentialsCache:
+    """Client-credentials token responses, served until shortly before they expire.
+
+    Entries are keyed by client id, a hash of the secret, audience and scope,
+    so a wrong secret never gets someone else's token. Concurrent misses for
+    one key share a single upstream fetch.
+    """
+
+    def __init__(self, refresh_margin: float = 60, max_size: int = 1000, clock: Callable[[], float] = time.monotonic):
+        self.refresh_margin = refresh_margin
+        self.max_size = max_size
+        self.clock = clock
+        self._entries: "OrderedDict[Tuple, tuple]" = OrderedDict()
+        self._fetches: Dict[Tuple, asyncio.Task] = {}
+
+    @staticmethod
+    def key(client_id: str, client_secret: str, audience: str, scope: Optional[str] = None) -> Tuple:
+        return client_id, hashlib.sha256(client_secret.encode()).hexdigest(), audience, scope or ""
+
+    def _cached(self, key: Tuple) -> Optional[dict]:
+        entry = self._entries.get(key)
+        if entry is None:
+            return None
+        token, expires_at, refresh_at = entry
+        now = self.clock()
+        if now >= refresh_at:
+            del self._entries[key]
+            return None
+        self._entries.move_to_end(key)
+        # Report the remaining lifetime so callers that cache it do not overrun it
+        return {**token, "expires_in": int(expires_at - now)}
+
+    async def _fetch(self, key: Tuple, fetch: Callable[[], Awaitable[dict]]) -> dict:
+        token = await fetch()
+        expires_in = token.get("expires_in")
+        if isinstance(expires_in, (int, float)) and expires_in > 0:
+            fetched_at = self.clock()
+            margin = min(self.refresh_margin, expires_in / 2)
+            self._entries[key] = (token, fetched_at + expires_in, fetched_at + expires_in - margin)
+            self._entries.move_to_end(key)
+            while len(self._entries) > self.max_size:
+                self._entries.popitem(last=False)
+        return token
+
+    async def get(self, key: Tuple, fetch: Callable[[], Awaitable[dict]]) -> dict:
+        token = self._cached(key)
+        if token is not None:
+            return token
+        task = self._fetches.get(key)
+        if task is None:
+            task = asyncio.create_task(self._fetch(key, fetch))
+            self._fetches[key] = task
+            task.add_done_callback(lambda _: self._fetches.pop(key, None))
+        # One caller disconnecting must not cancel the fetch the others wait on
+        return await asyncio.shield(task)
+
+    def __len__(self):
+        return len(self._entries)
+
+
 class VerifyToken:
     """Does all the token verification using PyJWT"""
 
-    def __init__(self):
+    def __init__(self, jwks_cache: Optional[JwksCache] = None, token_cache: Optional[TokenCache] = None):
         self.config = get_settings()
 
+        self.jwks = jwks_cache
+        self.token_cache = token_cache
+
         # Only set up JWKS client if not in test environment
-        if self.config.env != "test":
+        if self.config.env != "test" and self.jwks is None:
             jwks_url = f'https://{self.config.auth0_domain}/.well-known/jwks.json'
-            self.jwks_client = jwt.PyJWKClient(jwks_url)
+            self.jwks = JwksCache(jwks_url, self.config.auth_jwks_refresh_interval)
+        if self.jwks is not None and self.token_cache is None:
+            self.token_cache = TokenCache(self.config.auth_token_cache_size, self.config.auth_token_cache_ttl)
 
     async def verify(self,
                      security_scopes: SecurityScopes,
@@ -39,23 +215,33 @@ class VerifyToken:
         if token is None:
             raise UnauthenticatedException
 
-        if self.config.env == "test":
+        if self.jwks is None:
             # For test environment, return a dummy payload
             return {"sub": "test_user"}
 
-        # For non-test environment, use the original logic
+        with profile_phase("auth"):
+            payload = self.token_cache.get(token.credentials)
+            if payload is None:
+                payload = await self._decode(token.credentials)
+                self.token_cache.set(token.credentials, payload)
+
+        if len(security_scopes.scopes) > 0:
+            self._check_claims(payload, 'scope', security_scopes.scopes)
+
+        return payload
+
+    async def _decode(self, credentials: str) -> Any:
         try:
-            signing_key = self.jwks_client.get_signing_key_from_jwt(
-                token.credentials
-            ).key
+            kid = jwt.get_unverified_header(credentials).get("kid")
+            signing_key = await self.jwks.get_signing_key(kid)
         except jwt.exceptions.PyJWKClientError as error:
             raise UnauthorizedException(str(error))
         except jwt.exceptions.DecodeError as error:
             raise UnauthorizedException(str(error))
 
         try:
-            payload: Any = jwt.decode(
-                token.credentials,
+            return jwt.decode(
+                credentials,
                 signing_key,
                 algorithms=self.config.auth0_algorithms,
                 audience=self.config.auth0_api_audience,
@@ -64,11 +250,6 @@ class VerifyToken:
         except Exception as error:
             raise UnauthorizedException(str(error))
 
-        if len(security_scopes.scopes) > 0:
-            self._check_claims(payload, 'scope', security_scopes.scopes)
-
-        return payload
-
     def _check_claims(self, payload, claim_name, expected_value):
         if claim_name not in payload:
             raise UnauthorizedException(detail=f'No claim "{claim_name}" found in token')
@@ -80,4 +261,10 @@ class VerifyToken:
 
         for value in expected_value:
             if value not in payload_claim:
-                raise UnauthorizedException(detail=f'Missing "{claim_name}" scope')
\ No newline at end of file
+                raise UnauthorizedException(detail=f'Missing "{claim_name}" scope')
+
+
+@lru_cache()
+def get_token_verifier() -> VerifyToken:
+    """The verifier shared by every router, so they share one set of caches"""
+    return VerifyToken()
@@ -0,0 +1,146 @@
+"""Latency and throughput of the main API endpoints through the ASGI app.
+
+Seeds the database, then drives each scenario with concurrent clients and
+reports p50/p95/p99 latency and requests/s as JSON. Save a run with --output
+and pass it back with --baseline to flag regressions between releases.
+
+    python -m benchmarks.bench_api --url postgresql://... --orders 200000 --output bench_api.json
+    python -m benchmarks.bench_api --baseline bench_api.json --threshold 0.2
+"""
+import argparse
+import asyncio
+import json
+import os
+import platform
+import random
+import sys
+import time
+from datetime import datetime, timedelta
+
+SCENARIOS = ("create_order", "date_range", "list", "get_by_id")
+
+
+def parse_args():
+    parser = argparse.ArgumentParser()
+    parser.add_argument("--url", default="sqlite:///./bench_api.db")
+    parser.add_argument("--customers", type=int, default=1_000)
+    parser.add_argument("--orders", type=int, default=50_000)
+    parser.add_argument("--scenarios", nargs="+", choices=SCENARIOS, default=list(SCENARIOS))
+    parser.add_argument("--clients", type=int, default=8)
+    parser.add_argument("--requests", type=int, default=1_000, help="Requests per scenario")
+    parser.add_argument("--warmup", type=int, default=50, help="Untimed requests per scenario")
+    parser.add_argument("--seed", type=int, default=42)
+    parser.add_argument("--output", help="Write the JSON report to this file")
+    parser.add_argument("--baseline", help="Earlier JSON report to compare p95 and throughput against")
+    parser.add_argument("--threshold", type=float, default=0.2, help="Allowed relative regression")
+    return parser.parse_args()
+
+
+def make_requests(scenario: str, rng: random.Random, customers: int, orders: int):
+    """Returns a callable issuing one request of the scenario against a client"""
+    start = datetime(2024, 1, 1)
+    if scenario == "create_order":
+        return lambda client: client.post("/api/orders", json={
+            "customer_id": rng.randint(1, customers),
+            "item": f"Item {rng.randint(1, 500)}",
+            "amount": round(rng.uniform(1, 500), 2),
+            "time": (start + timedelta(seconds=rng.randint(0, 365 * 86400))).isoformat(),
+        })
+    if scenario == "date_range":
+        def date_range(client):
+            day = start + timedelta(days=rng.randint(0, 358))
+            return client.get("/api/orders/date_range", params={
+                "start_date": day.strftime("%Y.%m.%d"),
+                "end_date": (day + timedelta(days=6)).strftime("%Y.%m.%d"),
+                "limit": 100,
+            })
+        return date_range
+    if scenario == "list":
+        return lambda client: client.get("/api/orders", params={"skip": rng.randint(0, max(orders - 100, 0)), "limit": 100})
+    return lambda client: client.get(f"/api/orders/{rng.randint(1, orders)}")
+
+
+async def run_scenario(client, request, clients: int, total: int, warmup: int) -> dict:
+    from benchmarks.common import latency_summary
+
+    for _ in range(warmup):
+        (await request(client)).raise_for_status()
+
+    latencies, errors = [], 0
+
+    async def worker(count: int):
+        nonlocal errors
+        for _ in range(count):
+            started = time.perf_counter()
+            response = await request(client)
+            latencies.append(time.perf_counter() - started)
+            if response.status_code >= 400:
+                errors += 1
+
+    started = time.perf_counter()
+    await asyncio.gather(*(worker(total // clients + (i < total % clients)) for i in range(clients)))
+    elapsed = time.perf_counter() - started
+    return {"requests": len(latencies), "errors": errors,
+            "req_per_s": round(len(latencies) / elapsed, 1), **latency_summary(latencies)}
+
+
+def compare(results: dict, baseline: dict, threshold: float) -> list:
+    """Scenarios whose p95 or throughput regressed by more than threshold"""
+    regressions = []
+    for scenario, current in results.items():
+        previous = baseline.get(scenario)
+        if previous is None:
+            continue
+        if current["p95_ms"] > previous["p95_ms"] * (1 + threshold):
+            regressions.append(f"{scenario}: p95 {previous['p95_ms']}ms -> {current['p95_ms']}ms")
+        if current["req_per_s"] < previous["req_per_s"] * (1 - threshold):
+            regressions.append(f"{scenario}: {previous['req_per_s']} -> {current['req_per_s']} req/s")
+    return regressions
+
+
+async def main(args) -> int:
+    import httpx
+
+    from benchmarks.common import make_session, seed
+
+    from app.main import app
+
+    engine, _ = make_session(args.url)
+    seed(engine, args.customers, args.orders, seed_value=args.seed)
+    engine.dispose()
+
+    results = {}
+    transport = httpx.ASGITransport(app=app)
+    async with httpx.AsyncClient(transport=transport, base_url="http://bench",
+                                 headers={"Authorization": "Bearer bench"}) as client:
+        for scenario in args.scenarios:
+            request = make_requests(scenario, random.Random(args.seed), args.customers, args.orders)
+            results[scenario] = await run_scenario(client, request, args.clients, args.requests, args.warmup)
+
+    report = {
+        "config": {
+            "database": args.url.split(":", 1)[0], "customers": args.customers, "orders": args.orders,
+            "clients": args.clients, "requests": args.requests, "seed": args.seed,
+            "python": platform.python_version(), "cache_backend": os.environ.get("CACHE_BACKEND", "memory"),
+        },
+        "results": results,
+    }
+    print(json.dumps(report, indent=2))
+    if args.output:
+        with open(args.output, "w") as output:
+            json.dump(report, output, indent=2)
+
+    if args.baseline:
+        with open(args.baseline) as baseline:
+            regressions = compare(results, json.load(baseline)["results"], args.threshold)
+        for regression in regressions:
+            print(f"REGRESSION {regression}", file=sys.stderr)
+        return 1 if regressions else 0
+    return 0
+
+
+if __name__ == "__main__":
+    args = parse_args()
+    # The app binds its engines to DATABASE_URL at import time
+    os.environ["DATABASE_URL"] = args.url
+    sys.exit(asyncio.run(main(args)))
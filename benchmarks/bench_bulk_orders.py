@@ -0,0 +1,63 @@
+"""Orders/s for one POST-equivalent per order vs the bulk ingestion path.
+
+    python -m benchmarks.bench_bulk_orders --url postgresql://... --orders 100000
+"""
+import argparse
+import asyncio
+import json
+import time
+from datetime import datetime, timedelta
+
+from benchmarks.common import make_async_session, make_session, seed
+
+from app.routes.orders import (OrderCreate, create_order, create_orders_bulk,
+                               validate_bulk_rows)
+
+
+def make_orders(count: int, customers: int):
+    start = datetime(2024, 1, 1)
+    return [
+        {"customer_id": 1 + i % customers, "item": f"Item {i % 500}", "amount": 10.0 + i % 90,
+         "time": (start + timedelta(seconds=i)).isoformat()}
+        for i in range(count)
+    ]
+
+
+async def run(args):
+    engine, _ = make_session(args.url)
+    seed(engine, customers=1_000, orders=0)
+    async_engine, Session = make_async_session(args.url)
+
+    rows = make_orders(args.single_orders, 1_000)
+    async with Session() as db:
+        started = time.perf_counter()
+        for row in rows:
+            await create_order(OrderCreate(**row), db)
+        single_elapsed = time.perf_counter() - started
+
+    rows = make_orders(args.orders, 1_000)
+    async with Session() as db:
+        started = time.perf_counter()
+        valid, errors = validate_bulk_rows(rows)
+        result = await create_orders_bulk(valid, db, args.chunk_size, errors)
+        bulk_elapsed = time.perf_counter() - started
+    await async_engine.dispose()
+
+    print(json.dumps({
+        "single": {"orders": args.single_orders, "orders_per_s": round(args.single_orders / single_elapsed)},
+        "bulk": {"orders": result["inserted"], "chunk_size": args.chunk_size,
+                 "orders_per_s": round(result["inserted"] / bulk_elapsed)},
+    }, indent=2))
+
+
+def main():
+    parser = argparse.ArgumentParser()
+    parser.add_argument("--url", default="sqlite:///./bench_bulk.db")
+    parser.add_argument("--orders", type=int, default=50_000)
+    parser.add_argument("--single-orders", type=int, default=2_000)
+    parser.add_argument("--chunk-size", type=int, default=1_000)
+    asyncio.run(run(parser.parse_args()))
+
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,62 @@
+"""Request throughput against the ASGI app as concurrent clients increase.
+
+    python -m benchmarks.bench_concurrency --url postgresql://... --clients 1 4 16 64
+"""
+import argparse
+import asyncio
+import json
+import os
+import random
+import time
+
+
+def parse_args():
+    parser = argparse.ArgumentParser()
+    parser.add_argument("--url", default="sqlite:///./bench_concurrency.db")
+    parser.add_argument("--customers", type=int, default=1_000)
+    parser.add_argument("--orders", type=int, default=20_000)
+    parser.add_argument("--clients", type=int, nargs="+", default=[1, 4, 16, 64])
+    parser.add_argument("--requests", type=int, default=2_000)
+    return parser.parse_args()
+
+
+async def run_clients(client, clients: int, total: int, customers: int):
+    rng = random.Random(clients)
+    latencies = []
+
+    async def worker(count: int):
+        for _ in range(count):
+            started = time.perf_counter()
+            response = await client.get(f"/api/customers/{rng.randint(1, customers)}")
+            latencies.append(time.perf_counter() - started)
+            response.raise_for_status()
+
+    started = time.perf_counter()
+    await asyncio.gather(*(worker(total // clients) for _ in range(clients)))
+    elapsed = time.perf_counter() - started
+    return {"clients": clients, "requests": len(latencies), "req_per_s": round(len(latencies) / elapsed, 1),
+            "mean_ms": round(sum(latencies) / len(latencies) * 1000, 3)}
+
+
+async def main(args):
+    import httpx
+
+    from benchmarks.common import make_session, seed
+
+    from app.main import app
+
+    engine, _ = make_session(args.url)
+    seed(engine, args.customers, args.orders)
+
+    transport = httpx.ASGITransport(app=app)
+    async with httpx.AsyncClient(transport=transport, base_url="http://bench",
+                                 headers={"Authorization": "Bearer bench"}) as client:
+        results = [await run_clients(client, clients, args.requests, args.customers) for clients in args.clients]
+    print(json.dumps(results, indent=2))
+
+
+if __name__ == "__main__":
+    args = parse_args()
+    # The app binds its engines to DATABASE_URL at import time
+    os.environ["DATABASE_URL"] = args.url
+    asyncio.run(main(args))
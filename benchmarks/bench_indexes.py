@@ -0,0 +1,92 @@
+"""Insert throughput and range-query latency with the legacy single-column
+order indexes vs the consolidated composites.
+
+    python -m benchmarks.bench_indexes --url postgresql://... --orders 200000
+"""
+import argparse
+import json
+import time
+from datetime import datetime, timedelta
+
+from sqlalchemy import insert, inspect, select, text
+
+from benchmarks.common import make_session, percentile, seed
+
+from app.models.models import Order
+
+LEGACY_INDEXES = ("id", "customer_id", "time", "item", "amount", "date_created", "date_updated")
+
+
+def make_orders(count: int, customers: int):
+    start = datetime(2025, 1, 1)
+    return [
+        {"customer_id": 1 + i % customers, "item": f"Item {i % 500}", "amount": 10.0 + i % 90,
+         "time": start + timedelta(seconds=i)}
+        for i in range(count)
+    ]
+
+
+def measure(url: str, legacy: bool, orders: int, inserts: int, queries: int) -> dict:
+    engine, _ = make_session(url)
+    if legacy:
+        # Raw DDL so the legacy indexes never attach to the shared Table
+        with engine.begin() as conn:
+            for column in LEGACY_INDEXES:
+                conn.execute(text(f"CREATE INDEX ix_orders_{column} ON orders ({column})"))
+    seed(engine, customers=1_000, orders=orders)
+
+    rows = make_orders(inserts, 1_000)
+    started = time.perf_counter()
+    with engine.begin() as conn:
+        for offset in range(0, len(rows), 1_000):
+            conn.execute(insert(Order), rows[offset:offset + 1_000])
+    insert_elapsed = time.perf_counter() - started
+
+    by_range, by_customer = [], []
+    with engine.connect() as conn:
+        for i in range(queries):
+            start = datetime(2024, 1, 1) + timedelta(days=i % 360)
+            started = time.perf_counter()
+            conn.execute(
+                select(Order.id, Order.time, Order.amount)
+                .where(Order.time >= start, Order.time < start + timedelta(days=1))
+                .order_by(Order.time, Order.id)
+                .limit(100)
+            ).all()
+            by_range.append((time.perf_counter() - started) * 1000)
+
+            started = time.perf_counter()
+            conn.execute(
+                select(Order.id, Order.time)
+                .where(Order.customer_id == 1 + i % 1_000)
+                .order_by(Order.time.desc())
+                .limit(50)
+            ).all()
+            by_customer.append((time.perf_counter() - started) * 1000)
+    indexes = sorted(index["name"] for index in inspect(engine).get_indexes("orders"))
+    engine.dispose()
+
+    return {
+        "indexes": indexes,
+        "inserts_per_s": round(inserts / insert_elapsed),
+        "date_range_ms": {f"p{p}": round(percentile(by_range, p), 3) for p in (50, 95, 99)},
+        "customer_history_ms": {f"p{p}": round(percentile(by_customer, p), 3) for p in (50, 95, 99)},
+    }
+
+
+def main():
+    parser = argparse.ArgumentParser()
+    parser.add_argument("--url", default="sqlite:///./bench_indexes.db")
+    parser.add_argument("--orders", type=int, default=100_000)
+    parser.add_argument("--inserts", type=int, default=50_000)
+    parser.add_argument("--queries", type=int, default=500)
+    args = parser.parse_args()
+
+    print(json.dumps({
+        "legacy": measure(args.url, True, args.orders, args.inserts, args.queries),
+        "consolidated": measure(args.url, False, args.orders, args.inserts, args.queries),
+    }, indent=2))
+
+
+if __name__ == "__main__":
+    main()
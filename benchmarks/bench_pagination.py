@@ -0,0 +1,53 @@
+"""Per-page latency of offset vs keyset pagination at increasing depth.
+
+    python -m benchmarks.bench_pagination --orders 500000
+"""
+import argparse
+import asyncio
+import json
+import time
+
+from benchmarks.common import make_async_session, make_session, seed
+
+from app.routes.orders import get_orders, get_orders_page
+from app.utils.pagination import encode_cursor
+
+
+async def timed(coro) -> float:
+    started = time.perf_counter()
+    await coro
+    return (time.perf_counter() - started) * 1000
+
+
+async def run(args):
+    engine, _ = make_session(args.url)
+    seed(engine, customers=1_000, orders=args.orders)
+    async_engine, Session = make_async_session(args.url)
+
+    results = []
+    depth = 1
+    while depth * args.page_size < args.orders:
+        skip = depth * args.page_size
+        async with Session() as db:
+            offset_ms = min([await timed(get_orders(skip, args.page_size, db)) for _ in range(args.repeat)])
+            # Orders are seeded with sequential ids, so the cursor for a page starts at `skip`
+            cursor = encode_cursor(skip)
+            keyset_ms = min([await timed(get_orders_page(cursor, args.page_size, db)) for _ in range(args.repeat)])
+        results.append({"page": depth, "offset_ms": round(offset_ms, 3), "keyset_ms": round(keyset_ms, 3)})
+        depth *= 10
+    await async_engine.dispose()
+
+    print(json.dumps(results, indent=2))
+
+
+def main():
+    parser = argparse.ArgumentParser()
+    parser.add_argument("--url", default="sqlite:///./bench_pagination.db")
+    parser.add_argument("--orders", type=int, default=200_000)
+    parser.add_argument("--page-size", type=int, default=100)
+    parser.add_argument("--repeat", type=int, default=5)
+    asyncio.run(run(parser.parse_args()))
+
+
+if __name__ == "__main__":
+    main()
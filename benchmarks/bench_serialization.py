@@ -0,0 +1,70 @@
+"""Date range response cost: ORM objects + OrderResponse + response_model
+validation vs the column projection with the direct encoder.
+
+    python -m benchmarks.bench_serialization --orders 100000
+"""
+import argparse
+import asyncio
+import json
+import time
+from datetime import datetime
+from typing import List
+
+from pydantic import TypeAdapter
+from sqlalchemy import and_, select
+
+from benchmarks.common import make_async_session, make_session, seed
+
+from app.models.models import Order
+from app.routes.orders import OrderResponse, search_orders_by_date_range
+from app.utils.export import dumps
+
+RESPONSE_ADAPTER = TypeAdapter(List[OrderResponse])
+
+
+async def orm_path(db, start: datetime, end: datetime) -> bytes:
+    """The previous implementation, including FastAPI's response_model round trip"""
+    orders = (await db.execute(
+        select(Order).where(and_(Order.time >= start, Order.time <= end))
+    )).scalars().all()
+    models = [OrderResponse.from_orm(order) for order in orders]
+    validated = RESPONSE_ADAPTER.validate_python(models, from_attributes=True)
+    return json.dumps(RESPONSE_ADAPTER.dump_python(validated, mode="json")).encode()
+
+
+async def projection_path(db, start: datetime, end: datetime) -> bytes:
+    return dumps(await search_orders_by_date_range(start.strftime("%Y.%m.%d"), end.strftime("%Y.%m.%d"), db))
+
+
+async def run(args):
+    engine, _ = make_session(args.url)
+    seed(engine, customers=1_000, orders=args.orders)
+    async_engine, Session = make_async_session(args.url)
+    start, end = datetime(2024, 1, 1), datetime(2024, 12, 31, 23, 59, 59)
+
+    results = {}
+    for name, path in (("orm", orm_path), ("projection", projection_path)):
+        timings = []
+        for _ in range(args.repeat):
+            # A fresh session each time, as each request gets one
+            async with Session() as db:
+                started = time.perf_counter()
+                body = await path(db, start, end)
+                timings.append(time.perf_counter() - started)
+        results[name] = {"ms": round(min(timings) * 1000, 1), "bytes": len(body)}
+    await async_engine.dispose()
+
+    results["speedup"] = round(results["orm"]["ms"] / results["projection"]["ms"], 1)
+    print(json.dumps({"orders": args.orders, **results}, indent=2))
+
+
+def main():
+    parser = argparse.ArgumentParser()
+    parser.add_argument("--url", default="sqlite:///./bench_serialization.db")
+    parser.add_argument("--orders", type=int, default=100_000)
+    parser.add_argument("--repeat", type=int, default=3)
+    asyncio.run(run(parser.parse_args()))
+
+
+if __name__ == "__main__":
+    main()
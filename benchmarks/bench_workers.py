@@ -0,0 +1,126 @@
+"""Throughput of the production runner as gunicorn workers are added.
+
+Starts gunicorn.conf.py with each worker count, drives the date range endpoint
+from separate load-generating processes for a fixed duration and reports
+requests/s, speedup over one worker and scaling efficiency (speedup / workers).
+Run on a machine with at least workers + load processes cores, or the load
+generator becomes the bottleneck.
+
+    python -m benchmarks.bench_workers --url postgresql://... --workers 1 2 4 --load-processes 4
+"""
+import argparse
+import asyncio
+import json
+import multiprocessing
+import os
+import random
+import signal
+import subprocess
+import sys
+import time
+from datetime import datetime, timedelta
+
+
+def parse_args():
+    parser = argparse.ArgumentParser()
+    parser.add_argument("--url", default="sqlite:///./bench_workers.db")
+    parser.add_argument("--customers", type=int, default=1_000)
+    parser.add_argument("--orders", type=int, default=50_000)
+    parser.add_argument("--workers", type=int, nargs="+", default=[1, 2, 4])
+    parser.add_argument("--load-processes", type=int, default=4)
+    parser.add_argument("--clients", type=int, default=16, help="Concurrent clients per load process")
+    parser.add_argument("--duration", type=float, default=15, help="Seconds of load per worker count")
+    parser.add_argument("--port", type=int, default=8011)
+    return parser.parse_args()
+
+
+async def drive(base_url: str, clients: int, duration: float, seed: int) -> tuple:
+    import httpx
+
+    rng = random.Random(seed)
+    start = datetime(2024, 1, 1)
+    completed, errors = 0, 0
+    deadline = time.perf_counter() + duration
+
+    async def client_loop(client):
+        nonlocal completed, errors
+        while time.perf_counter() < deadline:
+            day = start + timedelta(days=rng.randint(0, 358))
+            response = await client.get("/api/orders/date_range", params={
+                "start_date": day.strftime("%Y.%m.%d"),
+                "end_date": (day + timedelta(days=6)).strftime("%Y.%m.%d"),
+                "limit": 100,
+            })
+            completed += 1
+            errors += response.status_code >= 400
+
+    limits = httpx.Limits(max_connections=clients, max_keepalive_connections=clients)
+    async with httpx.AsyncClient(base_url=base_url, limits=limits, headers={"Authorization": "Bearer bench"}) as client:
+        await asyncio.gather(*(client_loop(client) for _ in range(clients)))
+    return completed, errors
+
+
+def load_process(base_url: str, clients: int, duration: float, seed: int) -> tuple:
+    return asyncio.run(drive(base_url, clients, duration, seed))
+
+
+def wait_until_up(base_url: str, timeout: float = 30):
+    import httpx
+
+    deadline = time.monotonic() + timeout
+    while time.monotonic() < deadline:
+        try:
+            httpx.get(base_url + "/docs", timeout=1)
+            return
+        except httpx.TransportError:
+            time.sleep(0.2)
+    raise RuntimeError("gunicorn did not start in time")
+
+
+def run_workers(args, workers: int) -> dict:
+    base_url = f"http://127.0.0.1:{args.port}"
+    env = {**os.environ, "WEB_CONCURRENCY": str(workers)}
+    server = subprocess.Popen(
+        [sys.executable, "-m", "gunicorn", "-c", "gunicorn.conf.py", "--bind", f"127.0.0.1:{args.port}",
+         "--log-level", "warning", "app.main:app"],
+        env=env,
+    )
+    try:
+        wait_until_up(base_url)
+        # Warm every worker's connection pool before timing
+        load_process(base_url, workers * 2, 1, seed=0)
+        with multiprocessing.Pool(args.load_processes) as pool:
+            started = time.perf_counter()
+            results = pool.starmap(load_process, [
+                (base_url, args.clients, args.duration, seed) for seed in range(1, args.load_processes + 1)
+            ])
+            elapsed = time.perf_counter() - started
+    finally:
+        server.send_signal(signal.SIGTERM)
+        server.wait(timeout=30)
+    completed = sum(result[0] for result in results)
+    return {"workers": workers, "requests": completed, "errors": sum(result[1] for result in results),
+            "req_per_s": round(completed / elapsed, 1)}
+
+
+def main():
+    from benchmarks.common import make_session, seed
+
+    args = parse_args()
+    engine, _ = make_session(args.url)
+    seed(engine, args.customers, args.orders)
+    engine.dispose()
+
+    # Inherited by gunicorn; ENV=test from benchmarks.common skips Auth0
+    os.environ["DATABASE_URL"] = args.url
+    results = [run_workers(args, workers) for workers in args.workers]
+    single = results[0]["req_per_s"] / results[0]["workers"]
+    for result in results:
+        result["speedup"] = round(result["req_per_s"] / single, 2)
+        result["efficiency"] = round(result["speedup"] / result["workers"], 2)
+    print(json.dumps({"cpus": multiprocessing.cpu_count(), "load_processes": args.load_processes,
+                      "database": args.url.split(":", 1)[0], "results": results}, indent=2))
+
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,124 @@
+"""Latency and statements per write for the RETURNING update/delete paths
+against the previous SELECT, mutate, commit, refresh sequence, and batch
+PATCH against one update per order.
+
+    python -m benchmarks.bench_writes --url postgresql://... --ops 2000
+"""
+import argparse
+import asyncio
+import json
+import random
+import time
+from datetime import datetime, timedelta
+
+from sqlalchemy import event
+
+from benchmarks.common import latency_summary, make_async_session, make_session, seed
+
+from app.models.models import Order
+from app.routes.orders import (OrderBatchPatch, OrderPatch, delete_order,
+                               update_order, update_orders_batch)
+from app.utils.rollups import refresh_daily_rollup
+
+
+async def previous_update_order(order_id: int, order: OrderPatch, db):
+    """update_order before RETURNING: get, mutate, flush, rollups, commit, refresh"""
+    db_order = await db.get(Order, order_id)
+    previous_bucket = (db_order.time.date(), db_order.customer_id, db_order.item)
+    for key, value in order.dict(exclude_unset=True).items():
+        setattr(db_order, key, value)
+    await db.flush()
+    await refresh_daily_rollup(db, *previous_bucket)
+    if (db_order.time.date(), db_order.customer_id, db_order.item) != previous_bucket:
+        await refresh_daily_rollup(db, db_order.time.date(), db_order.customer_id, db_order.item)
+    await db.commit()
+    await db.refresh(db_order)
+    return db_order
+
+
+async def previous_delete_order(order_id: int, db):
+    db_order = await db.get(Order, order_id)
+    await db.delete(db_order)
+    await db.flush()
+    await refresh_daily_rollup(db, db_order.time.date(), db_order.customer_id, db_order.item)
+    await db.commit()
+
+
+class StatementCounter:
+    def __init__(self, engine):
+        self.count = 0
+        event.listen(engine.sync_engine, "before_cursor_execute", self.on_execute)
+
+    def on_execute(self, *args):
+        self.count += 1
+
+
+def make_patch(rng: random.Random) -> dict:
+    return {"amount": round(rng.uniform(1, 500), 2),
+            "time": datetime(2024, 1, 1) + timedelta(seconds=rng.randint(0, 365 * 86400))}
+
+
+async def time_each(Session, counter, ids, write):
+    samples, statements = [], counter.count
+    for order_id in ids:
+        async with Session() as db:
+            started = time.perf_counter()
+            await write(order_id, db)
+            samples.append(time.perf_counter() - started)
+    return {**latency_summary(samples), "statements_per_op": round((counter.count - statements) / len(ids), 1)}
+
+
+async def run(args):
+    engine, _ = make_session(args.url)
+    seed(engine, customers=1_000, orders=args.orders)
+    async_engine, Session = make_async_session(args.url)
+    counter = StatementCounter(async_engine)
+    rng = random.Random(42)
+    ids = rng.sample(range(1, args.orders + 1), args.ops * 4)
+    results = {}
+
+    results["update"] = {
+        "previous": await time_each(Session, counter, ids[:args.ops], lambda order_id, db: previous_update_order(
+            order_id, OrderPatch(**make_patch(rng)), db)),
+        "returning": await time_each(Session, counter, ids[args.ops:2 * args.ops], lambda order_id, db: update_order(
+            order_id, OrderPatch(**make_patch(rng)), db)),
+    }
+    results["delete"] = {
+        "previous": await time_each(Session, counter, ids[2 * args.ops:3 * args.ops], previous_delete_order),
+        "returning": await time_each(Session, counter, ids[3 * args.ops:], delete_order),
+    }
+
+    deleted = set(ids[2 * args.ops:])
+    batch_ids = rng.sample([order_id for order_id in range(1, args.orders + 1) if order_id not in deleted],
+                           args.batch_size)
+    async with Session() as db:
+        started = time.perf_counter()
+        for order_id in batch_ids:
+            await update_order(order_id, OrderPatch(**make_patch(rng)), db)
+        one_by_one = time.perf_counter() - started
+    async with Session() as db:
+        started = time.perf_counter()
+        result = await update_orders_batch([OrderBatchPatch(id=order_id, **make_patch(rng))
+                                            for order_id in batch_ids], db)
+        batch = time.perf_counter() - started
+    await async_engine.dispose()
+
+    results["batch_patch"] = {
+        "orders": args.batch_size,
+        "one_by_one_orders_per_s": round(args.batch_size / one_by_one),
+        "batch_orders_per_s": round(result["updated"] / batch),
+    }
+    print(json.dumps(results, indent=2))
+
+
+def main():
+    parser = argparse.ArgumentParser()
+    parser.add_argument("--url", default="sqlite:///./bench_writes.db")
+    parser.add_argument("--orders", type=int, default=100_000)
+    parser.add_argument("--ops", type=int, default=1_000)
+    parser.add_argument("--batch-size", type=int, default=1_000)
+    asyncio.run(run(parser.parse_args()))
+
+
+if __name__ == "__main__":
+    main()
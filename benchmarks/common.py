@@ -0,0 +1,72 @@
+import os
+import random
+from datetime import datetime, timedelta
+
+# The app reads its settings at import time; benchmarks run without a .env
+for key, value in {
+    "AUTH0_DOMAIN": "bench.local",
+    "AUTH0_API_AUDIENCE": "bench",
+    "AUTH0_ISSUER": "https://bench.local/",
+    "AUTH0_ALGORITHMS": "RS256",
+    "AUTH0_CLIENT_ID": "bench",
+    "AUTH0_CLIENT_SECRET": "bench",
+    "DATABASE_URL": "sqlite:///./bench.db",
+    "ENV": "test",
+}.items():
+    os.environ.setdefault(key, value)
+
+from sqlalchemy import create_engine, insert  # noqa: E402
+from sqlalchemy.ext.asyncio import (async_sessionmaker,  # noqa: E402
+                                    create_async_engine)
+from sqlalchemy.orm import sessionmaker  # noqa: E402
+
+from app.db import async_database_url  # noqa: E402
+from app.models.models import Base, Customer, Order  # noqa: E402
+
+
+def make_session(url: str = "sqlite://"):
+    engine = create_engine(url)
+    Base.metadata.drop_all(engine)
+    Base.metadata.create_all(engine)
+    return engine, sessionmaker(bind=engine)
+
+
+def make_async_session(url: str):
+    """AsyncSession factory over a database already created with make_session"""
+    engine = create_async_engine(async_database_url(url))
+    return engine, async_sessionmaker(engine, autoflush=False, expire_on_commit=False)
+
+
+def seed(engine, customers: int, orders: int, seed_value: int = 42):
+    rng = random.Random(seed_value)
+    start = datetime(2024, 1, 1)
+    with engine.begin() as conn:
+        conn.execute(insert(Customer), [
+            {"name": f"Customer {i}", "code": f"C{i:07d}", "phone_number": f"07{i:08d}"}
+            for i in range(1, customers + 1)
+        ])
+        chunk = 50_000
+        for offset in range(0, orders, chunk):
+            conn.execute(insert(Order), [
+                {
+                    "customer_id": rng.randint(1, customers),
+                    "item": f"Item {rng.randint(1, 500)}",
+                    "amount": round(rng.uniform(1, 500), 2),
+                    "time": start + timedelta(seconds=rng.randint(0, 365 * 86400)),
+                }
+                for _ in range(offset, min(offset + chunk, orders))
+            ])
+
+
+def percentile(samples, pct: float) -> float:
+    ordered = sorted(samples)
+    index = min(len(ordered) - 1, int(round(pct / 100 * (len(ordered) - 1))))
+    return ordered[index]
+
+
+def latency_summary(samples) -> dict:
+    """p50/p95/p99 and mean of latencies given in seconds, reported in ms"""
+    return {
+        **{f"p{pct}_ms": round(percentile(samples, pct) * 1000, 3) for pct in (50, 95, 99)},
+        "mean_ms": round(sum(samples) / len(samples) * 1000, 3),
+    }
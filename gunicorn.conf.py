@@ -0,0 +1,46 @@
+"""Production runner: gunicorn -c gunicorn.conf.py app.main:app
+
+One uvicorn worker per CPU unless WEB_CONCURRENCY says otherwise, but only once
+the cache and shared state live in Redis: with the memory backends each worker
+holds its own copy, so a write would invalidate cached records and deleted
+customer markers in one worker only. The app is imported once in the master and
+forked, so workers share its memory pages.
+"""
+import multiprocessing
+
+from app.config import get_settings
+
+settings = get_settings()
+
+PROCESS_LOCAL = settings.cache_backend == "memory" or settings.state_backend == "memory"
+
+bind = "0.0.0.0:8001"
+workers = settings.web_concurrency or (1 if PROCESS_LOCAL else multiprocessing.cpu_count())
+worker_class = "app.worker.UvicornWorker"
+preload_app = True
+timeout = 30
+graceful_timeout = 30
+keepalive = 5
+# Recycle workers now and then so slow leaks cannot build up
+max_requests = 10000
+max_requests_jitter = 1000
+
+
+def when_ready(server):
+    if workers > 1 and settings.state_backend == "memory":
+        server.log.warning("Running %d workers with state_backend=memory: order feed events and read-your-writes "
+                           "pins stay in the worker that produced them; set STATE_BACKEND=redis and REDIS_URL "
+                           "to share them", workers)
+    if workers > 1 and settings.cache_backend == "memory":
+        server.log.warning("Running %d workers with cache_backend=memory: updates and deletes invalidate "
+                           "cached customers and orders in one worker only, the others serve them until "
+                           "cache_ttl expires; set CACHE_BACKEND=redis and REDIS_URL", workers)
+
+
+def post_fork(server, worker):
+    # Pooled connections must not cross a fork; drop any the master opened while preloading
+    from app.db import async_engine, engine, replica_engines
+
+    engine.dispose(close=False)
+    for async_db_engine in (async_engine, *replica_engines):
+        async_db_engine.sync_engine.dispose(close=False)
@@ -0,0 +1,58 @@
+from unittest.mock import AsyncMock, patch
+
+import pytest
+from sqlalchemy import create_engine
+from sqlalchemy.ext.asyncio import async_sessionmaker, create_async_engine
+from sqlalchemy.orm import sessionmaker
+from sqlalchemy.pool import StaticPool
+
+from app.models.models import Base, Customer
+
+
+@pytest.fixture
+def session_factory():
+    """Session factory over a fresh in-memory SQLite database"""
+    engine = create_engine("sqlite://", connect_args={"check_same_thread": False}, poolclass=StaticPool)
+    Base.metadata.create_all(engine)
+    yield sessionmaker(bind=engine)
+    engine.dispose()
+
+@pytest.fixture
+async def async_session_factory():
+    """AsyncSession factory over a fresh in-memory SQLite database"""
+    engine = create_async_engine("sqlite+aiosqlite://", poolclass=StaticPool)
+    async with engine.begin() as conn:
+        await conn.run_sync(Base.metadata.create_all)
+    yield async_sessionmaker(engine, autoflush=False, expire_on_commit=False)
+    await engine.dispose()
+
+@pytest.fixture
+def seed_customers() -> int:
+    """How many customers the db fixture seeds; override in a module to change it"""
+    return 2
+
+@pytest.fixture
+def seed_rows(seed_customers):
+    """Rows the db fixture commits: customers 1..seed_customers, "Customer <id>" with code C00<id>.
+    Override in a module to seed other rows"""
+    return [
+        Customer(id=customer_id, name=f"Customer {customer_id}", code=f"C{customer_id:03d}",
+                 phone_number=str(customer_id) * 10)
+        for customer_id in range(1, seed_customers + 1)
+    ]
+
+@pytest.fixture
+async def db(async_session_factory, seed_rows):
+    """AsyncSession over a fresh in-memory SQLite database holding seed_rows"""
+    async with async_session_factory() as session:
+        session.add_all(seed_rows)
+        await session.commit()
+        # Tests read the rows back from the database, not the objects seed_rows still holds
+        session.expunge_all()
+        yield session
+
+@pytest.fixture
+def sms_queue():
+    """Stub queue behind the order routes' get_sms_queue"""
+    with patch("app.routes.orders.get_sms_queue", return_value=AsyncMock()) as mock_get_sms_queue:
+        yield mock_get_sms_queue.return_value
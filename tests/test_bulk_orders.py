@@ -0,0 +1,77 @@
+import io
+import json
+from unittest.mock import patch
+
+import pytest
+from sqlalchemy import select
+from starlette.datastructures import UploadFile
+
+from app.models.models import Order
+from app.routes import orders
+from app.routes.orders import (create_orders_bulk, read_bulk_ndjson,
+                               validate_bulk_rows)
+
+
+def order_row(customer_id, item="Item", amount=10.0):
+    return {"customer_id": customer_id, "item": item, "amount": amount, "time": "2024-01-01T12:00:00"}
+
+def test_validate_bulk_rows_reports_invalid_rows():
+    rows, errors = validate_bulk_rows([
+        order_row(1),
+        {"customer_id": 1, "item": "Missing amount", "time": "2024-01-01T12:00:00"},
+        json.dumps(order_row(2)).encode(),
+        b"",
+        b"{not json",
+    ])
+
+    assert [index for index, _ in rows] == [0, 2]
+    assert [error["index"] for error in errors] == [1, 4]
+
+@pytest.mark.asyncio
+async def test_create_orders_bulk_inserts_in_chunks(db, sms_queue):
+    rows, _ = validate_bulk_rows([order_row(1 + i % 2, item=f"Item {i}") for i in range(5)])
+
+    with patch.object(db, "commit", wraps=db.commit) as commit:
+        result = await create_orders_bulk(rows, db, chunk_size=2)
+
+    assert result["inserted"] == 5
+    assert result["errors"] == []
+    assert commit.call_count == 3
+    stored = (await db.execute(select(Order).order_by(Order.id))).scalars().all()
+    assert [order.id for order in stored] == result["order_ids"]
+    assert [order.item for order in stored] == [f"Item {i}" for i in range(5)]
+    assert sms_queue.stage.call_count == 3
+
+@pytest.mark.asyncio
+async def test_create_orders_bulk_reports_unknown_customers(db, sms_queue):
+    rows, errors = validate_bulk_rows([order_row(1), order_row(99), {"customer_id": "x"}, order_row(2)])
+
+    result = await create_orders_bulk(rows, db, chunk_size=10, errors=errors)
+
+    assert result["inserted"] == 2
+    assert [error["index"] for error in result["errors"]] == [1, 2]
+    assert result["errors"][0]["error"] == "Customer not found"
+    messages = list(sms_queue.stage.call_args.args[1])
+    assert [to for to, _ in messages] == ["1111111111", "2222222222"]
+
+@pytest.mark.asyncio
+async def test_read_bulk_ndjson_joins_lines_split_across_reads():
+    lines = [json.dumps(order_row(1, item=f"Item {i}")) for i in range(3)]
+    upload = UploadFile(io.BytesIO("\r\n".join([lines[0], "", "{not json", lines[1], lines[2]]).encode()))
+
+    rows, errors = await read_bulk_ndjson(upload, read_size=7)
+
+    assert [(index, order.item) for index, order in rows] == [(0, "Item 0"), (3, "Item 1"), (4, "Item 2")]
+    assert [error["index"] for error in errors] == [2]
+
+@pytest.mark.asyncio
+async def test_create_orders_bulk_checks_customers_in_batches(db, sms_queue):
+    rows, _ = validate_bulk_rows([order_row(1), order_row(99), order_row(2), order_row(1)])
+
+    with patch.object(orders, "BULK_CUSTOMER_CHUNK", 1), patch.object(db, "execute", wraps=db.execute) as execute:
+        result = await create_orders_bulk(rows, db, chunk_size=10)
+
+    assert result["inserted"] == 3
+    assert [error["index"] for error in result["errors"]] == [1]
+    lookups = [call for call in execute.call_args_list if "FROM customers" in str(call.args[0])]
+    assert len(lookups) == 3
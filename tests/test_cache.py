@@ -0,0 +1,91 @@
+from unittest.mock import AsyncMock, MagicMock, patch
+
+import pytest
+from sqlalchemy.ext.asyncio import AsyncSession
+from starlette.requests import Request
+
+from app.models.models import Customer
+from app.routes.customers import (CustomerUpdate, get_customer_json,
+                                  update_customer)
+from app.utils.cache import MemoryCache, RedisCache, etag_response
+from app.utils.shared_state import FakeRedis
+
+
+@pytest.fixture
+def cache():
+    cache = MemoryCache(max_entries=100, ttl=60)
+    with patch("app.routes.customers.get_cache", return_value=cache):
+        yield cache
+
+@pytest.fixture
+def mock_db():
+    db = AsyncMock(spec=AsyncSession)
+    db.execute.return_value = MagicMock()
+    return db
+
+def make_request(headers=None):
+    raw_headers = [(key.lower().encode(), value.encode()) for key, value in (headers or {}).items()]
+    return Request({"type": "http", "method": "GET", "path": "/", "headers": raw_headers})
+
+@pytest.mark.asyncio
+async def test_memory_cache_ttl_and_lru():
+    now = [0.0]
+    cache = MemoryCache(max_entries=2, ttl=10, clock=lambda: now[0])
+
+    await cache.set("a", "1")
+    await cache.set("b", "2")
+    assert await cache.get("a") == "1"
+    await cache.set("c", "3")
+    assert await cache.get("b") is None
+
+    now[0] = 11.0
+    assert await cache.get("a") is None
+    assert cache.stats.snapshot() == {"hits": 1, "misses": 2, "evictions": 2}
+
+@pytest.mark.asyncio
+async def test_redis_cache_over_fake_client():
+    now = [0.0]
+    cache = RedisCache(FakeRedis(clock=lambda: now[0]), ttl=5)
+
+    await cache.set("customer:1", '{"id":1}')
+    assert await cache.get("customer:1") == '{"id":1}'
+    await cache.delete("customer:1")
+    assert await cache.get("customer:1") is None
+
+    await cache.set("customer:2", "{}")
+    now[0] = 6.0
+    assert await cache.get("customer:2") is None
+    assert cache.stats.hits == 1
+
+@pytest.mark.asyncio
+async def test_get_customer_json_reads_through_cache(cache, mock_db):
+    mock_db.get.return_value = Customer(id=1, name="Test Customer", code="TEST001", phone_number="1234567890")
+
+    first = await get_customer_json(1, mock_db)
+    second = await get_customer_json(1, mock_db)
+
+    assert first == second
+    assert '"code":"TEST001"' in first
+    mock_db.get.assert_awaited_once()
+    assert cache.stats.hits == 1
+
+@pytest.mark.asyncio
+async def test_update_customer_invalidates_cache(cache, mock_db):
+    mock_db.get.return_value = Customer(id=1, name="Old Name", code="OLD001", phone_number="0000000000")
+    await get_customer_json(1, mock_db)
+
+    await update_customer(1, CustomerUpdate(name="New Name"), mock_db)
+
+    assert await cache.get("customer:1") is None
+
+def test_etag_response_returns_304_for_matching_etag():
+    response = etag_response(make_request(), '{"id":1}')
+    etag = response.headers["etag"]
+
+    not_modified = etag_response(make_request({"If-None-Match": etag}), '{"id":1}')
+    changed = etag_response(make_request({"If-None-Match": etag}), '{"id":2}')
+
+    assert response.status_code == 200
+    assert not_modified.status_code == 304
+    assert not_modified.body == b""
+    assert changed.status_code == 200
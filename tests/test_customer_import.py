@@ -0,0 +1,76 @@
+import io
+
+import pytest
+from fastapi import HTTPException
+from openpyxl import Workbook
+
+from app.models.models import Customer
+from app.routes.customers import import_customers
+
+
+@pytest.fixture
+def db(session_factory):
+    with session_factory() as session:
+        session.add(Customer(name="Old Name", code="C001", phone_number="0000000000"))
+        session.commit()
+        yield session
+
+def xlsx_file(rows):
+    workbook = Workbook()
+    sheet = workbook.active
+    for row in rows:
+        sheet.append(row)
+    buffer = io.BytesIO()
+    workbook.save(buffer)
+    buffer.seek(0)
+    return buffer
+
+def test_import_customers_from_csv_upserts_on_code(db):
+    upload = io.BytesIO(
+        b"Name,Code,Phone Number\n"
+        b"New Name,C001,1111111111\n"
+        b"Customer 2,C002,\n"
+        b",,\n"
+        b"Customer 3,C003,3333333333\n"
+    )
+
+    result = import_customers(upload, "customers.csv", db, batch_size=2)
+
+    assert result["processed"] == result["upserted"] == 3
+    assert result["errors"] == []
+    assert len(result["customer_ids"]) == 3
+    customers = {customer.code: customer for customer in db.query(Customer).all()}
+    assert len(customers) == 3
+    assert customers["C001"].name == "New Name"
+    assert customers["C001"].phone_number == "1111111111"
+    assert customers["C002"].phone_number is None
+
+def test_import_customers_from_xlsx(db):
+    upload = xlsx_file([
+        ("name", "code", "phone_number"),
+        ("Customer 2", "C002", 254700000002),
+        ("Missing code", None, None),
+        ("Customer 3", 3, 254700000003.0),
+    ])
+
+    result = import_customers(upload, "customers.xlsx", db)
+
+    assert result["processed"] == 3
+    assert result["upserted"] == 2
+    assert [error["row"] for error in result["errors"]] == [3]
+    customer = db.query(Customer).filter(Customer.code == "3").one()
+    assert customer.phone_number == "254700000003"
+
+def test_import_customers_duplicate_codes_in_batch(db):
+    upload = io.BytesIO(b"name,code\nFirst,C009\nSecond,C009\n")
+
+    result = import_customers(upload, "customers.csv", db)
+
+    assert result["errors"] == []
+    assert db.query(Customer).filter(Customer.code == "C009").one().name == "Second"
+
+def test_import_customers_rejects_unknown_file_type(db):
+    with pytest.raises(HTTPException) as exc_info:
+        import_customers(io.BytesIO(b""), "customers.txt", db)
+
+    assert exc_info.value.status_code == 400
@@ -0,0 +1,50 @@
+import pytest
+from fastapi import HTTPException
+
+from app.routes.customers import get_customer_orders
+from app.routes.orders import create_orders_bulk, validate_bulk_rows
+
+
+@pytest.fixture
+def seed_customers():
+    return 3
+
+@pytest.fixture
+async def db(db, sms_queue):
+    rows, _ = validate_bulk_rows([
+        {"customer_id": 1, "item": "Tea", "amount": 10.0, "time": "2024-01-01T08:00:00"},
+        {"customer_id": 2, "item": "Cake", "amount": 5.0, "time": "2024-01-02T10:00:00"},
+        {"customer_id": 1, "item": "Cake", "amount": 7.0, "time": "2024-02-01T10:00:00"},
+        {"customer_id": 1, "item": "Tea", "amount": 3.0, "time": "2024-02-01T10:00:00"},
+    ])
+    await create_orders_bulk(rows, db=db)
+    return db
+
+@pytest.mark.asyncio
+async def test_customer_orders_pages_newest_first(db):
+    first = await get_customer_orders(1, db, limit=2)
+    second = await get_customer_orders(1, db, cursor=first["next_cursor"], limit=2)
+
+    assert [order.id for order in first["items"]] == [4, 3]
+    assert [order.id for order in second["items"]] == [1]
+    assert second["next_cursor"] is None
+    assert "summary" not in first
+
+@pytest.mark.asyncio
+async def test_customer_orders_date_filter_and_summary(db):
+    result = await get_customer_orders(1, db, start_date="2024.02.01", include_summary=True)
+
+    assert [order.id for order in result["items"]] == [4, 3]
+    assert result["summary"]["order_count"] == 3
+    assert result["summary"]["total_amount"] == 20.0
+    assert result["summary"]["last_order_time"].isoformat() == "2024-02-01T10:00:00"
+
+@pytest.mark.asyncio
+async def test_customer_orders_empty_and_missing(db):
+    result = await get_customer_orders(3, db, include_summary=True)
+    assert result["items"] == []
+    assert result["summary"] == {"order_count": 0, "total_amount": 0.0, "last_order_time": None}
+
+    with pytest.raises(HTTPException) as exc_info:
+        await get_customer_orders(99, db)
+    assert exc_info.value.status_code == 404
@@ -1,20 +1,30 @@
+import asyncio
+from datetime import datetime
 from typing import Any
-from unittest.mock import AsyncMock, Mock
+from unittest.mock import AsyncMock, MagicMock, patch
 
 import pytest
 from fastapi import HTTPException
-from sqlalchemy.orm import Session
+from sqlalchemy import func, select
+from sqlalchemy.ext.asyncio import AsyncSession
 
-from app.models.models import Customer
+from app.models.models import Customer, Order
 from app.routes.customers import (CustomerCreate, CustomerUpdate,
                                   create_customer, delete_customer,
                                   get_all_customers, get_customer,
-                                  update_customer)
+                                  get_customers_page, purge_deleted_customers,
+                                  run_customer_purger, update_customer)
+from app.routes.orders import get_order, get_order_json, order_cache_key
+from app.utils.cache import MemoryCache
+from app.utils.pagination import decode_cursor, encode_cursor
+from app.utils.shared_state import FakeRedis
 
 
 @pytest.fixture
 def mock_db():
-    return Mock(spec=Session)
+    db = AsyncMock(spec=AsyncSession)
+    db.execute.return_value = MagicMock()
+    return db
 
 @pytest.mark.asyncio
 async def test_create_customer(mock_db):
@@ -23,18 +33,14 @@ async def test_create_customer(mock_db):
         code="TEST001",
         phone_number="1234567890"
     )
-    mock_db.add.return_value = None
-    mock_db.commit.return_value = None
-    mock_db.refresh.return_value = None
-
     result: Any = await create_customer(customer_data, mock_db)
 
     assert result.name == customer_data.name
     assert result.code == customer_data.code
     assert result.phone_number == customer_data.phone_number
     mock_db.add.assert_called_once()
-    mock_db.commit.assert_called_once()
-    mock_db.refresh.assert_called_once()
+    mock_db.commit.assert_awaited_once()
+    mock_db.refresh.assert_awaited_once()
 
 @pytest.mark.asyncio
 async def test_get_all_customers(mock_db):
@@ -42,7 +48,7 @@ async def test_get_all_customers(mock_db):
         Customer(id=1, name="Customer 1", code="C001", phone_number="1111111111"),
         Customer(id=2, name="Customer 2", code="C002", phone_number="2222222222")
     ]
-    mock_db.query.return_value.offset.return_value.limit.return_value.all.return_value = mock_customers
+    mock_db.execute.return_value.scalars.return_value.all.return_value = mock_customers
 
     result: Any = await get_all_customers(0, 100, mock_db)
 
@@ -50,10 +56,26 @@ async def test_get_all_customers(mock_db):
     assert result[0].name == "Customer 1"
     assert result[1].name == "Customer 2"
 
+@pytest.mark.asyncio
+async def test_get_customers_page(mock_db):
+    mock_customers = [
+        Customer(id=5, name="Customer 5", code="C005", phone_number="5555555555"),
+        Customer(id=6, name="Customer 6", code="C006", phone_number="6666666666")
+    ]
+    mock_db.execute.return_value.scalars.return_value.all.return_value = mock_customers
+
+    result: Any = await get_customers_page(encode_cursor(4), 1, mock_db)
+
+    assert [customer.id for customer in result["items"]] == [5]
+    assert decode_cursor(result["next_cursor"], int) == [5]
+    statement = str(mock_db.execute.call_args.args[0])
+    assert "customers.id > :id_1" in statement
+    assert "LIMIT :param_1" in statement
+
 @pytest.mark.asyncio
 async def test_get_customer(mock_db):
     mock_customer = Customer(id=1, name="Test Customer", code="TEST001", phone_number="1234567890")
-    mock_db.query.return_value.filter.return_value.first.return_value = mock_customer
+    mock_db.get.return_value = mock_customer
 
     result: Any = await get_customer(1, mock_db)
 
@@ -63,7 +85,7 @@ async def test_get_customer(mock_db):
 
 @pytest.mark.asyncio
 async def test_get_customer_not_found(mock_db):
-    mock_db.query.return_value.filter.return_value.first.return_value = None
+    mock_db.get.return_value = None
 
     with pytest.raises(HTTPException) as exc_info:
         await get_customer(1, mock_db)
@@ -71,32 +93,95 @@ async def test_get_customer_not_found(mock_db):
     assert exc_info.value.status_code == 404
     assert exc_info.value.detail == "Customer not found"
 
-@pytest.mark.asyncio
-async def test_update_customer(mock_db):
-    mock_customer = Customer(id=1, name="Old Name", code="OLD001", phone_number="0000000000")
-    mock_db.query.return_value.filter.return_value.first.return_value = mock_customer
+@pytest.fixture
+def seed_rows():
+    return [
+        Customer(id=1, name="Old Name", code="OLD001", phone_number="0000000000"),
+        Order(id=1, customer_id=1, item="Tea", amount=10.0, time=datetime(2024, 1, 1, 8)),
+    ]
 
+@pytest.mark.asyncio
+async def test_update_customer(db):
     update_data = CustomerUpdate(
         name="New Name",
         code="NEW001",
         phone_number="1111111111"
     )
 
-    result: Any = await update_customer(1, update_data, mock_db)
+    with patch.object(db, "execute", wraps=db.execute) as execute:
+        result: Any = await update_customer(1, update_data, db)
 
     assert result.name == "New Name"
     assert result.code == "NEW001"
     assert result.phone_number == "1111111111"
-    mock_db.commit.assert_called_once()
-    mock_db.refresh.assert_called_once()
+    assert execute.call_count == 1
 
 @pytest.mark.asyncio
-async def test_delete_customer(mock_db):
-    mock_customer = Customer(id=1, name="Test Customer", code="TEST001", phone_number="1234567890")
-    mock_db.query.return_value.filter.return_value.first.return_value = mock_customer
+async def test_update_customer_not_found(db):
+    with pytest.raises(HTTPException) as exc_info:
+        await update_customer(999, CustomerUpdate(name="New Name"), db)
 
-    result = await delete_customer(1, mock_db)
+    assert exc_info.value.status_code == 404
+
+@pytest.mark.asyncio
+async def test_delete_customer(db):
+    result = await delete_customer(1, db)
 
     assert result == {"message": "Customer deleted successfully"}
-    mock_db.delete.assert_called_once_with(mock_customer)
-    mock_db.commit.assert_called_once()
\ No newline at end of file
+    with pytest.raises(HTTPException):
+        await get_customer(1, db)
+    with pytest.raises(HTTPException):
+        await get_order(1, db)
+    # Codes are only unique among live customers
+    await create_customer(CustomerCreate(name="New", code="OLD001", phone_number="1"), db)
+
+@pytest.mark.asyncio
+async def test_cached_order_is_gone_once_its_customer_is_deleted(db):
+    cache = MemoryCache()
+    with patch("app.routes.orders.get_cache", return_value=cache), \
+            patch("app.routes.customers.get_cache", return_value=cache):
+        assert '"item":"Tea"' in await get_order_json(1, db)
+        await delete_customer(1, db)
+        assert await cache.get(order_cache_key(1)) is None
+
+        with pytest.raises(HTTPException) as exc_info:
+            await get_order_json(1, db)
+    assert exc_info.value.status_code == 404
+
+@pytest.mark.asyncio
+async def test_purge_removes_deleted_customers_in_batches(db):
+    db.add_all([Order(customer_id=1, item="Tea", amount=1.0, time=datetime(2024, 1, day)) for day in range(2, 6)])
+    await db.commit()
+    await delete_customer(1, db)
+
+    with patch.object(db, "commit", wraps=db.commit) as commit:
+        purged = await purge_deleted_customers(db, batch_size=2, pause=0)
+
+    assert purged == 5
+    # The id lookup, three order batches, then the customer
+    assert commit.await_count == 5
+    assert (await db.execute(select(func.count()).select_from(Order))).scalar() == 0
+    assert (await db.execute(select(Customer.id).where(Customer.id == 1))).first() is None
+
+@pytest.mark.asyncio
+async def test_only_one_worker_purges_per_lease(async_session_factory):
+    now = [0.0]
+    state = FakeRedis(clock=lambda: now[0])
+    with patch("app.routes.customers.get_state_client", return_value=state), \
+            patch("app.routes.customers.purge_deleted_customers", AsyncMock(return_value=0)) as purge:
+        workers = [asyncio.create_task(run_customer_purger(async_session_factory, 0.01, 10, 0)) for _ in range(2)]
+        await asyncio.sleep(0.05)
+        assert purge.await_count == 1
+
+        now[0] = 1.0
+        await asyncio.sleep(0.05)
+        for worker in workers:
+            worker.cancel()
+    assert purge.await_count == 2
+
+@pytest.mark.asyncio
+async def test_delete_customer_not_found(db):
+    with pytest.raises(HTTPException) as exc_info:
+        await delete_customer(999, db)
+
+    assert exc_info.value.status_code == 404
\ No newline at end of file
@@ -0,0 +1,60 @@
+import csv
+import io
+import json
+from datetime import datetime
+
+import pytest
+
+from app.models.models import Customer, Order
+from app.routes.orders import (OrderResponse, export_orders_by_date_range,
+                               iter_orders_by_date_range)
+from app.utils.export import dumps, encode_csv, encode_ndjson, order_dicts
+
+
+@pytest.fixture(autouse=True)
+def seed_orders(session_factory):
+    with session_factory() as db:
+        db.add(Customer(id=1, name="Test Customer", code="TEST001", phone_number="1234567890"))
+        db.add_all([
+            Order(id=i, customer_id=1, item=f"Item {i}", amount=float(i), time=datetime(2024, 1, i, 12))
+            for i in range(1, 6)
+        ])
+        db.commit()
+
+def test_encode_ndjson_chunks_rows(session_factory):
+    with session_factory() as db:
+        rows = iter_orders_by_date_range(datetime(2024, 1, 1), datetime(2024, 1, 31), db, chunk_size=2)
+        chunks = list(encode_ndjson(rows, chunk_size=2))
+
+    assert len(chunks) == 3
+    lines = "".join(chunks).splitlines()
+    assert [json.loads(line)["id"] for line in lines] == [1, 2, 3, 4, 5]
+    assert json.loads(lines[0])["formatted_time"] == "2024-01-01 12:00:00"
+
+def test_encode_csv_writes_header_once(session_factory):
+    with session_factory() as db:
+        rows = iter_orders_by_date_range(datetime(2024, 1, 2), datetime(2024, 1, 3, 23, 59, 59), db)
+        output = "".join(encode_csv(rows, chunk_size=1))
+
+    records = list(csv.DictReader(io.StringIO(output)))
+    assert [record["item"] for record in records] == ["Item 2", "Item 3"]
+    assert records[0]["amount"] == "2.0"
+
+@pytest.mark.asyncio
+async def test_export_orders_by_date_range_streams_csv(session_factory):
+    response = export_orders_by_date_range("2024.01.01", "2024.01.04", "csv", session_factory)
+
+    body = "".join([chunk async for chunk in response.body_iterator])
+
+    assert response.media_type == "text/csv"
+    assert response.headers["content-disposition"] == 'attachment; filename="orders_20240101_20240104.csv"'
+    assert body.splitlines()[0] == "id,customer_id,item,amount,time,formatted_time"
+    assert len(body.splitlines()) == 5
+
+@pytest.mark.parametrize("time", [datetime(2024, 1, 1, 12), datetime(2024, 1, 1, 12, 30, 5, 120000)])
+def test_order_dicts_match_order_response(time):
+    order = Order(id=7, customer_id=1, item="Tea", amount=12.5, time=time)
+
+    encoded = json.loads(dumps(order_dicts([(order.id, order.customer_id, order.item, order.amount, order.time)])))
+
+    assert encoded == [json.loads(OrderResponse.from_orm(order).model_dump_json())]
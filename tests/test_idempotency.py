@@ -0,0 +1,104 @@
+from datetime import datetime, timedelta, timezone
+from unittest.mock import patch
+
+import pytest
+from fastapi import HTTPException
+from fastapi.responses import JSONResponse
+from sqlalchemy import func, select
+from sqlalchemy.exc import IntegrityError
+
+from app.models.models import IdempotencyKey, Order
+from app.routes.orders import OrderCreate, create_order
+from app.utils.cache import MemoryCache
+from app.utils.idempotency import purge_expired_keys
+from app.utils.sms_queue import OutboxQueue, SmsQueue
+from app.utils.sms_sender import StubSmsProvider
+
+
+@pytest.fixture(autouse=True)
+def cache():
+    cache = MemoryCache()
+    with patch("app.utils.idempotency.get_cache", return_value=cache):
+        yield cache
+
+@pytest.fixture
+def seed_customers():
+    return 1
+
+@pytest.fixture
+def sms_queue(async_session_factory):
+    """The real outbox, so a retry's rolled-back message shows as missing"""
+    queue = SmsQueue(StubSmsProvider(), backend=OutboxQueue(async_session_factory))
+    with patch("app.routes.orders.get_sms_queue", return_value=queue):
+        yield queue
+
+ORDER = OrderCreate(customer_id=1, item="Tea", amount=10.0, time=datetime(2024, 1, 1, 8))
+
+async def order_count(db) -> int:
+    return (await db.execute(select(func.count(Order.id)))).scalar_one()
+
+@pytest.mark.asyncio
+async def test_retry_replays_first_response(db, sms_queue, cache):
+    first = await create_order(ORDER, db, idempotency_key="key-1")
+    replay = await create_order(ORDER, db, idempotency_key="key-1")
+
+    assert isinstance(replay, JSONResponse)
+    assert replay.headers["idempotent-replayed"] == "true"
+    assert b'"id":%d' % first["order"].id in replay.body
+    assert await order_count(db) == 1
+    assert await sms_queue.pending() == 1
+
+    # Still replayed once the front cache has forgotten the key
+    await cache.delete("idempotency:key-1")
+    assert isinstance(await create_order(ORDER, db, idempotency_key="key-1"), JSONResponse)
+    assert await order_count(db) == 1
+
+@pytest.mark.asyncio
+async def test_key_reused_for_different_request(db):
+    await create_order(ORDER, db, idempotency_key="key-1")
+
+    with pytest.raises(HTTPException) as exc_info:
+        await create_order(ORDER.model_copy(update={"amount": 99.0}), db, idempotency_key="key-1")
+    assert exc_info.value.status_code == 422
+
+@pytest.mark.asyncio
+async def test_concurrent_duplicate_keeps_one_order(db, async_session_factory, sms_queue):
+    await create_order(ORDER, db, idempotency_key="key-1")
+
+    # A retry that checked for the key before the first request committed
+    async with async_session_factory() as other:
+        with patch("app.routes.orders.get_stored_response", side_effect=[None, {"replayed": True}]):
+            replay = await create_order(ORDER, other, idempotency_key="key-1")
+
+    assert replay.headers["idempotent-replayed"] == "true"
+    assert await order_count(db) == 1
+    assert await sms_queue.pending() == 1
+
+@pytest.mark.asyncio
+async def test_concurrent_duplicate_colliding_before_commit_is_replayed(db, async_session_factory, sms_queue):
+    await create_order(ORDER, db, idempotency_key="key-1")
+
+    # The losing retry hits the winner's rows while still writing, not at commit
+    collision = IntegrityError("INSERT INTO order_daily_rollups", {}, Exception("duplicate key"))
+    async with async_session_factory() as other:
+        with patch("app.routes.orders.get_stored_response", side_effect=[None, {"replayed": True}]), \
+                patch("app.routes.orders.add_to_daily_rollups", side_effect=collision):
+            replay = await create_order(ORDER, other, idempotency_key="key-1")
+
+    assert replay.headers["idempotent-replayed"] == "true"
+    assert await order_count(db) == 1
+    assert await sms_queue.pending() == 1
+
+@pytest.mark.asyncio
+async def test_expired_keys_are_purged_and_reusable(db, cache):
+    await create_order(ORDER, db, idempotency_key="key-1")
+    stored = await db.get(IdempotencyKey, "key-1")
+    stored.expires_at = datetime.now(timezone.utc).replace(tzinfo=None) - timedelta(seconds=1)
+    await db.commit()
+    await cache.delete("idempotency:key-1")
+
+    assert await purge_expired_keys(db) == 1
+    result = await create_order(ORDER, db, idempotency_key="key-1")
+
+    assert not isinstance(result, JSONResponse)
+    assert await order_count(db) == 2
@@ -0,0 +1,49 @@
+from datetime import datetime
+from unittest.mock import patch
+
+import pytest
+from pydantic import ValidationError
+
+from app.models.models import Customer, Order
+from app.routes.customers import CustomerLookup, lookup_customers
+from app.routes.orders import LOOKUP_MAX_KEYS, OrderLookup, lookup_orders
+
+
+@pytest.fixture
+def seed_rows():
+    return [
+        Customer(id=1, name="Customer 1", code="C001", phone_number="1111111111"),
+        Customer(id=2, name="Customer 2", code="C002", phone_number="2222222222"),
+        Customer(id=3, name="Customer 3", code="C003", phone_number="2222222222"),
+        Order(id=10, customer_id=1, item="Tea", amount=10.0, time=datetime(2024, 1, 1, 8)),
+        Order(id=11, customer_id=2, item="Cake", amount=5.0, time=datetime(2024, 1, 2, 10)),
+    ]
+
+@pytest.mark.asyncio
+async def test_lookup_customers_keeps_request_order_and_reports_missing(db):
+    result = await lookup_customers(CustomerLookup(
+        ids=[3, 99, 1, 3], codes=["C002", "C404", "C001"], phone_numbers=["2222222222", "0000000000"],
+    ), db)
+
+    # 1 and 3 come from ids; C002 adds 2, C001 and the shared phone number add nobody new
+    assert [customer.id for customer in result["items"]] == [3, 1, 2]
+    assert result["missing"] == {"ids": [99], "codes": ["C404"], "phone_numbers": ["0000000000"]}
+
+@pytest.mark.asyncio
+async def test_lookup_customers_runs_one_query_per_key_type(db):
+    with patch.object(db, "execute", wraps=db.execute) as execute:
+        await lookup_customers(CustomerLookup(ids=list(range(1, 200)), phone_numbers=["1111111111"]), db)
+
+    assert execute.call_count == 2
+
+@pytest.mark.asyncio
+async def test_lookup_orders(db):
+    result = await lookup_orders(OrderLookup(ids=[11, 12, 10]), db)
+
+    assert [order["id"] for order in result["items"]] == [11, 10]
+    assert result["items"][1]["formatted_time"] == "2024-01-01 08:00:00"
+    assert result["missing"] == {"ids": [12]}
+
+def test_lookup_rejects_too_many_keys():
+    with pytest.raises(ValidationError):
+        OrderLookup(ids=list(range(LOOKUP_MAX_KEYS + 1)))
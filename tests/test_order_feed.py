@@ -0,0 +1,213 @@
+import asyncio
+import time
+from contextlib import asynccontextmanager
+from datetime import datetime
+from unittest.mock import AsyncMock, MagicMock, patch
+
+import pytest
+from fastapi import FastAPI
+from fastapi.testclient import TestClient
+from starlette.websockets import WebSocketDisconnect
+
+from app.models.models import Customer
+from app.routes.orders import (OrderCreate, OrderUpdate, create_order,
+                               delete_order, encode_sse, router,
+                               update_order, verify_token)
+from app.utils.order_feed import RESYNC, OrderFeed, RedisBroker
+from app.utils.shared_state import FakeRedis
+from app.utils.utils import UnauthorizedException
+
+
+def row(order_id: int, customer_id: int = 1) -> tuple:
+    return order_id, customer_id, "Tea", 10.0, datetime(2024, 1, 1, 8)
+
+
+async def take(events, count: int) -> list:
+    return [await asyncio.wait_for(events.__anext__(), 1) for _ in range(count)]
+
+
+@pytest.fixture
+async def feed():
+    feed = OrderFeed(buffer_size=3, max_pending=2)
+    await feed.start()
+    await asyncio.sleep(0)
+    yield feed
+    await feed.stop()
+
+
+async def test_subscribers_get_only_their_customers_events(feed):
+    everything, customer_2 = feed.subscribe(), feed.subscribe(customer_id=2)
+    first = asyncio.ensure_future(take(everything, 2))
+    second = asyncio.ensure_future(take(customer_2, 1))
+    await asyncio.sleep(0.01)
+
+    await feed.publish("order.created", [row(1, customer_id=1), row(2, customer_id=2)])
+
+    assert [event["order"]["id"] for event in await first] == [1, 2]
+    assert [(event["type"], event["order"]["id"]) for event in await second] == [("order.created", 2)]
+
+
+async def test_resume_replays_the_buffer_or_asks_for_a_resync(feed):
+    await feed.publish("order.created", [row(order_id) for order_id in range(1, 6)])
+    ids = [event["id"] for event in feed.buffer]
+
+    resumed = await take(feed.subscribe(last_event_id=ids[0]), 2)
+    too_old = await take(feed.subscribe(last_event_id=ids[0] - 2), 1)
+
+    assert [event["order"]["id"] for event in resumed] == [4, 5]
+    assert too_old == [RESYNC]
+
+
+async def test_resume_after_a_restart_asks_for_a_resync(feed):
+    # An empty buffer, as after a restart, cannot tell what the client missed
+    assert await take(feed.subscribe(last_event_id=42), 1) == [RESYNC]
+
+    await feed.publish("order.created", [row(1)])
+    unknown = feed.buffer[-1]["id"] + 1
+
+    assert await take(feed.subscribe(last_event_id=unknown), 1) == [RESYNC]
+
+
+async def test_slow_subscriber_is_told_to_resync(feed):
+    events = feed.subscribe()
+    received = asyncio.ensure_future(take(events, 3))
+    await asyncio.sleep(0.01)
+
+    # Two fit in the subscriber's queue, the third overflows it
+    await feed.publish("order.created", [row(order_id) for order_id in range(1, 4)])
+
+    first, second, third = await received
+    assert (first["order"]["id"], second["order"]["id"], third) == (1, 2, RESYNC)
+    with pytest.raises(StopAsyncIteration):
+        await events.__anext__()
+
+
+async def test_heartbeat_when_idle(feed):
+    assert await take(feed.subscribe(heartbeat=0.01), 1) == [None]
+    assert encode_sse(None) == b": keepalive\n\n"
+
+
+async def test_redis_broker_fans_out_across_workers():
+    client = FakeRedis()
+    workers = [OrderFeed(RedisBroker(client)), OrderFeed(RedisBroker(client))]
+    for worker in workers:
+        await worker.start()
+    await asyncio.sleep(0.01)
+
+    listening = asyncio.ensure_future(take(workers[1].subscribe(), 2))
+    await asyncio.sleep(0.01)
+    await workers[0].publish("order.created", [row(1), row(2)])
+    events = await listening
+
+    assert [event["id"] for event in events] == [1, 2]
+    assert [event["id"] for event in workers[0].buffer] == [1, 2]
+    assert encode_sse(events[0]).startswith(b"id: 1\nevent: order.created\ndata: {")
+    for worker in workers:
+        await worker.stop()
+
+
+async def test_order_writes_publish_events(async_session_factory, feed, sms_queue):
+    events = feed.subscribe()
+    received = asyncio.ensure_future(take(events, 3))
+    await asyncio.sleep(0.01)
+
+    with patch("app.routes.orders.get_order_feed", return_value=feed):
+        async with async_session_factory() as db:
+            db.add(Customer(id=1, name="Customer 1", code="C001", phone_number="1111111111"))
+            await db.commit()
+            created = await create_order(OrderCreate(customer_id=1, item="Tea", amount=10.0,
+                                                     time=datetime(2024, 1, 1, 8)), db)
+            order_id = created["order"].id
+            await update_order(order_id, OrderUpdate(item="Cake", amount=5.0, time=datetime(2024, 1, 2, 8)), db)
+            await delete_order(order_id, db)
+
+    assert [(event["type"], event["order"]["id"], event["order"]["item"]) for event in await received] == [
+        ("order.created", order_id, "Tea"), ("order.updated", order_id, "Cake"), ("order.deleted", order_id, "Cake"),
+    ]
+
+
+def feed_app(feed: OrderFeed) -> FastAPI:
+    @asynccontextmanager
+    async def lifespan(app):
+        await feed.start()
+        yield
+        await feed.stop()
+
+    api = FastAPI(lifespan=lifespan)
+    api.include_router(router, prefix="/api")
+    return api
+
+
+def wait_for_subscriber(feed: OrderFeed):
+    deadline = time.monotonic() + 2
+    while not feed._subscriptions and time.monotonic() < deadline:
+        time.sleep(0.01)
+
+
+def test_websocket_streams_events():
+    feed = OrderFeed()
+    # The route verifies the token itself, so dependency overrides do not reach it
+    with patch("app.routes.orders.get_order_feed", return_value=feed), \
+            patch.object(verify_token, "verify", AsyncMock(return_value={"sub": "test_user"})) as verify, \
+            TestClient(feed_app(feed)) as client:
+        with client.websocket_connect("/api/orders/feed/ws?customer_id=2", subprotocols=["bearer", "test"]) as websocket:
+            wait_for_subscriber(feed)
+            client.portal.call(feed.publish, "order.created", [row(1, customer_id=1), row(2, customer_id=2)])
+
+            message = websocket.receive_json()
+
+    assert websocket.accepted_subprotocol == "bearer"
+    assert (message["type"], message["order"]["id"]) == ("order.created", 2)
+    assert verify.await_args.args[1].credentials == "test"
+
+
+def test_websocket_token_in_the_first_message():
+    feed = OrderFeed()
+    with patch("app.routes.orders.get_order_feed", return_value=feed), \
+            patch.object(verify_token, "verify", AsyncMock(return_value={"sub": "test_user"})) as verify, \
+            TestClient(feed_app(feed)) as client:
+        with client.websocket_connect("/api/orders/feed/ws") as websocket:
+            websocket.send_json({"token": "test"})
+            wait_for_subscriber(feed)
+            client.portal.call(feed.publish, "order.created", [row(1)])
+
+            message = websocket.receive_json()
+
+    assert message["order"]["id"] == 1
+    assert verify.await_args.args[1].credentials == "test"
+
+
+@pytest.mark.parametrize("connect, first_message", [
+    ({}, None),
+    ({}, {"token": "bad"}),
+    ({"subprotocols": ["bearer", "bad"]}, None),
+    ({"headers": {"Authorization": "Bearer bad"}}, None),
+])
+def test_websocket_without_a_valid_token_is_closed(connect, first_message):
+    feed = OrderFeed()
+    with patch.object(verify_token, "verify", AsyncMock(side_effect=UnauthorizedException("invalid token"))), \
+            patch("app.routes.orders.FEED_AUTH_TIMEOUT", 0.05), \
+            TestClient(feed_app(feed)) as client:
+        with pytest.raises(WebSocketDisconnect) as exc_info:
+            with client.websocket_connect("/api/orders/feed/ws", **connect) as websocket:
+                if first_message is not None:
+                    websocket.send_json(first_message)
+                websocket.receive_json()
+
+    assert exc_info.value.code == 1008
+
+
+def test_websocket_logs_a_failed_sender(caplog):
+    async def broken(*args):
+        raise RuntimeError("feed is gone")
+        yield
+
+    feed = OrderFeed()
+    with patch("app.routes.orders.get_order_feed", return_value=MagicMock(subscribe=broken)), \
+            patch.object(verify_token, "verify", AsyncMock(return_value={"sub": "test_user"})), \
+            TestClient(feed_app(feed)) as client:
+        with client.websocket_connect("/api/orders/feed/ws", headers={"Authorization": "Bearer test"}):
+            pass
+
+    assert "Order feed WebSocket stopped sending" in caplog.text
+    assert "feed is gone" in caplog.text
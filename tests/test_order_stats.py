@@ -0,0 +1,124 @@
+from datetime import date, datetime
+from unittest.mock import AsyncMock, MagicMock
+
+import pytest
+from sqlalchemy import select
+from sqlalchemy.dialects import postgresql
+from sqlalchemy.ext.asyncio import AsyncSession
+
+from app.models.models import OrderDailyRollup
+from app.routes.customers import delete_customer
+from app.routes.orders import (OrderCreate, OrderUpdate, create_order,
+                               create_orders_bulk, delete_order,
+                               get_order_stats, update_order,
+                               validate_bulk_rows)
+from app.utils.rollups import add_to_daily_rollups, refresh_daily_rollups
+
+
+pytestmark = pytest.mark.usefixtures("sms_queue")
+
+async def seed_orders(db):
+    rows, _ = validate_bulk_rows([
+        {"customer_id": 1, "item": "Tea", "amount": 10.0, "time": "2024-01-01T08:00:00"},
+        {"customer_id": 1, "item": "Tea", "amount": 30.0, "time": "2024-01-01T09:00:00"},
+        {"customer_id": 2, "item": "Cake", "amount": 5.0, "time": "2024-01-02T10:00:00"},
+        {"customer_id": 2, "item": "Tea", "amount": 20.0, "time": "2024-01-09T10:00:00"},
+        {"customer_id": 1, "item": "Cake", "amount": 7.0, "time": "2024-02-01T10:00:00"},
+    ])
+    await create_orders_bulk(rows, db, chunk_size=2)
+
+@pytest.mark.asyncio
+@pytest.mark.parametrize("group_by", ["day", "week", "month", "customer", "item"])
+async def test_rollup_stats_match_live_stats(db, group_by):
+    await seed_orders(db)
+
+    rollup = await get_order_stats("2024.01.01", "2024.12.31", group_by, "rollup", db)
+    live = await get_order_stats("2024.01.01", "2024.12.31", group_by, "orders", db)
+
+    assert rollup["buckets"] == live["buckets"]
+    assert rollup["total"] == live["total"]
+
+@pytest.mark.asyncio
+async def test_stats_grouped_by_week_and_customer(db):
+    await seed_orders(db)
+
+    weekly = await get_order_stats("2024.01.01", "2024.01.31", "week", "rollup", db)
+    by_customer = await get_order_stats("2024.01.01", "2024.12.31", "customer", "rollup", db)
+
+    assert [(bucket["key"], bucket["count"]) for bucket in weekly["buckets"]] == [("2024-01-01", 3), ("2024-01-08", 1)]
+    assert weekly["total"]["sum"] == 65.0
+    assert by_customer["buckets"][0] == {"key": 1, "count": 3, "sum": 47.0, "avg": 47.0 / 3, "min": 7.0, "max": 30.0}
+
+@pytest.mark.asyncio
+async def test_rollups_follow_create_update_and_delete(db):
+    await seed_orders(db)
+    created = await create_order(
+        OrderCreate(customer_id=1, item="Tea", amount=50.0, time=datetime(2024, 1, 1, 12)), db
+    )
+    order_id = created["order"].id
+
+    rollup = (await db.execute(select(OrderDailyRollup).where(
+        OrderDailyRollup.customer_id == 1, OrderDailyRollup.item == "Tea"
+    ))).scalar_one()
+    assert (rollup.order_count, rollup.total_amount, rollup.max_amount) == (3, 90.0, 50.0)
+
+    await update_order(order_id, OrderUpdate(item="Tea", amount=1.0, time=datetime(2024, 3, 1)), db)
+    await delete_order(1, db)
+
+    stats = await get_order_stats("2024.01.01", "2024.01.01", "item", "rollup", db)
+    assert stats["buckets"] == [{"key": "Tea", "count": 1, "sum": 30.0, "avg": 30.0, "min": 30.0, "max": 30.0}]
+    march = await get_order_stats("2024.03.01", "2024.03.31", "month", "rollup", db)
+    assert march["buckets"][0]["key"] == "2024-03-01"
+    assert march["total"]["sum"] == 1.0
+
+@pytest.mark.asyncio
+@pytest.mark.parametrize("source", ["rollup", "orders"])
+async def test_stats_skip_deleted_customers(db, source):
+    await seed_orders(db)
+    await delete_customer(2, db)
+
+    stats = await get_order_stats("2024.01.01", "2024.12.31", "customer", source, db)
+
+    assert [bucket["key"] for bucket in stats["buckets"]] == [1]
+
+@pytest.mark.asyncio
+async def test_rollup_writes_upsert_and_lock_on_postgres():
+    """Concurrent writes to one bucket must wait on the row, not race to insert or overwrite it"""
+    db = AsyncMock(spec=AsyncSession)
+    db.get_bind.return_value.dialect.name = "postgresql"
+    db.execute.return_value = MagicMock(__iter__=lambda self: iter([]))
+    order = OrderCreate(customer_id=1, item="Tea", amount=10.0, time=datetime(2024, 1, 1, 8))
+
+    await add_to_daily_rollups(db, [order])
+    await refresh_daily_rollups(db, [(order.time.date(), 1, "Tea")])
+
+    statements = [str(call.args[0].compile(dialect=postgresql.dialect())) for call in db.execute.await_args_list]
+    increment, placeholder, lock, recount, cleanup = statements
+    assert "ON CONFLICT (day, customer_id, item) DO UPDATE" in increment
+    # The refresh holds the row, created empty if missing, before it recounts
+    assert "ON CONFLICT (day, customer_id, item) DO NOTHING" in placeholder
+    assert lock.startswith("SELECT") and lock.endswith("FOR UPDATE")
+    assert recount.startswith("INSERT") and "ON CONFLICT (day, customer_id, item) DO UPDATE" in recount
+    # The bucket came back empty, so it is the only thing deleted
+    assert cleanup.startswith("DELETE FROM order_daily_rollups")
+
+@pytest.mark.asyncio
+async def test_refresh_overwrites_an_existing_rollup_row(db):
+    await seed_orders(db)
+    # A stale row, as another writer may have left it
+    await db.merge(OrderDailyRollup(day=date(2024, 1, 1), customer_id=1, item="Tea", order_count=99,
+                                    total_amount=0.0, min_amount=0.0, max_amount=0.0))
+    await db.commit()
+
+    await refresh_daily_rollups(db, [(date(2024, 1, 1), 1, "Tea"), (date(2024, 1, 3), 1, "Tea")])
+
+    rows = (await db.execute(select(OrderDailyRollup.day, OrderDailyRollup.order_count)
+                             .where(OrderDailyRollup.customer_id == 1, OrderDailyRollup.item == "Tea"))).all()
+    assert [tuple(row) for row in rows] == [(date(2024, 1, 1), 2)]
+
+@pytest.mark.asyncio
+async def test_stats_empty_range(db):
+    stats = await get_order_stats("2023.01.01", "2023.12.31", "day", "rollup", db)
+
+    assert stats["buckets"] == []
+    assert stats["total"] is None
@@ -1,20 +1,29 @@
-from datetime import datetime
+from collections import namedtuple
+from datetime import date, datetime
 from typing import Any
-from unittest.mock import Mock, patch
+from unittest.mock import AsyncMock, MagicMock, patch
 
 import pytest
 from fastapi import HTTPException
-from sqlalchemy.orm import Session
+from sqlalchemy import select
+from sqlalchemy.dialects import postgresql
+from sqlalchemy.ext.asyncio import AsyncSession
 
 from app.models.models import Customer, Order
-from app.routes.orders import (OrderCreate, OrderUpdate, create_order,
-                               delete_order, get_order, get_orders,
-                               search_orders_by_date_range, update_order)
+from app.routes.orders import (OrderBatchPatch, OrderCreate, OrderPatch,
+                               OrderUpdate, create_order, delete_order,
+                               get_order, get_orders, get_orders_page,
+                               search_orders_by_date_range, update_order,
+                               update_order_returning, update_orders_batch)
+from app.utils.pagination import decode_cursor, encode_cursor
 
 
 @pytest.fixture
 def mock_db():
-    return Mock(spec=Session)
+    db = AsyncMock(spec=AsyncSession)
+    db.execute.return_value = MagicMock()
+    db.get_bind.return_value.dialect.name = "sqlite"
+    return db
 
 @pytest.mark.asyncio
 async def test_create_order(mock_db):
@@ -25,24 +34,21 @@ async def test_create_order(mock_db):
         time=datetime.now()
     )
     mock_customer = Customer(id=1, name="Test Customer", code="TEST001", phone_number="1234567890")
-    mock_db.query.return_value.filter.return_value.first.return_value = mock_customer
-
-    mock_db.add.return_value = None
-    mock_db.commit.return_value = None
-    mock_db.refresh.return_value = None
-
-    with patch("app.routes.orders.send_sms") as mock_send_sms:
-        mock_send_sms.return_value = {"status": "success"}
+    mock_db.get.return_value = mock_customer
 
+    with patch("app.routes.orders.get_sms_queue", return_value=AsyncMock()) as mock_get_sms_queue:
         result = await create_order(order_data, mock_db)
 
     assert result["order"].customer_id == order_data.customer_id
     assert result["order"].item == order_data.item
     assert result["order"].amount == order_data.amount
     mock_db.add.assert_called_once()
-    mock_db.commit.assert_called_once()
-    mock_db.refresh.assert_called_once()
-    mock_send_sms.assert_called_once()
+    mock_db.commit.assert_awaited_once()
+    mock_db.refresh.assert_awaited_once()
+    mock_get_sms_queue.return_value.stage.assert_awaited_once_with(
+        mock_db, [("1234567890", "New order placed: Test Item for $100.00")]
+    )
+    assert result["sms_response"] == {"status": "queued"}
 
 @pytest.mark.asyncio
 async def test_create_order_customer_not_found(mock_db):
@@ -52,7 +58,7 @@ async def test_create_order_customer_not_found(mock_db):
         amount=100.0,
         time=datetime.now()
     )
-    mock_db.query.return_value.filter.return_value.first.return_value = None
+    mock_db.get.return_value = None
 
     with pytest.raises(HTTPException) as exc_info:
         await create_order(order_data, mock_db)
@@ -66,7 +72,7 @@ async def test_get_orders(mock_db):
         Order(id=1, customer_id=1, item="Item 1", amount=10.0, time=datetime.now()),
         Order(id=2, customer_id=2, item="Item 2", amount=20.0, time=datetime.now())
     ]
-    mock_db.query.return_value.offset.return_value.limit.return_value.all.return_value = mock_orders
+    mock_db.execute.return_value.scalars.return_value.all.return_value = mock_orders
 
     result :Any = await get_orders(0, 10, mock_db)
 
@@ -74,19 +80,63 @@ async def test_get_orders(mock_db):
     assert result[0].item == "Item 1"
     assert result[1].item == "Item 2"
 
+@pytest.mark.asyncio
+async def test_get_orders_page_first_page(mock_db):
+    mock_orders = [
+        Order(id=i, customer_id=1, item=f"Item {i}", amount=10.0, time=datetime.now())
+        for i in (1, 2, 3)
+    ]
+    mock_db.execute.return_value.scalars.return_value.all.return_value = mock_orders
+
+    result: Any = await get_orders_page("", 2, mock_db)
+
+    assert [order.id for order in result["items"]] == [1, 2]
+    assert decode_cursor(result["next_cursor"], int) == [2]
+    assert mock_db.execute.call_args.args[0].compile().params["param_1"] == 3
+
+@pytest.mark.asyncio
+async def test_get_orders_page_last_page(mock_db):
+    mock_orders = [Order(id=3, customer_id=1, item="Item 3", amount=10.0, time=datetime.now())]
+    mock_db.execute.return_value.scalars.return_value.all.return_value = mock_orders
+
+    result: Any = await get_orders_page(encode_cursor(2), 2, mock_db)
+
+    assert [order.id for order in result["items"]] == [3]
+    assert result["next_cursor"] is None
+    assert mock_db.execute.call_args.args[0].compile().params["id_1"] == 2
+
+@pytest.mark.asyncio
+async def test_get_orders_page_invalid_cursor(mock_db):
+    with pytest.raises(HTTPException) as exc_info:
+        await get_orders_page("not-a-cursor", 10, mock_db)
+
+    assert exc_info.value.status_code == 400
+    assert exc_info.value.detail == "Invalid cursor"
+
 @pytest.mark.asyncio
 async def test_search_orders_by_date_range(mock_db):
     start_date = "2024.01.01"
     end_date = "2024.12.31"
-    mock_orders = [
-        Order(id=1, customer_id=1, item="Item 1", amount=10.0, time=datetime.now())
-    ]
-    mock_db.query.return_value.filter.return_value.all.return_value = mock_orders
+    mock_rows = [(1, 1, "Item 1", 10.0, datetime.now())]
+    mock_db.execute.return_value.all.return_value = mock_rows
 
     result = await search_orders_by_date_range(start_date, end_date, mock_db)
 
     assert len(result) == 1
-    assert result[0].item == "Item 1"
+    assert result[0]["item"] == "Item 1"
+
+@pytest.mark.asyncio
+async def test_search_orders_by_date_range_with_cursor(mock_db):
+    OrderRow = namedtuple("OrderRow", "id customer_id item amount time")
+    mock_rows = [OrderRow(i, 1, f"Item {i}", 10.0, datetime(2024, 1, i)) for i in (4, 5, 6)]
+    mock_db.execute.return_value.all.return_value = mock_rows
+
+    cursor = encode_cursor(datetime(2024, 1, 3), 3)
+    result: Any = await search_orders_by_date_range("2024.01.01", "2024.12.31", mock_db, limit=2, cursor=cursor)
+
+    assert [order["id"] for order in result["items"]] == [4, 5]
+    assert result["items"][0]["formatted_time"] == "2024-01-04 00:00:00"
+    assert decode_cursor(result["next_cursor"], datetime, int) == [datetime(2024, 1, 5), 5]
 
 @pytest.mark.asyncio
 async def test_search_orders_by_date_range_invalid_date_format(mock_db):
@@ -103,7 +153,7 @@ async def test_search_orders_by_date_range_invalid_date_format(mock_db):
 async def test_search_orders_by_date_range_no_orders(mock_db):
     start_date = "2024.01.01"
     end_date = "2024.12.31"
-    mock_db.query.return_value.filter.return_value.all.return_value = []
+    mock_db.execute.return_value.all.return_value = []
 
     with pytest.raises(HTTPException) as exc_info:
         await search_orders_by_date_range(start_date, end_date, mock_db)
@@ -114,7 +164,7 @@ async def test_search_orders_by_date_range_no_orders(mock_db):
 @pytest.mark.asyncio
 async def test_get_order(mock_db):
     mock_order = Order(id=1, customer_id=1, item="Test Item", amount=100.0, time=datetime.now())
-    mock_db.query.return_value.filter.return_value.first.return_value = mock_order
+    mock_db.execute.return_value.scalar_one_or_none.return_value = mock_order
 
     result :Any = await get_order(1, mock_db)
 
@@ -123,7 +173,7 @@ async def test_get_order(mock_db):
 
 @pytest.mark.asyncio
 async def test_get_order_not_found(mock_db):
-    mock_db.query.return_value.filter.return_value.first.return_value = None
+    mock_db.execute.return_value.scalar_one_or_none.return_value = None
 
     with pytest.raises(HTTPException) as exc_info:
         await get_order(999, mock_db)
@@ -131,28 +181,57 @@ async def test_get_order_not_found(mock_db):
     assert exc_info.value.status_code == 404
     assert exc_info.value.detail == "Order not found"
 
-@pytest.mark.asyncio
-async def test_update_order(mock_db):
-    mock_order = Order(id=1, customer_id=1, item="Old Item", amount=50.0, time=datetime.now())
-    mock_db.query.return_value.filter.return_value.first.return_value = mock_order
+@pytest.fixture
+def seed_rows():
+    return [
+        Customer(id=1, name="Customer 1", code="C001", phone_number="1111111111"),
+        Order(id=1, customer_id=1, item="Old Item", amount=50.0, time=datetime(2024, 1, 1, 8)),
+        Order(id=2, customer_id=1, item="Tea", amount=10.0, time=datetime(2024, 1, 2, 8)),
+    ]
 
+@pytest.mark.asyncio
+async def test_update_order(db):
     update_data = OrderUpdate(
         item="Updated Item",
         amount=150.0,
-        time=datetime.now()
+        time=datetime(2024, 2, 1, 8)
     )
 
-    result:Any = await update_order(1, update_data, mock_db)
+    with patch.object(db, "execute", wraps=db.execute) as execute:
+        result: Any = await update_order(1, update_data, db)
 
-    assert result.item == "Updated Item"
-    assert result.amount == 150.0
-    mock_db.commit.assert_called_once()
-    mock_db.refresh.assert_called_once()
+    assert (result.item, result.amount, result.time) == ("Updated Item", 150.0, datetime(2024, 2, 1, 8))
+    # Previous bucket, UPDATE ... RETURNING, one upsert recounting both rollup buckets
+    # and a DELETE for the bucket the order left, which is now empty
+    assert execute.call_count == 4
 
 @pytest.mark.asyncio
-async def test_update_order_not_found(mock_db):
-    mock_db.query.return_value.filter.return_value.first.return_value = None
+async def test_update_order_returning_reads_the_previous_bucket_in_the_update_on_postgres():
+    db = AsyncMock(spec=AsyncSession)
+    db.get_bind.return_value.dialect.name = "postgresql"
+    order = Order(id=1, customer_id=1, item="Cake", amount=5.0, time=datetime(2024, 2, 1, 8))
+    db.execute.return_value.first = MagicMock(return_value=(order, datetime(2024, 1, 1, 8), 1, "Tea"))
+
+    result = await update_order_returning(1, {"item": "Cake"}, db)
+
+    assert result == (order, (date(2024, 1, 1), 1, "Tea"))
+    db.execute.assert_awaited_once()
+    sql = " ".join(str(db.execute.await_args.args[0].compile(dialect=postgresql.dialect())).split())
+    # One statement: the locked self-join holds the row and yields its values from before the UPDATE
+    assert sql.startswith("UPDATE orders SET item=%(item)s")
+    assert ("FROM (SELECT previous_orders.id AS id, previous_orders.time AS time, previous_orders.customer_id AS "
+            "customer_id, previous_orders.item AS item FROM orders AS previous_orders "
+            "WHERE previous_orders.id = %(id_1)s FOR UPDATE) AS anon_1 WHERE orders.id = anon_1.id AND") in sql
+    assert sql.endswith("anon_1.time AS time_1, anon_1.customer_id AS customer_id_1, anon_1.item AS item_1")
+
+@pytest.mark.asyncio
+async def test_patch_order_changes_only_given_fields(db):
+    result: Any = await update_order(1, OrderPatch(amount=75.0), db)
+
+    assert (result.item, result.amount, result.time) == ("Old Item", 75.0, datetime(2024, 1, 1, 8))
 
+@pytest.mark.asyncio
+async def test_update_order_not_found(db):
     update_data = OrderUpdate(
         item="Updated Item",
         amount=150.0,
@@ -160,28 +239,37 @@ async def test_update_order_not_found(mock_db):
     )
 
     with pytest.raises(HTTPException) as exc_info:
-        await update_order(999, update_data, mock_db)
+        await update_order(999, update_data, db)
 
     assert exc_info.value.status_code == 404
     assert exc_info.value.detail == "Order not found"
 
 @pytest.mark.asyncio
-async def test_delete_order(mock_db):
-    mock_order = Order(id=1, customer_id=1, item="Test Item", amount=100.0, time=datetime.now())
-    mock_db.query.return_value.filter.return_value.first.return_value = mock_order
+async def test_update_orders_batch(db):
+    result = await update_orders_batch([
+        OrderBatchPatch(id=1, amount=60.0),
+        OrderBatchPatch(id=2, item="Cake"),
+        OrderBatchPatch(id=1, item="New Item"),
+        OrderBatchPatch(id=99, amount=1.0),
+    ], db)
+
+    assert result == {"updated": 2, "order_ids": [1, 2], "missing": [99]}
+    rows = (await db.execute(select(Order.id, Order.item, Order.amount).order_by(Order.id))).all()
+    assert [tuple(row) for row in rows] == [(1, "New Item", 60.0), (2, "Cake", 10.0)]
 
-    result = await delete_order(1, mock_db)
+@pytest.mark.asyncio
+async def test_delete_order(db):
+    with patch.object(db, "execute", wraps=db.execute) as execute:
+        result = await delete_order(1, db)
 
     assert result == {"message": "Order deleted successfully"}
-    mock_db.delete.assert_called_once_with(mock_order)
-    mock_db.commit.assert_called_once()
+    assert await db.get(Order, 1) is None
+    assert execute.call_count == 3
 
 @pytest.mark.asyncio
-async def test_delete_order_not_found(mock_db):
-    mock_db.query.return_value.filter.return_value.first.return_value = None
-
+async def test_delete_order_not_found(db):
     with pytest.raises(HTTPException) as exc_info:
-        await delete_order(999, mock_db)
+        await delete_order(999, db)
 
     assert exc_info.value.status_code == 404
     assert exc_info.value.detail == "Order not found"
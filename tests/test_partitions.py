@@ -0,0 +1,102 @@
+import csv
+import gzip
+from datetime import date, datetime
+from unittest.mock import MagicMock
+
+import pytest
+from sqlalchemy import create_engine
+
+from app.utils.partitions import (add_months, cold_partitions, ensure_partitions,
+                                  is_partitioned, partition_name,
+                                  split_default_partition, write_archive)
+
+
+def test_add_months_crosses_years():
+    assert add_months(date(2024, 11, 1), 3) == date(2025, 2, 1)
+    assert add_months(date(2024, 1, 1), -1) == date(2023, 12, 1)
+    assert partition_name(date(2024, 2, 1)) == "orders_p2024_02"
+
+def test_cold_partitions_keep_recent_months():
+    months = [date(2024, month, 1) for month in range(1, 13)]
+
+    cold = cold_partitions(months, keep_months=3, today=date(2024, 12, 15))
+
+    assert cold == [date(2024, month, 1) for month in range(1, 10)]
+
+def test_sqlite_is_never_partitioned():
+    engine = create_engine("sqlite://")
+    with engine.connect() as conn:
+        assert not is_partitioned(conn)
+
+def test_write_archive_csv_gz(tmp_path):
+    rows = [(1, 1, "Tea", 10.0, datetime(2024, 1, 1, 8), datetime(2024, 1, 1, 8), datetime(2024, 1, 1, 8))]
+
+    path = write_archive(iter(rows), str(tmp_path / "orders_p2024_01.csv.gz"))
+
+    with gzip.open(path, "rt", newline="") as archive:
+        records = list(csv.DictReader(archive))
+    assert records[0]["item"] == "Tea"
+    assert records[0]["time"] == "2024-01-01 08:00:00"
+    assert not (tmp_path / "orders_p2024_01.csv.gz.partial").exists()
+
+def test_write_archive_removes_partial_file_on_failure(tmp_path):
+    def rows():
+        yield (1, 1, "Tea", 10.0, datetime(2024, 1, 1), None, None)
+        raise RuntimeError("connection lost")
+
+    with pytest.raises(RuntimeError):
+        write_archive(rows(), str(tmp_path / "orders_p2024_01.csv.gz"))
+    assert list(tmp_path.iterdir()) == []
+
+class RecordingConnection:
+    """Answers the catalogue queries partitions.py makes and records every statement"""
+    def __init__(self, partitions=(), default_months=()):
+        self.partitions = list(partitions)
+        self.default_months = list(default_months)
+        self.statements = []
+
+    def execute(self, statement):
+        sql = str(statement)
+        self.statements.append(sql)
+        result = MagicMock()
+        if "FROM pg_inherits" in sql:
+            result.scalars.return_value = iter(self.partitions)
+        elif "date_trunc" in sql:
+            result.scalars.return_value = iter(self.default_months)
+        elif sql.startswith("SELECT EXISTS"):
+            result.scalar.return_value = any(f"time >= '{month.isoformat()}'" in sql for month in self.default_months)
+        return result
+
+def test_ensure_partitions_creates_empty_months_in_place():
+    conn = RecordingConnection(partitions=["orders_default", "orders_p2024_05"])
+
+    created = ensure_partitions(conn, months_ahead=1, today=date(2024, 5, 20))
+
+    assert created == ["orders_p2024_06"]
+    assert conn.statements[-1] == (
+        "CREATE TABLE orders_p2024_06 PARTITION OF orders FOR VALUES FROM ('2024-06-01') TO ('2024-07-01')"
+    )
+
+def test_ensure_partitions_moves_rows_out_of_the_default_partition():
+    conn = RecordingConnection(partitions=["orders_default"], default_months=[date(2024, 5, 1)])
+
+    created = ensure_partitions(conn, months_ahead=0, today=date(2024, 5, 20))
+
+    assert created == ["orders_p2024_05"]
+    assert conn.statements[1:] == [
+        "LOCK TABLE orders_default IN SHARE ROW EXCLUSIVE MODE",
+        "SELECT EXISTS (SELECT 1 FROM orders_default WHERE time >= '2024-05-01' AND time < '2024-06-01')",
+        "CREATE TABLE orders_p2024_05 (LIKE orders INCLUDING DEFAULTS INCLUDING CONSTRAINTS)",
+        "WITH moved AS (DELETE FROM orders_default WHERE time >= '2024-05-01' AND time < '2024-06-01' "
+        "RETURNING id, customer_id, item, amount, time, date_created, date_updated) "
+        "INSERT INTO orders_p2024_05 (id, customer_id, item, amount, time, date_created, date_updated) "
+        "SELECT id, customer_id, item, amount, time, date_created, date_updated FROM moved",
+        "ALTER TABLE orders ATTACH PARTITION orders_p2024_05 FOR VALUES FROM ('2024-05-01') TO ('2024-06-01')",
+    ]
+
+def test_split_default_partition_skips_months_that_have_a_partition():
+    conn = RecordingConnection(partitions=["orders_default", "orders_p2023_12"],
+                               default_months=[date(2023, 11, 1), date(2023, 12, 1)])
+
+    assert split_default_partition(conn) == ["orders_p2023_11"]
+    assert not any("orders_p2023_12" in sql for sql in conn.statements)
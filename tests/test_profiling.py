@@ -0,0 +1,54 @@
+from fastapi import FastAPI
+from fastapi.testclient import TestClient
+from sqlalchemy import text
+from sqlalchemy.ext.asyncio import create_async_engine
+from sqlalchemy.pool import StaticPool
+
+from app.utils.profiling import (ProfilingMetrics, ProfilingMiddleware,
+                                 attach_sql_timing, profile_phase)
+
+
+def make_client(sample: float, metrics: ProfilingMetrics):
+    engine = create_async_engine("sqlite+aiosqlite://", poolclass=StaticPool)
+    attach_sql_timing(engine.sync_engine)
+    app = FastAPI()
+    app.add_middleware(ProfilingMiddleware, sample_rate=0.5, n_plus_one_threshold=3,
+                       metrics=metrics, sample=lambda: sample)
+
+    @app.get("/items/{count}")
+    async def items(count: int):
+        async with engine.connect() as conn:
+            with profile_phase("query"):
+                for i in range(count):
+                    await conn.execute(text(f"SELECT {i}"))
+        return {"count": count}
+
+    return TestClient(app)
+
+def test_sampled_request_reports_server_timing():
+    metrics = ProfilingMetrics()
+    response = make_client(0.1, metrics).get("/items/2")
+
+    timing = response.headers["server-timing"]
+    assert timing.startswith("query;dur=")
+    assert 'db;dur=' in timing and 'desc="2 statements"' in timing
+    assert "total;dur=" in timing
+    assert metrics.sql_statements[("GET", "/items/{count}")].sum == 2
+    assert not metrics.n_plus_one
+
+def test_unsampled_request_is_untouched():
+    metrics = ProfilingMetrics()
+    response = make_client(0.9, metrics).get("/items/2")
+
+    assert "server-timing" not in response.headers
+    assert not metrics.request_duration
+
+def test_repeated_statements_flag_n_plus_one(caplog):
+    metrics = ProfilingMetrics()
+    make_client(0.1, metrics).get("/items/4")
+
+    assert metrics.n_plus_one[("GET", "/items/{count}")] == 1
+    assert "Possible N+1 on GET /items/{count}" in caplog.text
+    rendered = metrics.render()
+    assert 'http_request_sql_statements_bucket{method="GET",route="/items/{count}",le="5.0"} 1' in rendered
+    assert 'http_request_n_plus_one_total{method="GET",route="/items/{count}"} 1' in rendered
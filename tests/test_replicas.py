@@ -0,0 +1,95 @@
+import httpx
+import pytest
+from fastapi import FastAPI
+from sqlalchemy.ext.asyncio import async_sessionmaker, create_async_engine
+
+from app.db import get_read_db
+from app.models.models import Base, Customer
+from app.routes import customers, orders
+from app.routes.customers import get_all_customers
+from app.utils.replicas import ReadYourWritesMiddleware, ReplicaRouter
+
+
+def request_scope(token: str, method: str = "GET") -> dict:
+    return {"type": "http", "method": method, "headers": [(b"authorization", f"Bearer {token}".encode())],
+            "client": ("127.0.0.1", 5000)}
+
+
+@pytest.fixture
+async def databases(tmp_path):
+    """A primary and a replica that has not caught up with it, as two SQLite files"""
+    primary = create_async_engine(f"sqlite+aiosqlite:///{tmp_path / 'primary.db'}")
+    replica = create_async_engine(f"sqlite+aiosqlite:///{tmp_path / 'replica.db'}")
+    for engine in (primary, replica):
+        async with engine.begin() as conn:
+            await conn.run_sync(Base.metadata.create_all)
+    async with primary.begin() as conn:
+        await conn.execute(Customer.__table__.insert(), {"name": "New", "code": "C1", "phone_number": "0700000001"})
+    yield primary, replica
+    await primary.dispose()
+    await replica.dispose()
+
+
+async def read_customers(router: ReplicaRouter, scope: dict):
+    sessions = async_sessionmaker(autoflush=False, expire_on_commit=False)
+    async with sessions(bind=await router.engine_for(scope)) as db:
+        return await get_all_customers(0, 10, db)
+
+
+async def test_reads_go_to_replica_until_the_client_writes(databases):
+    primary, replica = databases
+    router = ReplicaRouter(primary, [replica], sticky_window=5)
+
+    assert await read_customers(router, request_scope("reader")) == []
+
+    await router.mark_write(request_scope("writer", "POST"))
+
+    assert [customer.code for customer in await read_customers(router, request_scope("writer"))] == ["C1"]
+    assert await read_customers(router, request_scope("reader")) == []
+
+
+async def test_round_robin_skips_failed_replicas(databases, tmp_path):
+    primary, replica = databases
+    unreachable = create_async_engine(f"sqlite+aiosqlite:///{tmp_path / 'missing' / 'replica.db'}")
+    router = ReplicaRouter(primary, [replica, unreachable])
+
+    assert [router.choose() for _ in range(4)] == [replica, unreachable, replica, unreachable]
+
+    await router.check(timeout=1)
+
+    assert router.healthy == [replica]
+    assert [router.choose() for _ in range(2)] == [replica, replica]
+
+    router.mark_down(replica)
+    assert router.choose() is primary
+    await unreachable.dispose()
+
+
+async def test_middleware_pins_only_after_successful_writes(databases):
+    primary, replica = databases
+    router = ReplicaRouter(primary, [replica])
+    api = FastAPI()
+
+    @api.post("/ok")
+    async def ok():
+        return {}
+
+    @api.post("/rejected", status_code=422)
+    async def rejected():
+        return {}
+
+    api.add_middleware(ReadYourWritesMiddleware, router=router)
+    async with httpx.AsyncClient(transport=httpx.ASGITransport(app=api), base_url="http://test") as client:
+        await client.post("/rejected", headers={"Authorization": "Bearer rejected-writer"})
+        await client.post("/ok", headers={"Authorization": "Bearer accepted-writer"})
+
+    assert await router.engine_for(request_scope("rejected-writer")) is replica
+    assert await router.engine_for(request_scope("accepted-writer")) is primary
+
+
+@pytest.mark.parametrize("route_module, endpoint", [(orders, "get_order_route"), (customers, "get_customer_route")])
+def test_cached_reads_are_filled_from_the_primary(route_module, endpoint):
+    # A miss fills the shared cache; a lagging replica's row would be served for the whole TTL
+    (route,) = [route for route in route_module.router.routes if route.endpoint is getattr(route_module, endpoint)]
+
+    assert get_read_db not in [dependency.call for dependency in route.dependant.dependencies]
@@ -0,0 +1,117 @@
+from datetime import datetime
+from unittest.mock import patch
+
+import pytest
+
+from app.models.models import Customer
+from app.routes import orders
+from app.routes.customers import (CustomerCreate, CustomerUpdate,
+                                  create_customer, delete_customer,
+                                  search_customers, update_customer)
+from app.routes.orders import (create_orders_bulk, delete_order, search_orders,
+                               validate_bulk_rows)
+from app.utils.search import TrigramIndex, similarity, trigrams
+
+
+pytestmark = pytest.mark.usefixtures("sms_queue")
+
+@pytest.fixture(autouse=True)
+def fresh_indexes():
+    order_item_index = TrigramIndex()
+    with patch("app.routes.customers.customer_search_index", TrigramIndex()), \
+            patch("app.routes.customers.order_item_search_index", order_item_index), \
+            patch("app.routes.orders.order_item_search_index", order_item_index):
+        yield
+
+@pytest.fixture
+def seed_rows():
+    return [
+        Customer(id=1, name="Jane Wanjiru", code="C001", phone_number="1111111111"),
+        Customer(id=2, name="Janet Achieng", code="C002", phone_number="2222222222"),
+        Customer(id=3, name="Peter Otieno", code="JAN9", phone_number="3333333333"),
+    ]
+
+def test_trigrams_match_pg_trgm():
+    assert trigrams("cat") == {"  c", " ca", "cat", "at "}
+    assert similarity(trigrams("Wanjiru"), trigrams("Wanjiru")) == 1.0
+    assert similarity(trigrams("Wanjiru"), trigrams("Otieno")) == 0.0
+
+def test_prefix_search_matches_one_and_two_letter_queries():
+    index = TrigramIndex()
+    index.rebuild([(1, ("banana",)), (2, ("b",)), (3, ("apple", "Big apple"))], index.version)
+
+    assert [key for key, _ in index.search("b")] == [2, 1, 3]
+    assert [key for key, _ in index.search("ba")] == [1]
+    assert [key for key, _ in index.search("bi")] == [3]
+    assert index.search("x") == []
+
+def test_index_goes_stale_after_max_age():
+    now = [0.0]
+    index = TrigramIndex(max_age=60, clock=lambda: now[0])
+    index.rebuild([(1, ("banana",))], index.version)
+    assert not index.stale
+
+    now[0] = 61.0
+    assert index.stale
+
+@pytest.mark.asyncio
+async def test_customer_prefix_search_ranks_closest_first(db):
+    results = await search_customers("jan", "prefix", 10, db)
+
+    assert [customer.id for customer in results] == [3, 1, 2]
+    assert results[0].score > results[1].score > results[2].score
+
+    assert [customer.id for customer in await search_customers("jan", "prefix", 1, db)] == [3]
+
+@pytest.mark.asyncio
+async def test_customer_fuzzy_search_tolerates_typos(db):
+    results = await search_customers("wanjru", "fuzzy", 10, db)
+
+    assert [customer.id for customer in results] == [1]
+    assert 0.3 <= results[0].score < 1.0
+
+@pytest.mark.asyncio
+async def test_customer_search_sees_writes(db):
+    assert await search_customers("mary", "prefix", 10, db) == []
+
+    created = await create_customer(CustomerCreate(name="Mary Njeri", code="C004"), db)
+    await update_customer(2, CustomerUpdate(name="Grace Achieng"), db)
+
+    assert [customer.id for customer in await search_customers("mary", "prefix", 10, db)] == [created.id]
+    assert [customer.id for customer in await search_customers("janet", "prefix", 10, db)] == []
+
+@pytest.mark.asyncio
+async def test_order_search_by_item(db):
+    rows, _ = validate_bulk_rows([
+        {"customer_id": 1, "item": "Chai Latte", "amount": 3.0, "time": "2024-01-01T08:00:00"},
+        {"customer_id": 2, "item": "Chai", "amount": 2.0, "time": "2024-01-02T08:00:00"},
+        {"customer_id": 2, "item": "Cake", "amount": 5.0, "time": "2024-01-03T08:00:00"},
+    ])
+    await create_orders_bulk(rows, db)
+    assert [order["item"] for order in await search_orders("chai", "prefix", 10, db)] == ["Chai", "Chai Latte"]
+
+    more, _ = validate_bulk_rows([{"customer_id": 3, "item": "Chocolate cake", "amount": 6.0,
+                                   "time": datetime(2024, 1, 4).isoformat()}])
+    await create_orders_bulk(more, db)
+
+    results = await search_orders("chocolat", "fuzzy", 10, db)
+    assert [order["item"] for order in results] == ["Chocolate cake"]
+    assert results[0]["formatted_time"] == "2024-01-04 00:00:00"
+
+@pytest.mark.asyncio
+async def test_order_search_drops_deleted_items(db):
+    rows, _ = validate_bulk_rows([
+        {"customer_id": 1, "item": "Chai", "amount": 2.0, "time": "2024-01-01T08:00:00"},
+        {"customer_id": 2, "item": "Cake", "amount": 5.0, "time": "2024-01-02T08:00:00"},
+    ])
+    result = await create_orders_bulk(rows, db)
+    assert len(await search_orders("c", "prefix", 10, db)) == 2
+
+    await delete_order(result["order_ids"][0], db)
+    assert orders.order_item_search_index.stale
+    await search_orders("c", "prefix", 10, db)
+    await delete_customer(2, db)
+    assert orders.order_item_search_index.stale
+
+    assert await search_orders("c", "prefix", 10, db) == []
+    assert [customer.id for customer in await search_customers("j", "prefix", 10, db)] == [3, 1]
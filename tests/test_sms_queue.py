@@ -0,0 +1,154 @@
+import asyncio
+import time
+
+import pytest
+
+from app.models.models import SmsOutbox
+from app.utils.shared_state import FakeRedis, RedisQueue
+from app.utils.sms_queue import OutboxQueue, SmsQueue
+from app.utils.sms_sender import StubSmsProvider, build_payload
+
+
+class FlakyProvider(StubSmsProvider):
+    def __init__(self, failures):
+        super().__init__()
+        self.failures = failures
+        self.attempts = 0
+
+    def send_batch(self, messages):
+        self.attempts += 1
+        if self.attempts <= self.failures:
+            raise ConnectionError("provider unavailable")
+        return super().send_batch(messages)
+
+
+def test_build_payload_batches_messages():
+    payload = build_payload([("111", "a"), ("222", "b")])
+
+    assert '"to": "111"' in payload
+    assert '"to": "222"' in payload
+    assert payload.count('"from": "ServiceSMS"') == 2
+
+@pytest.mark.asyncio
+async def test_queue_drains_in_batches():
+    provider = StubSmsProvider()
+    queue = SmsQueue(provider, batch_size=3, flush_interval=0.01)
+    await queue.start()
+
+    await queue.enqueue_many((f"07{i:08d}", f"order {i}") for i in range(7))
+    await queue.stop()
+
+    assert [len(batch) for batch in provider.batches] == [3, 3, 1]
+    assert provider.sent[0] == ("0700000000", "order 0")
+    assert await queue.pending() == 0
+
+@pytest.mark.asyncio
+async def test_enqueue_does_not_wait_for_provider():
+    class SlowProvider(StubSmsProvider):
+        def send_batch(self, messages):
+            time.sleep(0.2)
+            return super().send_batch(messages)
+
+    provider = SlowProvider()
+    queue = SmsQueue(provider, flush_interval=0)
+    await queue.start()
+
+    loop = asyncio.get_running_loop()
+    started = loop.time()
+    await queue.enqueue("0700000000", "hello")
+    assert loop.time() - started < 0.01
+
+    await queue.stop()
+    assert provider.sent == [("0700000000", "hello")]
+
+@pytest.mark.asyncio
+async def test_queue_retries_with_backoff():
+    provider = FlakyProvider(failures=2)
+    queue = SmsQueue(provider, flush_interval=0, max_retries=3, retry_backoff=0.001)
+    await queue.start()
+
+    await queue.enqueue("0700000000", "hello")
+    await queue.stop()
+
+    assert provider.attempts == 3
+    assert provider.sent == [("0700000000", "hello")]
+    assert not queue.failed
+
+@pytest.mark.asyncio
+async def test_queue_gives_up_after_max_retries():
+    provider = FlakyProvider(failures=10)
+    queue = SmsQueue(provider, flush_interval=0.05, max_retries=1, retry_backoff=0.001, max_failed=1)
+    await queue.start()
+
+    await queue.enqueue_many([("0700000000", "hello"), ("0700000001", "bye")])
+    await queue.stop()
+
+    assert provider.attempts == 2
+    # Only the latest give-ups are kept, so an outage cannot grow the list without bound
+    assert list(queue.failed) == [("0700000001", "bye")]
+
+@pytest.mark.asyncio
+async def test_redis_backed_queues_share_one_backlog():
+    client = FakeRedis()
+    providers = [StubSmsProvider(), StubSmsProvider()]
+    queues = [SmsQueue(provider, batch_size=2, flush_interval=0, backend=RedisQueue(client, "sms"))
+              for provider in providers]
+
+    # Enqueued by one worker process, drained by whichever is free
+    await queues[0].enqueue_many((f"07{i:08d}", f"order {i}") for i in range(6))
+    for queue in queues:
+        await queue.start()
+    while await queues[0].pending():
+        await asyncio.sleep(0.01)
+    for queue in queues:
+        await queue.stop()
+
+    sent = sorted(providers[0].sent + providers[1].sent)
+    assert sent == [(f"07{i:08d}", f"order {i}") for i in range(6)]
+
+@pytest.mark.asyncio
+async def test_stopping_leaves_a_shared_backlog_for_other_workers():
+    client = FakeRedis()
+    queue = SmsQueue(StubSmsProvider(), backend=RedisQueue(client, "sms"))
+    await queue.start()
+    await queue.stop()
+
+    await queue.enqueue("0700000000", "hello")
+
+    assert await RedisQueue(client, "sms").get_batch(10, 0, timeout=0.1) == [("0700000000", "hello")]
+
+@pytest.mark.asyncio
+async def test_outbox_sends_only_committed_messages(async_session_factory):
+    provider = StubSmsProvider()
+    queue = SmsQueue(provider, flush_interval=0, backend=OutboxQueue(async_session_factory, poll_interval=0.01))
+    async with async_session_factory() as db:
+        await queue.stage(db, [("0700000000", "rolled back")])
+        await db.rollback()
+        await queue.stage(db, [("0700000001", "committed")])
+        await db.commit()
+
+    await queue.start()
+    while await queue.pending():
+        await asyncio.sleep(0.01)
+    await queue.stop()
+
+    assert provider.sent == [("0700000001", "committed")]
+
+@pytest.mark.asyncio
+async def test_outbox_hands_out_a_dead_workers_batch_once_its_lease_lapses(async_session_factory):
+    await OutboxQueue(async_session_factory).put_many([("0700000000", "hello"), ("0700000001", "bye")])
+
+    # Claimed by a worker that dies before acknowledging
+    assert await OutboxQueue(async_session_factory, lease=0.2).get_batch(10, 0, timeout=0) == [
+        ("0700000000", "hello"), ("0700000001", "bye"),
+    ]
+    other = OutboxQueue(async_session_factory, poll_interval=0.01)
+    assert await other.get_batch(10, 0, timeout=0.05) == []
+
+    await asyncio.sleep(0.2)
+    batch = await other.get_batch(10, 0, timeout=0.05)
+    assert batch == [("0700000000", "hello"), ("0700000001", "bye")]
+    await other.ack(batch)
+    async with async_session_factory() as db:
+        assert await db.get(SmsOutbox, 1) is None
+    assert await other.size() == 0
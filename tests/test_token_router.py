@@ -0,0 +1,71 @@
+import asyncio
+
+import httpx
+import pytest
+from fastapi import FastAPI, HTTPException
+
+from app.routes.token_router import TokenRequest, get_token
+from app.utils.utils import ClientCredentialsCache
+
+
+class StubTokenServer:
+    """Auth0's /oauth/token endpoint, counting the tokens it issues"""
+
+    def __init__(self, expires_in=86400, delay=0.05):
+        self.issued = 0
+        self.app = FastAPI()
+
+        @self.app.post("/oauth/token")
+        async def issue(body: dict):
+            if body["client_secret"] != "secret":
+                raise HTTPException(status_code=401, detail="access_denied")
+            await asyncio.sleep(delay)
+            self.issued += 1
+            return {"access_token": f"token-{self.issued}", "token_type": "Bearer", "expires_in": expires_in}
+
+    def client(self) -> httpx.AsyncClient:
+        return httpx.AsyncClient(transport=httpx.ASGITransport(app=self.app))
+
+
+def token_request(**overrides) -> TokenRequest:
+    return TokenRequest(**{"client_id": "jobs", "client_secret": "secret", "audience": "orders-api", **overrides})
+
+
+async def test_burst_of_callers_triggers_one_fetch():
+    server = StubTokenServer()
+    cache = ClientCredentialsCache()
+    async with server.client() as client:
+        tokens = await asyncio.gather(*(get_token(token_request(), client, cache) for _ in range(20)))
+        again = await get_token(token_request(), client, cache)
+
+    assert server.issued == 1
+    assert {token["access_token"] for token in tokens + [again]} == {"token-1"}
+
+
+async def test_tokens_are_cached_per_scope_and_secret():
+    server = StubTokenServer()
+    cache = ClientCredentialsCache()
+    async with server.client() as client:
+        await get_token(token_request(), client, cache)
+        scoped = await get_token(token_request(scope="read:orders"), client, cache)
+        with pytest.raises(HTTPException) as error:
+            await get_token(token_request(client_secret="wrong"), client, cache)
+
+    assert scoped["access_token"] == "token-2"
+    assert error.value.status_code == 401
+    assert len(cache) == 2
+
+
+async def test_token_is_refreshed_shortly_before_it_expires():
+    now = [1000.0]
+    server = StubTokenServer(expires_in=3600)
+    cache = ClientCredentialsCache(refresh_margin=60, clock=lambda: now[0])
+    async with server.client() as client:
+        await get_token(token_request(), client, cache)
+        now[0] += 3000
+        cached = await get_token(token_request(), client, cache)
+        now[0] += 560
+        refreshed = await get_token(token_request(), client, cache)
+
+    assert cached == {"access_token": "token-1", "token_type": "Bearer", "expires_in": 600}
+    assert refreshed["access_token"] == "token-2"
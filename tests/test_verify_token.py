@@ -0,0 +1,129 @@
+import asyncio
+import time
+
+import jwt
+import pytest
+from cryptography.hazmat.primitives.asymmetric import rsa
+from fastapi.security import HTTPAuthorizationCredentials, SecurityScopes
+
+from app.config import get_settings
+from app.utils.utils import (JwksCache, TokenCache, UnauthorizedException,
+                             VerifyToken)
+
+PRIVATE_KEY = rsa.generate_private_key(public_exponent=65537, key_size=2048)
+
+
+class StubJwks:
+    """Counts fetches against an in-memory key set"""
+
+    def __init__(self, keys, delay=0.0):
+        self.keys = keys
+        self.delay = delay
+        self.calls = 0
+
+    def __call__(self):
+        self.calls += 1
+        time.sleep(self.delay)
+        return dict(self.keys)
+
+
+def make_token(kid="key-1", exp_in=3600, **claims):
+    settings = get_settings()
+    payload = {
+        "sub": "client@clients",
+        "aud": settings.auth0_api_audience,
+        "iss": settings.auth0_issuer,
+        "exp": int(time.time()) + exp_in,
+        **claims,
+    }
+    return jwt.encode(payload, PRIVATE_KEY, algorithm="RS256", headers={"kid": kid})
+
+def credentials(token):
+    return HTTPAuthorizationCredentials(scheme="Bearer", credentials=token)
+
+@pytest.fixture
+def jwks():
+    return StubJwks({"key-1": PRIVATE_KEY.public_key()})
+
+@pytest.fixture
+def verifier(jwks):
+    return VerifyToken(jwks_cache=JwksCache("https://stub/.well-known/jwks.json", fetch=jwks))
+
+@pytest.mark.asyncio
+async def test_verify_caches_decoded_tokens(verifier, jwks, monkeypatch):
+    token = make_token(scope="read:orders")
+
+    payload = await verifier.verify(SecurityScopes(["read:orders"]), credentials(token))
+
+    decode_calls = []
+    monkeypatch.setattr(jwt, "decode", lambda *args, **kwargs: decode_calls.append(args))
+    again = await verifier.verify(SecurityScopes(["read:orders"]), credentials(token))
+
+    assert again == payload
+    assert payload["sub"] == "client@clients"
+    assert decode_calls == []
+    assert jwks.calls == 1
+
+@pytest.mark.asyncio
+async def test_verify_checks_scopes_on_cached_tokens(verifier):
+    token = make_token(scope="read:orders")
+    await verifier.verify(SecurityScopes(), credentials(token))
+
+    with pytest.raises(UnauthorizedException):
+        await verifier.verify(SecurityScopes(["write:orders"]), credentials(token))
+
+@pytest.mark.asyncio
+async def test_verify_rejects_unknown_kid(verifier):
+    with pytest.raises(UnauthorizedException) as exc_info:
+        await verifier.verify(SecurityScopes(), credentials(make_token(kid="rotated")))
+
+    assert "Unable to find a signing key" in exc_info.value.detail
+
+@pytest.mark.asyncio
+async def test_unknown_kid_is_fetched_once_for_concurrent_requests(jwks):
+    jwks.delay = 0.05
+    cache = JwksCache("https://stub/.well-known/jwks.json", fetch=jwks)
+
+    keys = await asyncio.gather(*(cache.get_signing_key("key-1") for _ in range(20)))
+
+    assert jwks.calls == 1
+    assert all(key is keys[0] for key in keys)
+
+@pytest.mark.asyncio
+async def test_stale_keys_are_refreshed_in_background(jwks):
+    now = [0.0]
+    cache = JwksCache("https://stub/.well-known/jwks.json", refresh_interval=60, fetch=jwks, clock=lambda: now[0])
+    await cache.get_signing_key("key-1")
+
+    now[0] = 61.0
+    jwks.keys["key-2"] = PRIVATE_KEY.public_key()
+    await cache.get_signing_key("key-1")
+    await asyncio.sleep(0.05)
+
+    assert jwks.calls == 2
+    assert await cache.get_signing_key("key-2") is not None
+
+def test_token_cache_expires_entries_at_exp():
+    now = [1000.0]
+    cache = TokenCache(ttl=300, clock=lambda: now[0])
+
+    cache.set("short", {"exp": 1010})
+    cache.set("long", {"exp": 5000})
+
+    now[0] = 1011.0
+    assert cache.get("short") is None
+    assert cache.get("long") == {"exp": 5000}
+    now[0] = 1301.0
+    assert cache.get("long") is None
+
+def test_token_cache_evicts_least_recently_used():
+    cache = TokenCache(max_size=2)
+
+    cache.set("a", {})
+    cache.set("b", {})
+    cache.get("a")
+    cache.set("c", {})
+
+    assert len(cache) == 2
+    assert cache.get("b") is None
+    assert cache.get("a") == {}